@@ -0,0 +1,170 @@
+"""
+Async Pipeline - asyncio monitor mode with overlapped data fetch and LLM inference
+A producer fetches tick, candles and order book concurrently on a fixed
+cadence and keeps only the latest snapshot; a consumer runs the decision on
+the freshest snapshot while the producer is already fetching the next one.
+"""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from latency import LatencyHistogram
+
+# Threads for the blocking MT5 calls of one snapshot (tick, candles, book)
+FETCH_WORKERS = 3
+
+
+class AsyncMonitorPipeline:
+    """Fixed-cadence scans of the agent's trading_pair
+
+    The MetaTrader5 and Ollama clients are blocking, so every stage runs in
+    a thread pool; asyncio only orchestrates the overlap and the cadence.
+    A snapshot that is replaced before the consumer takes it is counted as
+    dropped (the LLM was slower than the scan interval).
+    """
+
+    def __init__(self, agent, market_cache_file=None):
+        self.agent = agent
+        self.market_cache_file = market_cache_file
+        self.snapshots = 0
+        self.dropped = 0
+        self.decisions = 0
+        self.missed_ticks = 0
+        self.fetch_latency = LatencyHistogram()
+        self.decision_latency = LatencyHistogram()
+        self.cadence_lag = LatencyHistogram()
+
+    def running(self):
+        return self.agent.running and self.agent.mode == "monitor"
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="pipeline-fetch")
+        self.decide_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-llm")
+        self.latest = None
+        self.ready = asyncio.Event()
+        producer = asyncio.create_task(self._produce())
+        try:
+            await self._consume()
+        finally:
+            producer.cancel()
+            self.fetch_pool.shutdown(wait=False)
+            self.decide_pool.shutdown(wait=False)
+
+    # ========== Producer ==========
+
+    async def _produce(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self.running():
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.cadence_lag.observe(max(loop.time() - next_tick, 0) * 1000)
+            try:
+                snapshot = await self._fetch()
+            except Exception as e:
+                self.agent.log(f"❌ 数据预取错误: {str(e)}")
+                snapshot = None
+            if snapshot is not None:
+                if self.latest is not None:
+                    self.dropped += 1
+                self.latest = snapshot
+                self.ready.set()
+            # Absolute schedule: ticks do not drift by the fetch time; missed ticks are skipped
+            interval = max(float(self.agent.monitoring_interval), 0.01)
+            next_tick += interval
+            now = loop.time()
+            if next_tick < now:
+                skipped = int((now - next_tick) / interval) + 1
+                self.missed_ticks += skipped
+                next_tick += skipped * interval
+
+    async def _fetch(self):
+        """Tick, candles and order book fetched concurrently"""
+        agent = self.agent
+        loop = asyncio.get_running_loop()
+        symbol = agent.trading_pair
+        config = agent.indicators_config
+        start = time.time()
+
+        def indicators():
+            if not config.get('enabled', True):
+                return None
+            return agent.get_mt5_candles_and_indicators(symbol, timeframe_minutes=config.get('timeframe', 1),
+                                                        count=config.get('candle_count', 200))
+
+        def level2():
+            if not config.get('level2_enabled', True):
+                return None
+            return agent.get_mt5_level2_data(symbol)
+
+        market_data, indicator_data, level2_data = await asyncio.gather(
+            loop.run_in_executor(self.fetch_pool, agent.search_market_data, symbol),
+            loop.run_in_executor(self.fetch_pool, indicators),
+            loop.run_in_executor(self.fetch_pool, level2))
+        self.fetch_latency.observe((time.time() - start) * 1000)
+        self.snapshots += 1
+        if self.market_cache_file:
+            await loop.run_in_executor(self.fetch_pool, self._save_cache, market_data)
+        return {'time': start, 'market_data': market_data, 'prefetched': (indicator_data, level2_data)}
+
+    def _save_cache(self, market_data):
+        with open(self.market_cache_file, 'w', encoding='utf-8') as f:
+            json.dump(market_data, f, indent=2, ensure_ascii=False)
+
+    # ========== Consumer ==========
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while self.running():
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            self.ready.clear()
+            snapshot, self.latest = self.latest, None
+            if snapshot is None:
+                continue
+            start = time.time()
+            try:
+                await loop.run_in_executor(self.decide_pool, self._decide, snapshot)
+            except Exception as e:
+                self.agent.log(f"❌ 流水线分析错误: {str(e)}")
+            self.decisions += 1
+            self.decision_latency.observe((time.time() - start) * 1000)
+
+    def _decide(self, snapshot):
+        agent = self.agent
+        agent._scan.signal_time = snapshot['time']
+        market_data = snapshot['market_data']
+        if not market_data or not market_data.get('price'):
+            agent.log("⚠️ 市场数据获取失败或价格无效")
+            return
+        response = agent.analyze_market(market_data, prefetched=snapshot['prefetched'])
+        if not self.running():
+            return
+        if not response:
+            agent.log("❌ 分析失败")
+            return
+        command = agent.parse_command(response)
+        if command:
+            agent.log(f"✅ AI分析完成 - 结果: {command} (数据延迟 {(time.time() - snapshot['time']) * 1000:.0f}ms)")
+            agent.dispatch_command(command)
+        else:
+            agent.log("⚠️ 未识别到有效交易指令")
+
+    def stats(self):
+        return {
+            'snapshots': self.snapshots,
+            'decisions': self.decisions,
+            'dropped_snapshots': self.dropped,
+            'missed_ticks': self.missed_ticks,
+            'fetch_latency': self.fetch_latency.as_dict(),
+            'decision_latency': self.decision_latency.as_dict(),
+            'cadence_lag': self.cadence_lag.as_dict(),
+        }
@@ -12,6 +12,24 @@ import requests
 from datetime import datetime
 from pathlib import Path
 
+from indicator_engine import IndicatorEngine, ResampledEngine
+from candle_store import CandleStore
+from symbol_registry import SymbolRegistry
+from order_book import OrderBooks
+from prompt_templates import PromptCompiler, PROMPT_MODES, COMPACT_TOKEN_BUDGET, estimate_tokens
+from prompt_ab import run_prompt_ab
+from backtest import Backtest, RuleDecider, LLMDecider, load_csv, fetch_history
+from decision_schema import (DECISION_SCHEMA, DECISION_NUM_PREDICT, DECISION_INSTRUCTION,
+                             DecisionError, DecisionStats, parse_decision, price_matches)
+from risk_engine import RiskEngine
+from decision_cache import DecisionCache, fingerprint, config_hash
+from ollama_client import OLLAMA_HOST, OLLAMA_MODEL, OLLAMA_KEEP_ALIVE, get_client
+from llm_store import LLMStore, LLM_STORE_MAX_MB, STORE_MODES
+from log_pipeline import LogPipeline, WEB_LOG_URL
+from command_channel import CommandSender
+from scheduler import ScanScheduler, parse_symbols, DATA_WORKERS, LLM_WORKERS
+from async_pipeline import AsyncMonitorPipeline
+
 # Try to import MT5 library
 try:
     import MetaTrader5 as mt5
@@ -20,9 +38,7 @@ except ImportError:
     MT5_AVAILABLE = False
     print("[WARNING] MetaTrader5 not installed. Install with: pip install MetaTrader5")
 
-# Configuration
-OLLAMA_HOST = "http://localhost:11434"
-OLLAMA_MODEL = "qwen2.5:3b-instruct-q4_K_M"
+# Configuration (Ollama host/model live in ollama_client)
 COMMANDS_FILE = "E:\\TradingSystem\\commands.txt"
 MARKET_DATA_CACHE = "E:\\TradingSystem\\market_cache.json"
 LOG_FILE = "E:\\TradingSystem\\autogpt.log"
@@ -38,7 +54,12 @@ MARKET_SOURCES = [
 ]
 
 class AutoGPTTrading:
-    def __init__(self):
+    def __init__(self, log_file=LOG_FILE, web_url=WEB_LOG_URL, commands_file=COMMANDS_FILE,
+                 candle_store=None, watch_flags=True):
+        """Defaults are the live install; benchmarks pass private paths, web_url=None
+        and watch_flags=False so they never touch the running system's files"""
+        self.log_file = log_file
+        self.log_pipeline = LogPipeline(log_file, web_url=web_url)  # Non-blocking file/web logging
         self.mode = "discussion"  # "discussion" or "monitor"
         self.strategy = ""
         self.trading_pair = ""
@@ -58,7 +79,36 @@ class AutoGPTTrading:
         self.short_strategy = ""
         self.rules = ""  # Must-follow rules
         self.timeframe = 1  # Timeframe for K-lines and indicators (in minutes)
+        self.confirm_timeframes = []  # Higher timeframes (minutes) resampled from the base bars
         self.max_positions = 1  # Maximum concurrent positions allowed
+        self.indicator_engines = {}  # (symbol, timeframe) -> IndicatorEngine
+        self.candle_store = candle_store or CandleStore()  # On-disk bar history, synced incrementally from MT5
+        self.higher_engines = {}  # (symbol, base timeframe, minutes) -> ResampledEngine
+        self.symbol_registry = SymbolRegistry(log=self.log)  # Resolved names + cached symbol_info
+        self.order_books = OrderBooks()  # Level 2 subscriptions and snapshot rings per symbol
+        self.level2_sentiment = {}  # symbol -> last logged Level 2 sentiment
+        self.prompt_compiler = PromptCompiler()  # Static prompt sections per config version
+        self.prompt_mode = "verbose"  # "verbose" or "compact" (dense key=value block for small models)
+        self.prompt_token_budget = COMPACT_TOKEN_BUDGET
+        self.decision_format = "text"  # "text" (free-form lines) or "json" (schema-constrained object)
+        self.decision_stats = DecisionStats()  # Parsed vs failed LLM decisions
+        self.risk_engine = RiskEngine(self)  # Tick-driven enforcement of parsed rules
+        self.gate_stats = {}  # Pre-LLM gate name -> times it forced 待机 (plus 'passed')
+        self.last_gate = None
+        self._scan = threading.local()  # Per-thread scan state, so symbols can be analyzed concurrently
+        self.decision_cache = DecisionCache()  # Quantized market state -> LLM direction
+        self.ollama = get_client()  # Pooled keep-alive session shared by all Ollama calls
+        self.llm_store = LLMStore(log=self.log)  # Recorded generations; replay serves them without the model
+        self.stream_decisions = True  # Stream analyze_market generations and stop at the first command line
+        self.command_channel = CommandSender(commands_file, on_done=self._on_command_done)  # Socket to executor, file fallback
+        self.symbols = []  # Optional basket: names or {symbol, interval, timeframe}; scanned by the scheduler
+        self.data_workers = DATA_WORKERS
+        self.llm_workers = LLM_WORKERS
+        self.scheduler = None
+        self.pipeline_mode = "sync"  # "sync" (work + sleep) or "async" (prefetch, fixed cadence)
+        self.pipeline = None
+        self._dispatch_lock = threading.Lock()
+        self._gate_lock = threading.Lock()  # gate_stats/last_gate: written by scan workers, read by stats
         
         # Indicator configuration
         self.indicators_config = {
@@ -78,7 +128,8 @@ class AutoGPTTrading:
                 'require_rsi_confirm': False,
                 'require_macd_confirm': False,
                 'rsi_oversold': 30,
-                'rsi_overbought': 70
+                'rsi_overbought': 70,
+                'require_signal': True  # 无技术信号时跳过LLM直接待机
             }
         }
         
@@ -86,8 +137,10 @@ class AutoGPTTrading:
         self.connect_mt5()
         
         # 启动后台标志检查线程
-        self.flag_check_thread = threading.Thread(target=self.check_flags_loop, daemon=True)
-        self.flag_check_thread.start()
+        self.flag_check_thread = None
+        if watch_flags:
+            self.flag_check_thread = threading.Thread(target=self.check_flags_loop, daemon=True)
+            self.flag_check_thread.start()
     
     def connect_mt5(self):
         """Connect to MT5 terminal"""
@@ -111,6 +164,8 @@ class AutoGPTTrading:
             
             self.log(f"MT5已连接 - 账户: {account_info.login}, 余额: {account_info.balance}")
             self.mt5_connected = True
+            self.symbol_registry.invalidate()
+            self.order_books.invalidate()
             return True
             
         except Exception as e:
@@ -150,29 +205,12 @@ class AutoGPTTrading:
             time.sleep(2)
     
     def get_mt5_symbol_info(self, symbol):
-        """Get symbol info from MT5"""
+        """Get symbol info from the registry (resolved once, refreshed after its TTL)"""
         if not self.mt5_connected:
             return None
         
         try:
-            # Try to get symbol info - first try full symbol name, then try without suffix
-            symbol_info = mt5.symbol_info(symbol)
-            if symbol_info is None:
-                # Try without USD suffix for forex
-                symbol_base = symbol.replace('USD', '')
-                symbol_info = mt5.symbol_info(symbol_base)
-            
-            if symbol_info is None:
-                self.log(f"MT5未找到品种: {symbol}")
-                return None
-            
-            # Select symbol if not visible
-            if not symbol_info.visible:
-                mt5.symbol_select(symbol, True)
-                symbol_info = mt5.symbol_info(symbol)
-            
-            return symbol_info
-            
+            return self.symbol_registry.get(symbol)
         except Exception as e:
             self.log(f"获取MT5品种信息错误: {str(e)}")
             return None
@@ -190,8 +228,8 @@ class AutoGPTTrading:
             if symbol_info is None:
                 return None
             
-            # Get current tick
-            tick = mt5.symbol_info_tick(symbol)
+            # Get current tick (under the terminal's name for the symbol)
+            tick = mt5.symbol_info_tick(symbol_info.name)
             if tick is None:
                 self.log(f"无法获取 {symbol} 的实时报价")
                 return None
@@ -229,42 +267,24 @@ class AutoGPTTrading:
             return None
         
         try:
-            # Subscribe to market book (depth)
-            # First check if we can get the data
             if not hasattr(mt5, 'market_book_get'):
-                self.log("当前MT5版本不支持market_book_get")
                 return None
             
-            # Try to get market depth
-            book = mt5.market_book_get(symbol)
+            # Market depth is keyed by the terminal's name, as quotes and rates are
+            symbol_info = self.get_mt5_symbol_info(symbol)
+            if symbol_info is None:
+                return None
             
-            if book is None or len(book) == 0:
+            # Subscribed once, then each scan writes into the symbol's snapshot ring
+            book = self.order_books.get(symbol_info.name)
+            if not book.update():
                 # Level 2 not available for this symbol
                 return None
             
-            # Parse the market book data
-            # MT5 returns a list of MarketBookEntry objects
-            bid_levels = []
-            ask_levels = []
-            
-            for entry in book:
-                # entry.type: 0 = bid, 1 = ask
-                # entry.price: price level
-                # entry.volume: volume at this level
-                if entry.type == 0:  # Bid
-                    bid_levels.append({
-                        "price": entry.price,
-                        "volume": entry.volume
-                    })
-                elif entry.type == 1:  # Ask
-                    ask_levels.append({
-                        "price": entry.price,
-                        "volume": entry.volume
-                    })
-            
-            # Calculate total volumes
-            total_bid_vol = sum(level['volume'] for level in bid_levels)
-            total_ask_vol = sum(level['volume'] for level in ask_levels)
+            features = book.features()
+            pressure = book.pressure()
+            total_bid_vol = features['total_bid_volume']
+            total_ask_vol = features['total_ask_volume']
             
             # Calculate volume imbalance
             if total_bid_vol + total_ask_vol > 0:
@@ -272,10 +292,6 @@ class AutoGPTTrading:
             else:
                 bid_ratio = 0.5
             
-            # Get best bid/ask
-            best_bid = bid_levels[0]['price'] if bid_levels else None
-            best_ask = ask_levels[0]['price'] if ask_levels else None
-            
             # Determine order book sentiment
             sentiment = "均衡"
             if bid_ratio > 0.6:
@@ -283,12 +299,15 @@ class AutoGPTTrading:
             elif bid_ratio < 0.4:
                 sentiment = "卖方占优(看跌)"
             
-            self.log(f"Level2行情: 买量={total_bid_vol}, 卖量={total_ask_vol}, 买方占比={bid_ratio:.1%}")
+            if self.level2_sentiment.get(symbol) != sentiment:
+                self.level2_sentiment[symbol] = sentiment
+                self.log(f"Level2行情: 买量={total_bid_vol}, 卖量={total_ask_vol}, 买方占比={bid_ratio:.1%}, {sentiment}")
             
+            best_bid, best_ask = features['best_bid'], features['best_ask']
             return {
                 "available": True,
-                "bid_levels": bid_levels[:10],  # Top 10 levels
-                "ask_levels": ask_levels[:10],
+                "bid_levels": book.levels('bid'),  # Top 5 (price, volume)
+                "ask_levels": book.levels('ask'),
                 "total_bid_volume": total_bid_vol,
                 "total_ask_volume": total_ask_vol,
                 "bid_ratio": bid_ratio,
@@ -296,7 +315,12 @@ class AutoGPTTrading:
                 "best_ask": best_ask,
                 "spread": (best_ask - best_bid) if (best_ask and best_bid) else None,
                 "sentiment": sentiment,
-                "level_count": len(book)
+                "level_count": features['level_count'],
+                # Depth analytics
+                "weighted_mid": features['weighted_mid'],
+                "microprice": features['microprice'],
+                "imbalance": features['imbalance'],
+                "pressure": pressure
             }
             
         except Exception as e:
@@ -338,6 +362,16 @@ class AutoGPTTrading:
                     self.short_tp_percent = config.get('short_tp_percent', 0)
                     self.short_strategy = config.get('short_strategy', '')
                     self.rules = config.get('rules', '')
+                    self.stream_decisions = config.get('stream_decisions', True)
+                    self.symbols = config.get('symbols', [])
+                    self.pipeline_mode = config.get('pipeline_mode', 'sync')
+                    self.data_workers = config.get('data_workers', DATA_WORKERS)
+                    self.llm_workers = config.get('llm_workers', LLM_WORKERS)
+                    self.prompt_mode = config.get('prompt_mode', 'verbose')
+                    self.prompt_token_budget = config.get('prompt_token_budget', COMPACT_TOKEN_BUDGET)
+                    self.decision_format = config.get('decision_format', 'text')
+                    self.llm_store.configure(config.get('llm_store_mode', 'record'),
+                                             config.get('llm_store_max_mb', LLM_STORE_MAX_MB))
                     
                     # If strategy is empty but long/short strategies exist, create combined strategy
                     if not self.strategy and (self.long_strategy or self.short_strategy):
@@ -367,7 +401,8 @@ class AutoGPTTrading:
                                 'require_rsi_confirm': False,
                                 'require_macd_confirm': False,
                                 'rsi_oversold': 30,
-                                'rsi_overbought': 70
+                                'rsi_overbought': 70,
+                                'require_signal': True  # 无技术信号时跳过LLM直接待机
                             }
                         }
                     else:
@@ -380,7 +415,16 @@ class AutoGPTTrading:
         # Load existing config to preserve indicator settings
         existing_indicators = getattr(self, 'indicators_config', None)
         
-        config = {
+        # Keep keys this class does not manage (e.g. written by the web UI)
+        config = {}
+        if os.path.exists(CONFIG_FILE):
+            try:
+                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except Exception:
+                config = {}
+        
+        config.update({
             'trading_pair': self.trading_pair,
             'lot_size': self.lot_size,
             'strategy': self.strategy,
@@ -393,6 +437,7 @@ class AutoGPTTrading:
             'short_tp_percent': self.short_tp_percent,
             'short_strategy': self.short_strategy,
             'rules': self.rules,
+            'stream_decisions': self.stream_decisions,
             'indicators': existing_indicators or {
                 'enabled': True,
                 'level2_enabled': True,
@@ -410,10 +455,11 @@ class AutoGPTTrading:
                     'require_rsi_confirm': False,
                     'require_macd_confirm': False,
                     'rsi_oversold': 30,
-                    'rsi_overbought': 70
+                    'rsi_overbought': 70,
+                    'require_signal': True  # 无技术信号时跳过LLM直接待机
                 }
             }
-        }
+        })
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(config, f, indent=2, ensure_ascii=False)
     
@@ -421,6 +467,22 @@ class AutoGPTTrading:
         """Parse all rules from rules text - supports both Chinese and English"""
         import re
         
+        # ========== Higher Timeframe Parsing ==========
+        # Chinese: 更高周期: 5分钟, 更高周期: 15分钟/1小时
+        # English: higher timeframe: 5m, higher timeframe 15min, 1h
+        # Removed from the text afterwards so it is not read as the base timeframe
+        higher_pattern = (r'(?:更高周期|higher timeframes?)[：:\s]*'
+                          r'((?:\d+\s*(?:分钟|小时|min(?:ute)?s?|hours?|m|h)?[\s,，、/和]*(?:and\s*)?)+)')
+        self.confirm_timeframes = []
+        for match in re.finditer(higher_pattern, rules_text, re.IGNORECASE):
+            for value, unit in re.findall(r'(\d+)\s*(小时|hours?|h)?', match.group(1), re.IGNORECASE):
+                minutes = int(value) * (60 if unit else 1)
+                if minutes not in self.confirm_timeframes:
+                    self.confirm_timeframes.append(minutes)
+        if self.confirm_timeframes:
+            self.log(f"✓ 从规则中解析确认周期: {', '.join(f'{m}分钟' for m in self.confirm_timeframes)}")
+        base_text = re.sub(higher_pattern, '', rules_text, flags=re.IGNORECASE)
+        
         # ========== Timeframe Parsing ==========
         # Chinese: 1分钟, 5分钟, 15分钟, 1分钟级别, K线都是5分钟
         # English: 1min, 5min, 15m, 1 minute, 5 minutes, timeframe 5
@@ -429,16 +491,14 @@ class AutoGPTTrading:
             r'(\d+)\s*分钟',
             r'(\d+)\s*分钟级别',
             r'K线都是(\d+)分钟',
-            r'更高周期[：:\s]*(\d+)\s*分钟',
             # English patterns
             r'(\d+)\s*min(?:ute)?s?',
             r'timeframe[：:\s]*(\d+)',
-            r'period[：:\s]*(\d+)',
-            r'higher timeframe[：:\s]*(\d+)'
+            r'period[：:\s]*(\d+)'
         ]
         
         for pattern in timeframe_patterns:
-            match = re.search(pattern, rules_text, re.IGNORECASE)
+            match = re.search(pattern, base_text, re.IGNORECASE)
             if match:
                 self.timeframe = int(match.group(1))
                 self.log(f"✓ 从规则中解析时间级别: {self.timeframe} 分钟")
@@ -689,28 +749,14 @@ class AutoGPTTrading:
         log_message = f"[{timestamp}] {message}"
         print(log_message)
         
-        # Write to log file
-        try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as f:
-                f.write(log_message + "\n")
-        except:
-            pass
-        
-        # Also send to web interface logs
-        try:
-            requests.post('http://localhost:5000/save_log', 
-                         json={'type': 'log', 'message': message},
-                         timeout=1)
-        except:
-            # Web interface might not be running or not accessible
-            # Silently ignore errors to avoid disrupting trading
-            pass
+        # File append and web UI shipping happen in the pipeline's worker thread
+        self.log_pipeline.emit(log_message, message)
     
     def _check_log_rotation(self):
         """Check if log rotation is needed and perform rotation if necessary"""
         import shutil
         
-        LOG_DIR = "E:\\TradingSystem\\logs"
+        LOG_DIR = os.path.join(os.path.dirname(self.log_file), "logs")
         MAX_LOG_SIZE = 10 * 1024 * 1024  # 10MB
         
         try:
@@ -719,12 +765,12 @@ class AutoGPTTrading:
                 os.makedirs(LOG_DIR)
             
             # Check if log file exists
-            if not os.path.exists(LOG_FILE):
+            if not os.path.exists(self.log_file):
                 return
             
             # Get log file size and modification time
-            log_size = os.path.getsize(LOG_FILE)
-            log_mtime = datetime.fromtimestamp(os.path.getmtime(LOG_FILE))
+            log_size = os.path.getsize(self.log_file)
+            log_mtime = datetime.fromtimestamp(os.path.getmtime(self.log_file))
             today = datetime.now().date()
             
             # Check if rotation is needed (size > 10MB or new day)
@@ -740,13 +786,13 @@ class AutoGPTTrading:
             if need_rotation:
                 # Generate timestamp for old log file
                 timestamp_str = log_mtime.strftime("%Y%m%d_%H%M%S")
-                log_filename = os.path.basename(LOG_FILE)
+                log_filename = os.path.basename(self.log_file)
                 old_log_name = f"{log_filename.replace('.log', '')}_{timestamp_str}.log"
                 old_log_path = os.path.join(LOG_DIR, old_log_name)
                 
                 # Move old log to logs directory
                 try:
-                    shutil.move(LOG_FILE, old_log_path)
+                    shutil.move(self.log_file, old_log_path)
                     self.log(f"旧日志已保存到: {old_log_path}")
                 except Exception as e:
                     self.log(f"移动日志文件失败: {str(e)}")
@@ -756,27 +802,119 @@ class AutoGPTTrading:
             
     def call_ollama(self, prompt, system_prompt=None):
         """Call Ollama API"""
-        url = f"{OLLAMA_HOST}/api/generate"
-        
         payload = {
             "model": OLLAMA_MODEL,
             "prompt": prompt,
-            "stream": False
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE
         }
         
         if system_prompt:
             payload["system"] = system_prompt
+        
+        served, text = self.llm_store.lookup(OLLAMA_MODEL, system_prompt, prompt)
+        if served:
+            return text
             
         try:
-            response = requests.post(url, json=payload, timeout=120)
+            start = time.perf_counter()
+            response = self.ollama.post('/api/generate', payload)
             if response.status_code == 200:
-                return response.json().get('response', '')
+                body = response.json()
+                self.ollama.observe_eval(body)
+                self.llm_store.record(OLLAMA_MODEL, system_prompt, prompt, body.get('response', ''),
+                                      (time.perf_counter() - start) * 1000, body)
+                return body.get('response', '')
             else:
                 self.log(f"Error calling Ollama: {response.status_code} - {response.text}")
                 return None
         except Exception as e:
             self.log(f"Exception calling Ollama: {str(e)}")
             return None
+    
+    def call_ollama_structured(self, prompt, system_prompt=None, schema=DECISION_SCHEMA,
+                               num_predict=DECISION_NUM_PREDICT):
+        """Non-streamed generation constrained to a JSON schema; returns the raw JSON text"""
+        payload = {
+            "model": OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "format": schema,
+            "options": {"num_predict": num_predict, "temperature": 0},
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        }
+        if system_prompt:
+            payload["system"] = system_prompt
+        
+        # The schema and generation cap change the answer, so they are part of the key
+        store_options = {"format": schema, "num_predict": num_predict}
+        served, text = self.llm_store.lookup(OLLAMA_MODEL, system_prompt, prompt, store_options)
+        if served:
+            return text
+        
+        try:
+            start = time.perf_counter()
+            response = self.ollama.post('/api/generate', payload)
+            if response.status_code == 200:
+                body = response.json()
+                self.ollama.observe_eval(body)
+                self.llm_store.record(OLLAMA_MODEL, system_prompt, prompt, body.get('response', ''),
+                                      (time.perf_counter() - start) * 1000, body, store_options)
+                if body.get('done_reason') == 'length':
+                    self.log(f"结构化决策被num_predict={num_predict}截断")
+                return body.get('response', '')
+            else:
+                self.log(f"Error calling Ollama: {response.status_code} - {response.text}")
+                return None
+        except Exception as e:
+            self.log(f"Exception calling Ollama: {str(e)}")
+            return None
+    
+    def call_ollama_until(self, prompt, system_prompt, parse_line):
+        """Stream an Ollama generation and cancel it at the first line parse_line accepts
+        
+        Returns (parsed, text): parsed is None if no line matched, text is the
+        output received so far or None if the call failed.
+        """
+        payload = {
+            "model": OLLAMA_MODEL,
+            "prompt": prompt,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+        }
+        if system_prompt:
+            payload["system"] = system_prompt
+        
+        served, text = self.llm_store.lookup(OLLAMA_MODEL, system_prompt, prompt)
+        if served:
+            if text is None:
+                return None, None
+            for line in text.split('\n'):
+                parsed = parse_line(line)
+                if parsed:
+                    return parsed, text
+            return None, text
+        
+        lines = []
+        start = time.perf_counter()
+        try:
+            stream = self.ollama.stream_lines('/api/generate', payload)
+            try:
+                for line in stream:
+                    lines.append(line)
+                    parsed = parse_line(line)
+                    if parsed:
+                        # Only the text up to the decision line exists; it replays the same decision
+                        self.llm_store.record(OLLAMA_MODEL, system_prompt, prompt, '\n'.join(lines),
+                                              (time.perf_counter() - start) * 1000, complete=False)
+                        return parsed, '\n'.join(lines)
+            finally:
+                stream.close()  # 关闭连接，Ollama停止生成
+        except Exception as e:
+            self.log(f"Exception streaming Ollama: {str(e)}")
+            return None, None
+        self.llm_store.record(OLLAMA_MODEL, system_prompt, prompt, '\n'.join(lines),
+                              (time.perf_counter() - start) * 1000)
+        return None, '\n'.join(lines)
             
     def search_market_data(self, symbol):
         """Search for market data - now uses MT5 as primary source"""
@@ -895,307 +1033,46 @@ class AutoGPTTrading:
             # MT5 timeframe: 1 minute = 1
             timeframe = timeframe_minutes
             
-            # Get historical candles (rates)
-            rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, count)
+            # Incremental indicator state for this symbol/timeframe - each scan
+            # only consumes the bars that closed since the previous scan
+            engine_key = (symbol, timeframe)
+            engine = self.indicator_engines.get(engine_key)
+            if engine is None or engine.history != count:
+                engine = IndicatorEngine(history=count)
+                self.indicator_engines[engine_key] = engine
             
-            if rates is None or len(rates) == 0:
+            if not self._sync_indicator_engine(engine, symbol, timeframe, count, symbol_info.name):
                 self.log(f"无法获取 {symbol} 的历史K线数据")
                 return None
             
-            # Extract OHLC data
-            opens = [r[1] for r in rates]
-            highs = [r[2] for r in rates]
-            lows = [r[3] for r in rates]
-            closes = [r[4] for r in rates]
-            
-            # ========== Indicator Calculation Functions ==========
-            
-            # Simple Moving Average (SMA)
-            def calculate_sma(prices, period):
-                if len(prices) < period:
-                    return None
-                return sum(prices[-period:]) / period
-            
-            # Exponential Moving Average (EMA)
-            def calculate_ema(prices, period):
-                if len(prices) < period:
-                    return None
-                ema = prices[0]
-                multiplier = 2 / (period + 1)
-                for price in prices[1:]:
-                    ema = (price - ema) * multiplier + ema
-                return ema
-            
-            # Relative Strength Index (RSI)
-            def calculate_rsi(prices, period=14):
-                if len(prices) < period + 1:
-                    return None
-                deltas = [prices[i] - prices[i-1] for i in range(1, len(prices))]
-                gains = [d if d > 0 else 0 for d in deltas]
-                losses = [-d if d < 0 else 0 for d in deltas]
-                avg_gain = sum(gains[-period:]) / period
-                avg_loss = sum(losses[-period:]) / period
-                if avg_loss == 0:
-                    return 100
-                rs = avg_gain / avg_loss
-                rsi = 100 - (100 / (1 + rs))
-                return rsi
-            
-            # MACD (Moving Average Convergence Divergence)
-            def calculate_macd(prices, fast=12, slow=26, signal=9):
-                ema_fast = calculate_ema(prices, fast)
-                ema_slow = calculate_ema(prices, slow)
-                if ema_fast is None or ema_slow is None:
-                    return None, None, None
-                macd_line = ema_fast - ema_slow
-                # Signal line would need more complex calculation, simplifying here
-                return macd_line, ema_fast, ema_slow
-            
-            # Bollinger Bands
-            def calculate_bollinger(prices, period=20, std_dev=2):
-                sma = calculate_sma(prices, period)
-                if sma is None:
-                    return None, None, None
-                std = (sum((p - sma) ** 2 for p in prices[-period:]) / period) ** 0.5
-                upper = sma + std_dev * std
-                lower = sma - std_dev * std
-                return upper, sma, lower
-            
-            # Average True Range (ATR)
-            def calculate_atr(period=14):
-                if len(rates) < period + 1:
-                    return None
-                trs = []
-                for i in range(1, len(rates)):
-                    tr = max(
-                        rates[i][2] - rates[i][3],  # High - Low
-                        abs(rates[i][2] - rates[i-1][4]),  # High - Previous Close
-                        abs(rates[i][3] - rates[i-1][4])   # Low - Previous Close
-                    )
-                    trs.append(tr)
-                return sum(trs[-period:]) / period
-            
-            # ========== Get Selected Indicators from Config ==========
-            
-            # Get indicator selection from config
-            selected = self.indicators_config.get('selected_indicators', {}) if hasattr(self, 'indicators_config') else {}
-            
-            # ========== Calculate Only Selected Indicators ==========
-            
-            # Moving Averages (calculate if enabled in config)
-            ma5 = calculate_sma(closes, 5) if selected.get('ma5', True) else None
-            ma10 = calculate_sma(closes, 10) if selected.get('ma10', True) else None
-            ma20 = calculate_sma(closes, 20) if selected.get('ma20', True) else None
-            ma50 = calculate_sma(closes, 50) if selected.get('ma50', True) else None
-            ma200 = calculate_sma(closes, 200) if selected.get('ma200', False) else None
-            
-            # Exponential Moving Averages (calculate if enabled in config)
-            ema12 = calculate_ema(closes, 12) if selected.get('ema12', False) else None
-            ema26 = calculate_ema(closes, 26) if selected.get('ema26', False) else None
-            
-            # RSI (calculate if enabled in config)
-            rsi = calculate_rsi(closes, 14) if selected.get('rsi', True) else None
-            
-            # MACD (calculate if enabled in config)
-            macd_line, macd_fast, macd_slow = (calculate_macd(closes) if selected.get('macd', True) else (None, None, None))
-            
-            # Bollinger Bands (calculate if enabled in config)
-            bb_upper, bb_middle, bb_lower = (calculate_bollinger(closes) if selected.get('bollinger', True) else (None, None, None))
-            
-            # ATR (calculate if enabled in config)
-            atr = calculate_atr(14) if selected.get('atr', False) else None
-            
-            # Previous values for signal detection
-            ma10_prev = calculate_sma(closes[:-1], 10) if len(closes) > 10 else None
-            ma50_prev = calculate_sma(closes[:-1], 50) if len(closes) > 50 else None
-            rsi_prev = calculate_rsi(closes[:-1], 14) if len(closes) > 15 else None
-            
-            # ========== Signal Detection ==========
-            
-            signals = []
-            
-            # Create dictionary of MA values for easy access
-            ma_dict = {
-                'ma5': ma5, 'ma10': ma10, 'ma20': ma20, 'ma50': ma50, 'ma200': ma200,
-                'ema12': ema12, 'ema26': ema26
-            }
-            
-            # MA Crossover Signals (general for all selected MAs)
-            # Check all possible MA pairs
-            ma_pairs = [
-                ('ma5', 'ma10'), ('ma5', 'ma20'), ('ma5', 'ma50'), ('ma5', 'ma200'),
-                ('ma10', 'ma20'), ('ma10', 'ma50'), ('ma10', 'ma200'),
-                ('ma20', 'ma50'), ('ma20', 'ma200'),
-                ('ma50', 'ma200'),
-                ('ema12', 'ema26')
-            ]
-            for fast_key, slow_key in ma_pairs:
-                fast = ma_dict.get(fast_key)
-                slow = ma_dict.get(slow_key)
-                if fast is None or slow is None:
-                    continue
-                # Calculate previous values
-                fast_period = int(fast_key[2:]) if fast_key.startswith('ma') else 12 if fast_key == 'ema12' else 26
-                slow_period = int(slow_key[2:]) if slow_key.startswith('ma') else 12 if slow_key == 'ema12' else 26
-                fast_prev = calculate_sma(closes[:-1], fast_period) if fast_key.startswith('ma') else calculate_ema(closes[:-1], fast_period)
-                slow_prev = calculate_sma(closes[:-1], slow_period) if slow_key.startswith('ma') else calculate_ema(closes[:-1], slow_period)
-                if fast_prev is None or slow_prev is None:
-                    continue
-                if fast_prev <= slow_prev and fast > slow:
-                    signals.append(f"{fast_key.upper()}金叉{slow_key.upper()} - 做多")
-                elif fast_prev >= slow_prev and fast < slow:
-                    signals.append(f"{fast_key.upper()}死叉{slow_key.upper()} - 做空")
-            
-            # RSI Signals (only if RSI was calculated)
-            if rsi is not None:
-                if rsi < 30:
-                    signals.append(f"RSI超卖({rsi:.1f}) - 可能反转做多")
-                elif rsi > 70:
-                    signals.append(f"RSI超买({rsi:.1f}) - 可能反转做空")
-                if rsi_prev is not None:
-                    if rsi_prev < 30 and rsi >= 30:
-                        signals.append("RSI从超卖区域回升 - 做多信号")
-                    elif rsi_prev > 70 and rsi <= 70:
-                        signals.append("RSI从超买区域回落 - 做空信号")
-            
-            # MACD Signals (only if MACD was calculated)
-            if macd_line is not None and macd_fast is not None and macd_slow is not None:
-                if macd_fast > macd_slow:
-                    signals.append("MACD多头排列(EMA12>EMA26) - 做多")
-                else:
-                    signals.append("MACD空头排列(EMA12<EMA26) - 做空")
-            
-            # Bollinger Bands Signals (only if BB was calculated)
-            current_price = closes[-1] if closes else None
-            if bb_upper is not None and bb_lower is not None and current_price is not None:
-                if current_price < bb_lower:
-                    signals.append(f"价格触及下轨({bb_lower:.5f}) - 超卖可能反弹")
-                elif current_price > bb_upper:
-                    signals.append(f"价格触及上轨({bb_upper:.5f}) - 超买可能回落")
-            
-            # ========== Technical Signals Calculation (User Defined) ==========
-            
-            technical_signals = []
-            
-            # 1. 金叉/死叉 (already covered in MA crossover above)
-            
-            # 2. 顶背离/底背离 (Divergence)
-            # For simplicity, we'll implement basic divergence detection
-            if len(closes) >= 30 and rsi is not None:
-                # Look at last 20 periods
-                lookback = 20
-                recent_closes = closes[-lookback:]
-                recent_highs = highs[-lookback:]
-                recent_lows = lows[-lookback:]
-                # Find highest high and lowest low
-                price_high = max(recent_highs)
-                price_low = min(recent_lows)
-                # Get RSI values for same period (current RSI is for entire series)
-                # We need RSI for each period; simplified: use current RSI vs previous RSI
-                # For proper divergence we need historical RSI values - skip for now
-                pass
-            
-            # 3. 突破 (Breakout)
-            if len(closes) >= 21:
-                recent_20_closes = closes[-21:-1]  # previous 20 closes (excluding current)
-                recent_20_high = max(recent_20_closes)
-                recent_20_low = min(recent_20_closes)
-                current_close = closes[-1]
-                current_open = opens[-1]
-                # 向上突破: 当前K线收盘价突破近期20根K线最高收盘价，且为阳线
-                if current_close > recent_20_high and current_close > current_open:
-                    technical_signals.append(f"向上突破: 收盘{current_close:.5f} > 近期最高{recent_20_high:.5f} 阳线")
-                # 向下突破: 当前K线收盘价跌破近期20根K线最低收盘价，且为阴线
-                if current_close < recent_20_low and current_close < current_open:
-                    technical_signals.append(f"向下突破: 收盘{current_close:.5f} < 近期最低{recent_20_low:.5f} 阴线")
-            
-            # 4. 回踩确认 (Pullback confirmation)
-            # Simplified: check if price is near recent high/low after a breakout
-            if len(closes) >= 30:
-                # Look back 25 periods for potential breakout level
-                lookback = 25
-                recent_closes = closes[-lookback:]
-                recent_high = max(recent_closes[:-5])  # high before last 5 periods
-                recent_low = min(recent_closes[:-5])
-                current_close = closes[-1]
-                # Define "near" as within 0.5% (adjustable)
-                threshold = 0.005  # 0.5%
-                # Check for upward breakout pullback
-                if current_close > recent_high * (1 - threshold) and current_close > recent_high:
-                    technical_signals.append(f"向上突破后回踩确认: 收盘{current_close:.5f} 仍高于突破位{recent_high:.5f}")
-                # Check for downward breakout pullback
-                if current_close < recent_low * (1 + threshold) and current_close < recent_low:
-                    technical_signals.append(f"向下突破后回踩确认: 收盘{current_close:.5f} 仍低于突破位{recent_low:.5f}")
-            
-            # Add technical signals to main signals list
-            signals.extend(technical_signals)
-            
-            # Recent candles for context
-            recent_candles = []
-            for i in range(-5, 0):
-                if abs(i) <= len(rates):
-                    r = rates[i]
-                    recent_candles.append({
-                        "time": datetime.fromtimestamp(r[0]).strftime("%H:%M"),
-                        "open": r[1],
-                        "high": r[2],
-                        "low": r[3],
-                        "close": r[4]
-                    })
+            # Current values include the forming bar, previous values are the
+            # committed state of the closed bars (equivalent to closes[:-1])
+            values, prev_values = engine.snapshot()
+            higher_timeframes = self._higher_timeframe_indicators(symbol, timeframe, count)
+            result = self.build_indicators(values, prev_values, engine.window(), timeframe_minutes,
+                                           engine.bar_count, higher_timeframes)
             
             # Log all indicators (with proper formatting)
             # Build log string - only show calculated indicators
             log_parts = []
-            if ma10 is not None: log_parts.append(f"MA10={ma10:.5f}")
-            if ma20 is not None: log_parts.append(f"MA20={ma20:.5f}")
-            if ma50 is not None: log_parts.append(f"MA50={ma50:.5f}")
-            if ma200 is not None: log_parts.append(f"MA200={ma200:.5f}")
-            if rsi is not None: log_parts.append(f"RSI={rsi:.1f}")
-            if macd_line is not None: log_parts.append(f"MACD={macd_line:.5f}")
-            if bb_upper is not None: log_parts.append(f"BB上={bb_upper:.1f}")
-            if bb_lower is not None: log_parts.append(f"BB下={bb_lower:.1f}")
-            if atr is not None: log_parts.append(f"ATR={atr:.2f}")
+            if result['ma10'] is not None: log_parts.append(f"MA10={result['ma10']:.5f}")
+            if result['ma20'] is not None: log_parts.append(f"MA20={result['ma20']:.5f}")
+            if result['ma50'] is not None: log_parts.append(f"MA50={result['ma50']:.5f}")
+            if result['ma200'] is not None: log_parts.append(f"MA200={result['ma200']:.5f}")
+            if result['rsi'] is not None: log_parts.append(f"RSI={result['rsi']:.1f}")
+            if result['macd'] is not None: log_parts.append(f"MACD={result['macd']:.5f}")
+            if result['bb_upper'] is not None: log_parts.append(f"BB上={result['bb_upper']:.1f}")
+            if result['bb_lower'] is not None: log_parts.append(f"BB下={result['bb_lower']:.1f}")
+            if result['atr'] is not None: log_parts.append(f"ATR={result['atr']:.2f}")
             
             indicator_summary = "指标: " + ", ".join(log_parts) if log_parts else "指标: 无"
             self.log(indicator_summary)
-            if signals:
-                self.log(f"信号: {' | '.join(signals)}")
+            if result['signals']:
+                self.log(f"信号: {' | '.join(result['signals'])}")
+            if higher_timeframes:
+                self.log("确认周期: " + ", ".join(f"{h['timeframe']} {h['trend']}" for h in higher_timeframes))
             
-            return {
-                # Moving Averages
-                "ma5": ma5,
-                "ma10": ma10,
-                "ma20": ma20,
-                "ma50": ma50,
-                "ma200": ma200,
-                # EMAs
-                "ema12": ema12,
-                "ema26": ema26,
-                # RSI
-                "rsi": rsi,
-                "rsi_prev": rsi_prev,
-                # MACD
-                "macd": macd_line,
-                "macd_fast": macd_fast,
-                "macd_slow": macd_slow,
-                # Bollinger Bands
-                "bb_upper": bb_upper,
-                "bb_middle": bb_middle,
-                "bb_lower": bb_lower,
-                # ATR
-                "atr": atr,
-                # MA signals
-                "ma10_prev": ma10_prev,
-                "ma50_prev": ma50_prev,
-                # Signals
-                "signals": signals,
-                "signal_summary": " | ".join(signals) if signals else "无明确信号",
-                # Context
-                "recent_candles": recent_candles,
-                "close_price": closes[-1] if closes else None,
-                "timeframe": f"{timeframe_minutes}分钟",
-                "candle_count": len(rates)
-            }
+            return result
             
         except Exception as e:
             self.log(f"获取K线指标错误: {str(e)}")
@@ -1203,6 +1080,291 @@ class AutoGPTTrading:
             self.log(traceback.format_exc())
             return None
     
+    def build_indicators(self, values, prev_values, bars, timeframe_minutes, bar_count, higher_timeframes=None):
+        """Selected indicators and signals from engine values (shared with the backtester)
+        
+        values include the forming bar, prev_values are the closed-bar values
+        and bars are (time, open, high, low, close) tuples ending with the
+        forming bar.
+        """
+        # Recent bars (closed bars + forming bar) for window-based signals
+        opens = [b[1] for b in bars]
+        highs = [b[2] for b in bars]
+        lows = [b[3] for b in bars]
+        closes = [b[4] for b in bars]
+        
+        # ========== Get Selected Indicators from Config ==========
+        
+        # Get indicator selection from config
+        selected = self.indicators_config.get('selected_indicators', {}) if hasattr(self, 'indicators_config') else {}
+        
+        # ========== Pick Only Selected Indicators ==========
+        
+        # Moving Averages (use if enabled in config)
+        ma5 = values['ma5'] if selected.get('ma5', True) else None
+        ma10 = values['ma10'] if selected.get('ma10', True) else None
+        ma20 = values['ma20'] if selected.get('ma20', True) else None
+        ma50 = values['ma50'] if selected.get('ma50', True) else None
+        ma200 = values['ma200'] if selected.get('ma200', False) else None
+        
+        # Exponential Moving Averages (use if enabled in config)
+        ema12 = values['ema12'] if selected.get('ema12', False) else None
+        ema26 = values['ema26'] if selected.get('ema26', False) else None
+        
+        # RSI (use if enabled in config)
+        rsi = values['rsi'] if selected.get('rsi', True) else None
+        
+        # MACD (use if enabled in config)
+        macd_line, macd_fast, macd_slow = None, None, None
+        if selected.get('macd', True) and values['ema12'] is not None and values['ema26'] is not None:
+            macd_fast, macd_slow = values['ema12'], values['ema26']
+            macd_line = macd_fast - macd_slow
+        
+        # Bollinger Bands (use if enabled in config)
+        if selected.get('bollinger', True):
+            bb_upper, bb_middle, bb_lower = values['bb_upper'], values['bb_middle'], values['bb_lower']
+        else:
+            bb_upper, bb_middle, bb_lower = None, None, None
+        
+        # ATR (use if enabled in config)
+        atr = values['atr'] if selected.get('atr', False) else None
+        
+        # Previous values for signal detection
+        ma10_prev = prev_values['ma10']
+        ma50_prev = prev_values['ma50']
+        rsi_prev = prev_values['rsi']
+        
+        # ========== Signal Detection ==========
+        
+        signals = []
+        
+        # Create dictionary of MA values for easy access
+        ma_dict = {
+            'ma5': ma5, 'ma10': ma10, 'ma20': ma20, 'ma50': ma50, 'ma200': ma200,
+            'ema12': ema12, 'ema26': ema26
+        }
+        
+        # MA Crossover Signals (general for all selected MAs)
+        # Check all possible MA pairs
+        ma_pairs = [
+            ('ma5', 'ma10'), ('ma5', 'ma20'), ('ma5', 'ma50'), ('ma5', 'ma200'),
+            ('ma10', 'ma20'), ('ma10', 'ma50'), ('ma10', 'ma200'),
+            ('ma20', 'ma50'), ('ma20', 'ma200'),
+            ('ma50', 'ma200'),
+            ('ema12', 'ema26')
+        ]
+        for fast_key, slow_key in ma_pairs:
+            fast = ma_dict.get(fast_key)
+            slow = ma_dict.get(slow_key)
+            if fast is None or slow is None:
+                continue
+            # Previous values come straight from the committed engine state
+            fast_prev = prev_values.get(fast_key)
+            slow_prev = prev_values.get(slow_key)
+            if fast_prev is None or slow_prev is None:
+                continue
+            if fast_prev <= slow_prev and fast > slow:
+                signals.append(f"{fast_key.upper()}金叉{slow_key.upper()} - 做多")
+            elif fast_prev >= slow_prev and fast < slow:
+                signals.append(f"{fast_key.upper()}死叉{slow_key.upper()} - 做空")
+        
+        # RSI Signals (only if RSI was calculated)
+        if rsi is not None:
+            if rsi < 30:
+                signals.append(f"RSI超卖({rsi:.1f}) - 可能反转做多")
+            elif rsi > 70:
+                signals.append(f"RSI超买({rsi:.1f}) - 可能反转做空")
+            if rsi_prev is not None:
+                if rsi_prev < 30 and rsi >= 30:
+                    signals.append("RSI从超卖区域回升 - 做多信号")
+                elif rsi_prev > 70 and rsi <= 70:
+                    signals.append("RSI从超买区域回落 - 做空信号")
+        
+        # MACD Signals (only if MACD was calculated)
+        if macd_line is not None and macd_fast is not None and macd_slow is not None:
+            if macd_fast > macd_slow:
+                signals.append("MACD多头排列(EMA12>EMA26) - 做多")
+            else:
+                signals.append("MACD空头排列(EMA12<EMA26) - 做空")
+        
+        # Bollinger Bands Signals (only if BB was calculated)
+        current_price = closes[-1] if closes else None
+        if bb_upper is not None and bb_lower is not None and current_price is not None:
+            if current_price < bb_lower:
+                signals.append(f"价格触及下轨({bb_lower:.5f}) - 超卖可能反弹")
+            elif current_price > bb_upper:
+                signals.append(f"价格触及上轨({bb_upper:.5f}) - 超买可能回落")
+        
+        # ========== Technical Signals Calculation (User Defined) ==========
+        
+        technical_signals = []
+        
+        # 1. 金叉/死叉 (already covered in MA crossover above)
+        
+        # 2. 顶背离/底背离 (Divergence)
+        # For simplicity, we'll implement basic divergence detection
+        if len(closes) >= 30 and rsi is not None:
+            # Look at last 20 periods
+            lookback = 20
+            recent_closes = closes[-lookback:]
+            recent_highs = highs[-lookback:]
+            recent_lows = lows[-lookback:]
+            # Find highest high and lowest low
+            price_high = max(recent_highs)
+            price_low = min(recent_lows)
+            # Get RSI values for same period (current RSI is for entire series)
+            # We need RSI for each period; simplified: use current RSI vs previous RSI
+            # For proper divergence we need historical RSI values - skip for now
+            pass
+        
+        # 3. 突破 (Breakout)
+        if len(closes) >= 21:
+            recent_20_closes = closes[-21:-1]  # previous 20 closes (excluding current)
+            recent_20_high = max(recent_20_closes)
+            recent_20_low = min(recent_20_closes)
+            current_close = closes[-1]
+            current_open = opens[-1]
+            # 向上突破: 当前K线收盘价突破近期20根K线最高收盘价，且为阳线
+            if current_close > recent_20_high and current_close > current_open:
+                technical_signals.append(f"向上突破: 收盘{current_close:.5f} > 近期最高{recent_20_high:.5f} 阳线")
+            # 向下突破: 当前K线收盘价跌破近期20根K线最低收盘价，且为阴线
+            if current_close < recent_20_low and current_close < current_open:
+                technical_signals.append(f"向下突破: 收盘{current_close:.5f} < 近期最低{recent_20_low:.5f} 阴线")
+        
+        # 4. 回踩确认 (Pullback confirmation)
+        # Simplified: check if price is near recent high/low after a breakout
+        if len(closes) >= 30:
+            # Look back 25 periods for potential breakout level
+            lookback = 25
+            recent_closes = closes[-lookback:]
+            recent_high = max(recent_closes[:-5])  # high before last 5 periods
+            recent_low = min(recent_closes[:-5])
+            current_close = closes[-1]
+            # Define "near" as within 0.5% (adjustable)
+            threshold = 0.005  # 0.5%
+            # Check for upward breakout pullback
+            if current_close > recent_high * (1 - threshold) and current_close > recent_high:
+                technical_signals.append(f"向上突破后回踩确认: 收盘{current_close:.5f} 仍高于突破位{recent_high:.5f}")
+            # Check for downward breakout pullback
+            if current_close < recent_low * (1 + threshold) and current_close < recent_low:
+                technical_signals.append(f"向下突破后回踩确认: 收盘{current_close:.5f} 仍低于突破位{recent_low:.5f}")
+        
+        # Add technical signals to main signals list
+        signals.extend(technical_signals)
+        
+        # Recent candles for context
+        recent_candles = []
+        for i in range(-5, 0):
+            if abs(i) <= len(bars):
+                r = bars[i]
+                recent_candles.append({
+                    "time": datetime.fromtimestamp(r[0]).strftime("%H:%M"),
+                    "open": r[1],
+                    "high": r[2],
+                    "low": r[3],
+                    "close": r[4]
+                })
+        
+        return {
+            # Moving Averages
+            "ma5": ma5,
+            "ma10": ma10,
+            "ma20": ma20,
+            "ma50": ma50,
+            "ma200": ma200,
+            # EMAs
+            "ema12": ema12,
+            "ema26": ema26,
+            # RSI
+            "rsi": rsi,
+            "rsi_prev": rsi_prev,
+            # MACD
+            "macd": macd_line,
+            "macd_fast": macd_fast,
+            "macd_slow": macd_slow,
+            # Bollinger Bands
+            "bb_upper": bb_upper,
+            "bb_middle": bb_middle,
+            "bb_lower": bb_lower,
+            # ATR
+            "atr": atr,
+            # MA signals
+            "ma10_prev": ma10_prev,
+            "ma50_prev": ma50_prev,
+            # Signals
+            "signals": signals,
+            "signal_summary": " | ".join(signals) if signals else "无明确信号",
+            # Context
+            "recent_candles": recent_candles,
+            "close_price": closes[-1] if closes else None,
+            "timeframe": f"{timeframe_minutes}分钟",
+            "candle_count": bar_count,
+            # Confirmation timeframes resampled from the same bars
+            "higher_timeframes": higher_timeframes
+        }
+    
+    def _sync_indicator_engine(self, engine, symbol, timeframe, count, terminal_name=None):
+        """Sync the candle store and feed newly closed bars into the engine
+
+        The store is keyed by the configured symbol; bars are requested under
+        terminal_name, the registry-resolved name the terminal lists.
+        """
+        series = self.candle_store.series(symbol, timeframe)
+        if not series.sync(mt5, terminal_name or symbol, timeframe, count):
+            return False
+        
+        if engine.last_closed_time is not None and engine.update(series.since(engine.last_closed_time)):
+            return True
+        
+        # First scan or the engine fell behind: re-seed from local history
+        engine.seed(series.window(count))
+        return True
+    
+    def _higher_timeframe_indicators(self, symbol, timeframe, count):
+        """Indicators of the confirmation timeframes, resampled from the local base bars"""
+        results = []
+        series = self.candle_store.series(symbol, timeframe)
+        for minutes in self.confirm_timeframes:
+            if minutes <= timeframe or minutes % timeframe:
+                continue
+            key = (symbol, timeframe, minutes)
+            higher = self.higher_engines.get(key)
+            if higher is None or higher.engine.history != count:
+                higher = ResampledEngine(minutes, base_minutes=timeframe, history=count)
+                self.higher_engines[key] = higher
+            if not higher.sync(series):
+                continue
+            results.append(self.higher_timeframe_entry(minutes, higher.engine))
+        return results
+    
+    def higher_timeframe_entry(self, minutes, engine):
+        """Trend and key values of one confirmation timeframe's engine"""
+        values, _ = engine.snapshot()
+        close = engine.forming_bar[4]
+        ma20, ma50 = values['ma20'], values['ma50']
+        if ma20 is None:
+            trend = "数据不足"
+        elif close > ma20 and (ma50 is None or ma20 > ma50):
+            trend = "上涨"
+        elif close < ma20 and (ma50 is None or ma20 < ma50):
+            trend = "下跌"
+        else:
+            trend = "震荡"
+        return {
+            "timeframe": f"{minutes}分钟",
+            "close_price": close,
+            "ma20": ma20,
+            "ma50": ma50,
+            "ema12": values['ema12'],
+            "ema26": values['ema26'],
+            "rsi": values['rsi'],
+            "bb_upper": values['bb_upper'],
+            "bb_lower": values['bb_lower'],
+            "atr": values['atr'],
+            "trend": trend,
+            "candle_count": engine.bar_count
+        }
+    
     def get_mock_market_data(self, symbol):
         """Get market data - in production, this should fetch from actual sources"""
         # This is mock data for testing
@@ -1218,27 +1380,104 @@ class AutoGPTTrading:
             "trend": "bullish"
         }
         
-    def analyze_market(self, market_data):
+    def _pre_llm_gate(self, market_data):
+        """Hard filters checked before any indicator work - returns (gate, reason) or None"""
+        # 点差限制
+        spread = market_data.get('spread') if market_data else None
+        if isinstance(spread, (int, float)):
+            reason = self.risk_engine.spread_block(spread)
+            if reason:
+                return 'spread_limit', reason
+        
+        # 交易时段
+        reason = self.risk_engine.session_block()
+        if reason:
+            return 'trading_session', reason
+        
+        # 风控熔断（回撤/每日亏损）
+        if self.risk_engine.halt_reason:
+            return 'risk_halt', self.risk_engine.halt_reason
+        
+        # 最大持仓数
+        self._scan.position_count = 0
+        if self.mt5_connected:
+            position_count = len(self.get_mt5_positions())
+            self._scan.position_count = position_count
+            if position_count >= self.max_positions:
+                return 'max_positions', f"持仓数已达上限: {position_count}/{self.max_positions} 单"
+        
+        return None
+    
+    def _signal_gate(self, indicators):
+        """Force 待机 when indicators were computed but no signal fired"""
+        signal_rules = self.indicators_config.get('signal_rules', {})
+        if not signal_rules.get('require_signal', True) or not indicators:
+            return None
+        if not indicators.get('signals'):
+            return 'no_signal', "无技术信号"
+        return None
+    
+    def _gate_standby(self, gate, reason):
+        """Record which gate fired and short-circuit to 待机"""
+        self._record_gate(gate)
+        self.log(f"⛔ 预过滤[{gate}]: {reason} → 待机（跳过LLM）")
+        return "待机"
+    
+    def _record_gate(self, gate):
+        """Count a gate outcome; gate None means every gate passed"""
+        with self._gate_lock:
+            self.last_gate = gate
+            key = gate or 'passed'
+            self.gate_stats[key] = self.gate_stats.get(key, 0) + 1
+    
+    def analyze_market(self, market_data, timeframe=None, prefetched=None):
         """Analyze market data and generate trading signals using configured strategies and percentages"""
+        analysis = self.prepare_analysis(market_data, timeframe, prefetched)
+        if not isinstance(analysis, dict):
+            return analysis
+        return self.complete_analysis(analysis)
+    
+    def prepare_analysis(self, market_data, timeframe=None, prefetched=None):
+        """MT5 side of analyze_market: gates, indicators, Level 2, cache and prompt
+        
+        Returns the final command when no LLM call is needed (gate, cache hit),
+        otherwise a dict for complete_analysis. prefetched=(indicators,
+        level2_data) skips the MT5 fetches (async pipeline).
+        """
+        symbol = (market_data or {}).get('symbol') or self.trading_pair
         
         # Check if we have at least one strategy configured
         if not self.long_strategy and not self.short_strategy:
             self.log("No strategy defined. Please configure long/short strategy in web interface.")
             return None
         
+        # ========== 预过滤: 硬性条件不满足时直接待机，不调用LLM ==========
+        gate = self._pre_llm_gate(market_data)
+        if gate:
+            return self._gate_standby(*gate)
+        
         # Get indicator data from MT5 using config settings
         indicators_enabled = self.indicators_config.get('enabled', True)
-        if indicators_enabled:
-            timeframe = self.indicators_config.get('timeframe', 1)
+        if prefetched is not None:
+            indicators = prefetched[0]
+        elif indicators_enabled:
+            timeframe = timeframe or self.indicators_config.get('timeframe', 1)
             count = self.indicators_config.get('candle_count', 200)
-            indicators = self.get_mt5_candles_and_indicators(self.trading_pair, timeframe_minutes=timeframe, count=count)
+            indicators = self.get_mt5_candles_and_indicators(symbol, timeframe_minutes=timeframe, count=count)
         else:
             indicators = None
         
+        gate = self._signal_gate(indicators)
+        if gate:
+            return self._gate_standby(*gate)
+        self._record_gate(None)
+        
         # Get Level 2 market data (order book/depth)
         level2_enabled = self.indicators_config.get('level2_enabled', True)
-        if level2_enabled:
-            level2_data = self.get_mt5_level2_data(self.trading_pair)
+        if prefetched is not None:
+            level2_data = prefetched[1]
+        elif level2_enabled:
+            level2_data = self.get_mt5_level2_data(symbol)
         else:
             level2_data = None
         
@@ -1247,349 +1486,218 @@ class AutoGPTTrading:
         digits = market_data.get('digits', 5)
         
         # Save to instance variables for later use
-        self._current_price = current_price
-        self._current_digits = digits
-        
-        # Build prompt using CONFIGURED strategies and percentages (not AI generated)
-        # Use the configured long/short strategies
-        long_strategy_text = self.long_strategy if self.long_strategy else "未配置"
-        short_strategy_text = self.short_strategy if self.short_strategy else "未配置"
+        self._scan.current_price = current_price
+        self._scan.current_digits = digits
         
         # Use configured percentages
-        long_sl = self.long_sl_percent if self.long_sl_percent else 0
-        long_tp = self.long_tp_percent if self.long_tp_percent else 0
-        short_sl = self.short_sl_percent if self.short_sl_percent else 0
-        short_tp = self.short_tp_percent if self.short_tp_percent else 0
-        
-        # Get rules
-        rules_text = self.rules if self.rules else "无"
-        
-        # Build prompt - STRICTLY use configured values
-        # Include ALL indicator data if available
-        indicator_info = ""
-        if indicators:
-            close_price = indicators.get('close_price')
-            
-            # Extract all indicators
-            ma5 = indicators.get('ma5')
-            ma10 = indicators.get('ma10')
-            ma20 = indicators.get('ma20')
-            ma50 = indicators.get('ma50')
-            ma200 = indicators.get('ma200')
-            ema12 = indicators.get('ema12')
-            ema26 = indicators.get('ema26')
-            rsi = indicators.get('rsi')
-            macd = indicators.get('macd')
-            macd_fast = indicators.get('macd_fast')
-            macd_slow = indicators.get('macd_slow')
-            bb_upper = indicators.get('bb_upper')
-            bb_middle = indicators.get('bb_middle')
-            bb_lower = indicators.get('bb_lower')
-            atr = indicators.get('atr')
-            signals = indicators.get('signals', [])
-            signal_summary = indicators.get('signal_summary', '无信号')
-            
-            # Format indicator values - only show calculated ones, hide uncalculated
-            # Build indicator sections conditionally
-            
-            # Moving Averages section
-            ma_lines = []
-            if ma5 is not None: ma_lines.append(f"- SMA5: {ma5:.5f}")
-            if ma10 is not None: ma_lines.append(f"- SMA10: {ma10:.5f}")
-            if ma20 is not None: ma_lines.append(f"- SMA20: {ma20:.5f}")
-            if ma50 is not None: ma_lines.append(f"- SMA50: {ma50:.5f}")
-            if ma200 is not None: ma_lines.append(f"- SMA200: {ma200:.5f}")
-            ma_section = "【移动平均线 SMA】:\n" + "\n".join(ma_lines) + "\n" if ma_lines else ""
-            
-            # EMA section
-            ema_lines = []
-            if ema12 is not None: ema_lines.append(f"- EMA12: {ema12:.5f}")
-            if ema26 is not None: ema_lines.append(f"- EMA26: {ema26:.5f}")
-            ema_section = "【指数移动平均线 EMA】:\n" + "\n".join(ema_lines) + "\n" if ema_lines else ""
-            
-            # RSI section
-            rsi_section = ""
-            if rsi is not None:
-                rsi_section = f"""【RSI 相对强弱指标】:
-- RSI(14): {rsi:.2f}
-  (RSI>70=超买, RSI<30=超卖)
-
-"""
-            
-            # MACD section
-            macd_lines = []
-            if macd is not None: macd_lines.append(f"- DIF: {macd:.5f}")
-            if macd_slow is not None: macd_lines.append(f"- DEA(EMA26): {macd_slow:.5f}")
-            macd_section = "【MACD 指数平滑异同移动平均线】:\n" + "\n".join(macd_lines) + "\n" if macd_lines else ""
-            
-            # Bollinger Bands section
-            bb_lines = []
-            if bb_upper is not None: bb_lines.append(f"- 上轨: {bb_upper:.5f}")
-            if bb_middle is not None: bb_lines.append(f"- 中轨: {bb_middle:.5f}")
-            if bb_lower is not None: bb_lines.append(f"- 下轨: {bb_lower:.5f}")
-            bb_section = "【布林带 Bollinger Bands】:\n" + "\n".join(bb_lines) + "\n" if bb_lines else ""
-            
-            # ATR section
-            atr_section = ""
-            if atr is not None:
-                atr_section = f"【ATR 平均真实波幅】:\n- ATR(14): {atr:.5f}\n"
-            
-            # Close price
-            close_str = f"- 收盘价: {close_price:.5f}" if close_price is not None else ""
-            
-            indicator_info = f"""
-【技术指标数据】(来自{indicators.get('timeframe', '1分钟')}K线, 共{indicators.get('candle_count', 0)}根):
-{close_str}
-
-{ma_section}{ema_section}{rsi_section}{macd_section}{bb_section}{atr_section}
-【⚠️ 技术信号】(Python程序计算，必须基于这些信号判断):
-{signal_summary}
-
-【重要】必须根据上方计算的技术信号进行判断:
-- 金叉/死叉: 短周期均线上穿/下穿长周期均线
-- 突破: 价格突破近期高点/低点
-- 回踩确认: 突破后价格回踩但仍保持突破方向
-- 背离: 价格与指标出现背离（如顶背离、底背离）
-
-【信号解读】:
-- MA金叉(MA10上穿MA50) = 做多信号
-- MA死叉(MA10下穿MA50) = 做空信号
-- RSI<30 超卖，可能反转做多
-- RSI>70 超买，可能反转做空
-- 价格突破布林上轨可能回落，跌破下轨可能反弹
-"""
+        long_sl, long_tp, short_sl, short_tp = self._sl_tp_percents()
         
         # Calculate SL/TP prices for both long and short
-        # For BUY: SL below price, TP above price
-        long_sl_price = None
-        long_tp_price = None
-        short_sl_price = None
-        short_tp_price = None
-        
-        if current_price and current_price > 0:
-            # Calculate prices based on configured percentages
-            if long_sl > 0:
-                long_sl_price = round(current_price * (1 - long_sl/100), digits)
-            if long_tp > 0:
-                long_tp_price = round(current_price * (1 + long_tp/100), digits)
-            if short_sl > 0:
-                short_sl_price = round(current_price * (1 + short_sl/100), digits)
-            if short_tp > 0:
-                short_tp_price = round(current_price * (1 - short_tp/100), digits)
-        
-        # Build Level 2 market data info
-        level2_info = ""
-        if level2_data and level2_data.get('available'):
-            bid_vol = level2_data.get('total_bid_volume', 0)
-            ask_vol = level2_data.get('total_ask_volume', 0)
-            bid_ratio = level2_data.get('bid_ratio', 0.5)
-            sentiment = level2_data.get('sentiment', '未知')
-            best_bid = level2_data.get('best_bid')
-            best_ask = level2_data.get('best_ask')
-            spread = level2_data.get('spread')
-            
-            # Get top 5 levels for display
-            bid_levels = level2_data.get('bid_levels', [])[:5]
-            ask_levels = level2_data.get('ask_levels', [])[:5]
-            
-            bid_str = ", ".join([f"{l['price']:.5f}({l['volume']})" for l in bid_levels])
-            ask_str = ", ".join([f"{l['price']:.5f}({l['volume']})" for l in ask_levels])
-            
-            # Format Level 2 values properly - use is not None
-            best_bid_str = f"{best_bid:.5f}" if best_bid is not None else "N/A"
-            best_ask_str = f"{best_ask:.5f}" if best_ask is not None else "N/A"
-            spread_str = f"{spread:.5f}" if spread is not None else "N/A"
-            bid_ratio_str = f"{bid_ratio:.1%}" if bid_ratio is not None else "N/A"
-            
-            level2_info = f"""
-
-【Level 2 市场深度】(如有):
-- 买盘总量: {bid_vol}
-- 卖盘总量: {ask_vol}
-- 买方占比: {bid_ratio_str}
-- 市场情绪: {sentiment}
-- 最佳买价: {best_bid_str}
-- 最佳卖价: {best_ask_str}
-- 深度点差: {spread_str}
-- 买盘5档: {bid_str}
-- 卖盘5档: {ask_str}
-
-【Level2 交易提示】:
-- 买方占比>60%: 市场偏多，可能上涨
-- 买方占比<40%: 市场偏空，可能下跌
-- 买盘挂单量突然增加: 可能护盘或诱多
-- 卖盘挂单量突然增加: 可能压盘或诱空
-"""
+        long_sl_price, long_tp_price, short_sl_price, short_tp_price = self._sl_tp_prices(current_price, digits)
+        
+        # ========== 决策缓存: 量化后的输入未变时直接复用上次的方向 ==========
+        cache_key = fingerprint(indicators, level2_data, getattr(self._scan, 'position_count', 0),
+                                self._decision_config_hash(symbol))
+        cached_direction = self.decision_cache.get(cache_key)
+        if cached_direction is not None:
+            if cached_direction == "做多":
+                command = self._command_for_direction("做多", long_sl_price, long_tp_price, long_sl, long_tp)
+            elif cached_direction == "做空":
+                command = self._command_for_direction("做空", short_sl_price, short_tp_price, short_sl, short_tp)
+            else:
+                command = "待机"
+            self.log(f"🗄️ 决策缓存命中: {command} (命中率 {self.decision_cache.hit_rate:.1%})")
+            return command
         
-        # Format price info for prompt
-        price_info = ""
-        if long_sl_price is not None or long_tp_price is not None:
-            price_info += f"\n【做多止损止盈价格】(已计算好，直接使用):\n"
-            if long_sl_price is not None:
-                price_info += f"- 做多止损价格: {long_sl_price}\n"
-            if long_tp_price is not None:
-                price_info += f"- 做多止盈价格: {long_tp_price}\n"
-        
-        if short_sl_price is not None or short_tp_price is not None:
-            price_info += f"\n【做空止损止盈价格】(已计算好，直接使用):\n"
-            if short_sl_price is not None:
-                price_info += f"- 做空止损价格: {short_sl_price}\n"
-            if short_tp_price is not None:
-                price_info += f"- 做空止盈价格: {short_tp_price}\n"
-        
-        analysis_prompt = f"""
-你是一个专业的外汇交易分析师。根据以下市场数据和分析策略，判断是否应该交易。
-
-【警告】你必须【逐条检查】下方的策略条件，只有【全部满足】时才可下单！
-
-交易品种: {self.trading_pair}
-当前价格: {current_price}
-买入价(Ask): {market_data.get('ask', current_price)}
-卖出价(Bid): {market_data.get('bid', current_price)}
-小数位数: {digits}位
-点差: {market_data.get('spread', 'N/A')}点
-{indicator_info}{level2_info}
-【做多策略】(必须逐条检查，全部满足才可做多):
-{long_strategy_text}
-【重要】必须同时满足以上所有条件才可做多，任何一条不满足都必须待机！
-
-【做多止损比例】: {long_sl}% (价格 × (1 - {long_sl}%))
-【做多止盈比例】: {long_tp}% (价格 × (1 + {long_tp}%))
-
-【做空策略】(必须逐条检查，全部满足才可做空):
-{short_strategy_text}
-【重要】必须同时满足以上所有条件才可做空，任何一条不满足都必须待机！
-
-【做空止损比例】: {short_sl}% (价格 × (1 + {short_sl}%))
-【做空止盈比例】: {short_tp}% (价格 × (1 - {short_tp}%))
-
-{price_info}
-【必须遵守规则】: {rules_text}
-
-【决策流程】（必须按此流程）:
-1. 逐条检查做多策略条件 → 如果全部满足 → 做多
-2. 逐条检查做空策略条件 → 如果全部满足 → 做空
-3. 任何条件不满足 → 待机
-
-【输出格式】（只输出以下三种之一，不要其他内容）：
-- 做多 止损{long_sl_price if long_sl_price is not None else '无'} 止盈{long_tp_price if long_tp_price is not None else '无'}
-- 做空 止损{short_sl_price if short_sl_price is not None else '无'} 止盈{short_tp_price if short_tp_price is not None else '无'}
-- 待机
-
-注意：止损和止盈后面必须是计算好的具体价格数值，不是百分比！Executor会直接复制这些数值到MT5。
-
-根据策略判断，现在应该做什么操作？
-"""
+        return self.analysis_request(symbol, market_data, indicators, level2_data, cache_key)
+    
+    def analysis_request(self, symbol, market_data, indicators, level2_data, cache_key):
+        """Prompt and SL/TP levels for complete_analysis (also used by the backtester)"""
+        current_price = market_data.get('price', 0)
+        digits = market_data.get('digits', 5)
+        long_sl, long_tp, short_sl, short_tp = self._sl_tp_percents()
+        long_sl_price, long_tp_price, short_sl_price, short_tp_price = self._sl_tp_prices(current_price, digits)
         
         # Use 10 conversation rounds (increased from 2)
         history_context = ""
         if self.conversation_history:
             recent_history = self.conversation_history[-10:]  # Use last 10 rounds
             history_context = "\n".join([f"{msg['role']}: {msg['content'][:200]}" for msg in recent_history])
-            analysis_prompt = f"历史对话:\n{history_context}\n\n" + analysis_prompt
-        
-        # Add indicator info to system prompt as well
-        system_indicator_info = ""
-        if indicators:
-            ma10 = indicators.get('ma10')
-            ma50 = indicators.get('ma50')
-            signal = indicators.get('crossover_signal', '无信号')
-            if ma10 is not None and ma50 is not None:
-                ma10_p = f"{ma10:.5f}"
-                ma50_p = f"{ma50:.5f}"
-                system_indicator_info = f"""
-【技术指标】:
-- MA10: {ma10_p}
-- MA50: {ma50_p}
-- 交叉信号: {signal}
-"""
         
-        # Format calculated prices for system prompt
-        long_sl_price_str = f"{long_sl_price}" if long_sl_price is not None else "无"
-        long_tp_price_str = f"{long_tp_price}" if long_tp_price is not None else "无"
-        short_sl_price_str = f"{short_sl_price}" if short_sl_price is not None else "无"
-        short_tp_price_str = f"{short_tp_price}" if short_tp_price is not None else "无"
-        
-        system_prompt = f"""你是一个专业的外汇交易分析师。
-【严格遵守规则 - 违反以下规则将导致错误交易】
-1. 必须【逐条检查】配置的做多/做空策略条件，只有【全部满足】时才可下单
-2. 不得自行决定止损止盈数值，【必须】使用已计算好的价格
-3. 做多时【必须】使用做多策略和做多价格，做空时【必须】使用做空策略和做空价格
-4. 必须根据Python程序计算的技术信号来判断，【严禁】凭感觉或猜测下单
-5. 【严禁输出平仓指令】系统只等待止盈或止损，不主动平仓
-6. 如果策略条件【任何一条】不满足，【必须】输出"待机"
-
-【策略检查清单】（做多时）:
-{long_strategy_text}
-→ 逐条检查上述条件，全部满足才可做多，否则必须待机
-
-【策略检查清单】（做空时）:
-{short_strategy_text}
-→ 逐条检查上述条件，全部满足才可做空，否则必须待机
-
-{system_indicator_info}
-
-当前配置（必须严格遵守）:
-- 做多策略: {long_strategy_text}
-- 做多止损价格: {long_sl_price_str} (基于{long_sl}%计算)
-- 做多止盈价格: {long_tp_price_str} (基于{long_tp}%计算)
-- 做空策略: {short_strategy_text}
-- 做空止损价格: {short_sl_price_str} (基于{short_sl}%计算)
-- 做空止盈价格: {short_tp_price_str} (基于{short_tp}%计算)
-- 必须遵守规则: {rules_text}
-- 当前价格: {current_price}
-
-【决策依据】:
-- 主要依据: Python程序计算的技术信号（金叉/死叉、突破、回踩确认、背离）
-- 次要参考: 指标数值和Level2市场深度
-- 必须优先考虑技术信号，再结合配置的策略
-
-【输出规则】:
-只输出以下三种指令之一（不要输出品种和数量，这些已在MT5中设定好）：
-- 做多 止损{long_sl_price_str} 止盈{long_tp_price_str}
-- 做空 止损{short_sl_price_str} 止盈{short_tp_price_str}
-- 待机
-
-注意：止损和止盈后面必须是计算好的具体价格数值（如"止损38300.50"），不是百分比！Executor会直接复制这些数值到MT5。
-
-不要输出其他内容，只输出指令。"""
+        system_prompt, analysis_prompt = self.build_analysis_prompt(
+            symbol, market_data, indicators, level2_data,
+            (long_sl_price, long_tp_price, short_sl_price, short_tp_price), history_context)
+        if self.decision_format == 'json':
+            analysis_prompt += DECISION_INSTRUCTION
         
-        result = self.call_ollama(analysis_prompt, system_prompt)
+        return {
+            'symbol': symbol,
+            'current_price': current_price,
+            'digits': digits,
+            'prompt': analysis_prompt,
+            'system_prompt': system_prompt,
+            'levels': (long_sl, long_tp, short_sl, short_tp),
+            'prices': (long_sl_price, long_tp_price, short_sl_price, short_tp_price),
+            'cache_key': cache_key,
+        }
+    
+    def _sl_tp_percents(self):
+        """Configured (long_sl, long_tp, short_sl, short_tp) percentages, 0 when unset"""
+        return (self.long_sl_percent or 0, self.long_tp_percent or 0,
+                self.short_sl_percent or 0, self.short_tp_percent or 0)
+    
+    def _sl_tp_prices(self, current_price, digits):
+        """SL/TP prices from the configured percentages (None where not configured)"""
+        long_sl, long_tp, short_sl, short_tp = self._sl_tp_percents()
+        if not current_price or current_price <= 0:
+            return None, None, None, None
+        # For BUY: SL below price, TP above price
+        return (round(current_price * (1 - long_sl/100), digits) if long_sl > 0 else None,
+                round(current_price * (1 + long_tp/100), digits) if long_tp > 0 else None,
+                round(current_price * (1 + short_sl/100), digits) if short_sl > 0 else None,
+                round(current_price * (1 - short_tp/100), digits) if short_tp > 0 else None)
+    
+    def build_analysis_prompt(self, symbol, market_data, indicators, level2_data, prices, history="", mode=None):
+        """(system_prompt, prompt) for one scan; static sections come precompiled per config version"""
+        mode = mode or self.prompt_mode
+        if mode not in PROMPT_MODES:
+            mode = 'verbose'
+        long_sl, long_tp, short_sl, short_tp = self._sl_tp_percents()
+        compiled = self.prompt_compiler.compile({
+            'long_strategy': self.long_strategy or "未配置", 'short_strategy': self.short_strategy or "未配置",
+            'long_sl': long_sl, 'long_tp': long_tp, 'short_sl': short_sl, 'short_tp': short_tp,
+            'rules': self.rules or "无",
+            'level2_enabled': self.indicators_config.get('level2_enabled', True),
+            'token_budget': self.prompt_token_budget if mode == 'compact' else None,
+        }, mode)
+        current_price = market_data.get('price', 0)
+        digits = market_data.get('digits', 5)
+        prompt = compiled.render(symbol, market_data, current_price, digits, indicators, level2_data,
+                                 prices, history)
+        tokens = estimate_tokens(compiled.system) + estimate_tokens(prompt)
+        budget = f" (预算 {self.prompt_token_budget})" if mode == 'compact' else ""
+        self.log(f"📝 提示词[{mode}]: 约{tokens} tokens{budget}")
+        return compiled.system, prompt
+    
+    def complete_analysis(self, analysis):
+        """LLM side of analyze_market: ask the model and normalize its decision"""
+        analysis_prompt = analysis['prompt']
+        system_prompt = analysis['system_prompt']
+        long_sl, long_tp, short_sl, short_tp = analysis['levels']
+        # May run on another thread than prepare_analysis (scheduler LLM pool)
+        self._scan.current_price = analysis['current_price']
+        self._scan.current_digits = analysis['digits']
+        
+        if self.decision_format == 'json':
+            return self._complete_structured(analysis)
         
         # 清理和标准化指令输出
-        if result:
-            result = result.strip()
-            lines = result.split('\n')
-            for line in lines:
-                line = line.strip()
-                # 处理做多指令
-                if line.startswith("做多"):
-                    # 检查是否已包含止损止盈
-                    if "止损" in line and "止盈" in line:
-                        return line  # 直接返回
-                    else:
-                        # 添加配置的百分比
-                        cmd = f"做多 止损{long_sl}% 止盈{long_tp}%"
-                        return cmd
-                # 处理做空指令
-                elif line.startswith("做空"):
-                    # 检查是否已包含止损止盈
-                    if "止损" in line and "止盈" in line:
-                        return line  # 直接返回
-                    else:
-                        # 添加配置的百分比
-                        cmd = f"做空 止损{short_sl}% 止盈{short_tp}%"
-                        return cmd
-                # 处理待机/不操作指令
-                elif line.startswith("待机") or "不操作" in line or "观望" in line:
-                    return "待机"
-                # 如果LLM错误地输出平仓，转换为待机
-                elif "平仓" in line:
-                    self.log("警告: LLM尝试输出平仓指令，已转换为待机")
-                    return "待机"
+        normalize = lambda line: self._normalize_decision_line(line, long_sl, long_tp, short_sl, short_tp)
+        command = None
+        if self.stream_decisions:
+            # 流式读取，解析出第一条完整指令后立即取消生成
+            command, result = self.call_ollama_until(analysis_prompt, system_prompt, normalize)
+        else:
+            result = self.call_ollama(analysis_prompt, system_prompt)
+            if result:
+                for line in result.strip().split('\n'):
+                    command = normalize(line)
+                    if command:
+                        break
         
         # 如果没有明确指令，默认待机
-        return "待机"
+        analysis['answered'] = bool(result)
+        if result:
+            if command:
+                self.decision_stats.record({'direction': command[:2]})
+            else:
+                self.decision_stats.record(error=DecisionError('no_command', "LLM输出中没有指令"))
+        command = command or "待机"
+        
+        # 只缓存LLM实际给出的决策（调用失败不缓存）
+        if result:
+            self.decision_cache.put(analysis['cache_key'], command[:2])
+        return command
+    
+    def _complete_structured(self, analysis):
+        """JSON decision: validate the object and rebuild SL/TP from the precomputed prices"""
+        long_sl, long_tp, short_sl, short_tp = analysis['levels']
+        long_sl_price, long_tp_price, short_sl_price, short_tp_price = analysis['prices']
+        result = self.call_ollama_structured(analysis['prompt'], analysis['system_prompt'])
+        analysis['answered'] = result is not None
+        if result is None:
+            return "待机"
+        try:
+            decision = parse_decision(result)
+        except DecisionError as e:
+            # 解析失败计入统计，不写入决策缓存
+            self.decision_stats.record(error=e)
+            self.log(f"⚠️ 结构化决策无效({e.kind}): {str(e)} | 原文: {result[:200]}")
+            return "待机"
+        
+        direction = decision['direction']
+        corrected = False
+        if direction == "做多":
+            expected = (long_sl_price, long_tp_price)
+            command = self._command_for_direction("做多", long_sl_price, long_tp_price, long_sl, long_tp)
+        elif direction == "做空":
+            expected = (short_sl_price, short_tp_price)
+            command = self._command_for_direction("做空", short_sl_price, short_tp_price, short_sl, short_tp)
+        else:
+            expected = None
+            command = "待机"
+        if expected is not None and not (price_matches(decision['sl'], expected[0])
+                                         and price_matches(decision['tp'], expected[1])):
+            # 止损止盈始终以本地计算的价格为准
+            corrected = True
+            self.log(f"结构化决策SL/TP与计算值不符 (模型 {decision['sl']}/{decision['tp']}, "
+                     f"计算 {expected[0]}/{expected[1]})，已使用计算值")
+        self.decision_stats.record(decision, corrected=corrected)
+        if decision['reasons']:
+            self.log(f"决策理由 ({decision['confidence']:.2f}): " + "; ".join(decision['reasons']))
+        
+        self.decision_cache.put(analysis['cache_key'], direction)
+        return command
+    
+    def _normalize_decision_line(self, line, long_sl, long_tp, short_sl, short_tp):
+        """Normalize one line of LLM output into a command, or None if it has none"""
+        line = line.strip()
+        # 处理做多指令
+        if line.startswith("做多"):
+            # 检查是否已包含止损止盈
+            if "止损" in line and "止盈" in line:
+                return line  # 直接返回
+            # 添加配置的百分比
+            return f"做多 止损{long_sl}% 止盈{long_tp}%"
+        # 处理做空指令
+        elif line.startswith("做空"):
+            # 检查是否已包含止损止盈
+            if "止损" in line and "止盈" in line:
+                return line  # 直接返回
+            # 添加配置的百分比
+            return f"做空 止损{short_sl}% 止盈{short_tp}%"
+        # 处理待机/不操作指令
+        elif line.startswith("待机") or "不操作" in line or "观望" in line:
+            return "待机"
+        # 如果LLM错误地输出平仓，转换为待机
+        elif "平仓" in line:
+            self.log("警告: LLM尝试输出平仓指令，已转换为待机")
+            return "待机"
+        return None
+    
+    def _command_for_direction(self, direction, sl_price, tp_price, sl_percent, tp_percent):
+        """Build a command for a cached direction using freshly calculated prices"""
+        if sl_price is not None and tp_price is not None:
+            return f"{direction} 止损{sl_price} 止盈{tp_price}"
+        return f"{direction} 止损{sl_percent}% 止盈{tp_percent}%"
+    
+    def _decision_config_hash(self, symbol):
+        """Hash of every setting that shapes the analysis prompt"""
+        return config_hash(
+            symbol, self.long_strategy, self.short_strategy,
+            self.long_sl_percent, self.long_tp_percent, self.short_sl_percent, self.short_tp_percent,
+            self.rules, self.indicators_config.get('selected_indicators'), self.prompt_mode,
+            self.decision_format)
         
     def parse_command(self, response):
         """Parse the LLM response to extract trading command"""
@@ -1638,14 +1746,14 @@ class AutoGPTTrading:
         
         return sl_price, tp_price
     
-    def send_command_to_executor(self, command):
+    def send_command_to_executor(self, command, symbol=None):
         """Send command to executor agent - 直接发送命令，不重新计算价格"""
         if command:
             self.log(f"发送交易指令: {command}")
             try:
                 # Get current price and digits for reference
-                current_price = getattr(self, '_current_price', 0)
-                digits = getattr(self, '_current_digits', 5)
+                current_price = getattr(self._scan, 'current_price', 0)
+                digits = getattr(self._scan, 'current_digits', 5)
                 
                 # 如果命令中已经有实际价格（没有%符号），直接发送，不重新计算
                 # 检查命令中是否有%符号
@@ -1679,14 +1787,23 @@ class AutoGPTTrading:
                     price_info += f"@sl={sl_price}"
                 if 'tp_price' in locals() and tp_price is not None:
                     price_info += f"@tp={tp_price}"
+                # 多品种调度时告知executor品种（API模式按此下单）
+                if symbol:
+                    price_info += f"@symbol={symbol}"
                 
-                with open(COMMANDS_FILE, 'w', encoding='utf-8') as f:
-                    f.write("NEW:" + command_to_send + "\n")
-                    f.write(price_info + "\n")
+                seq, channel = self.command_channel.send(
+                    command_to_send, price_info, getattr(self._scan, 'signal_time', None))
+                self.log(f"📨 指令#{seq} 已通过{'socket' if channel == 'socket' else '文件'}通道送达")
                 return True
             except Exception as e:
                 self.log(f"Error writing command: {str(e)}")
         return False
+    
+    def _on_command_done(self, reply):
+        """Executor finished a socket-delivered command"""
+        latency = reply.get('signal_to_click_ms')
+        latency_text = f", 信号→点击 {latency:.0f}ms" if latency is not None else ""
+        self.log(f"⏱️ 指令#{reply.get('seq')} 执行{'成功' if reply.get('ok') else '失败'}{latency_text}")
         
     def monitor_loop(self):
         """Main monitoring loop"""
@@ -1705,6 +1822,7 @@ class AutoGPTTrading:
             try:
                 # ========== 扫描开始 ==========
                 scan_time = datetime.now().strftime("%H:%M:%S")
+                self._scan.signal_time = time.time()  # 信号→点击延迟的起点
                 self.log(f"📡 开始扫描 - 时间: {scan_time}, 品种: {self.trading_pair}")
                 
                 # Get market data
@@ -1746,18 +1864,7 @@ class AutoGPTTrading:
                             self.log("监控模式已切换，取消发送指令")
                             break
                         
-                        # ========== 检查最大持仓数限制 ==========
-                        current_positions = self.get_mt5_positions()
-                        position_count = len(current_positions)
-                        
-                        if position_count >= self.max_positions:
-                            self.log(f"⚠️ 持仓数已达上限: {position_count}/{self.max_positions} 单，需等待平仓后才能开新单")
-                            # 不发送交易指令，等待下次扫描
-                        else:
-                            # ========== 发送指令 ==========
-                            self.log(f"🚀 发送交易指令: {command}")
-                            self.send_command_to_executor(command)
-                            self.log("📤 指令已发送到Executor")
+                        self.dispatch_command(command)
                     else:
                         self.log("⚠️ 未识别到有效交易指令")
                 else:
@@ -1775,6 +1882,44 @@ class AutoGPTTrading:
                 self.log(f"❌ 监控循环错误: {str(e)}")
                 time.sleep(10)
                 
+    def dispatch_command(self, command, symbol=None):
+        """Send a parsed command unless the position limit or risk engine forbids it"""
+        # Serialized so concurrent scheduler scans see each other's position checks
+        with self._dispatch_lock:
+            # ========== 检查最大持仓数限制 ==========
+            current_positions = self.get_mt5_positions()
+            position_count = len(current_positions)
+            
+            # 风控引擎的点差/时段限制只针对主品种；其他品种只受熔断限制
+            if symbol is None or symbol == self.trading_pair:
+                risk_block = self.risk_engine.block_reason
+            else:
+                risk_block = self.risk_engine.halt_reason
+            
+            if position_count >= self.max_positions:
+                self.log(f"⚠️ 持仓数已达上限: {position_count}/{self.max_positions} 单，需等待平仓后才能开新单")
+                # 不发送交易指令，等待下次扫描
+                return False
+            if risk_block and command != "待机":
+                self.log(f"🛡️ 风控禁止开仓: {risk_block}")
+                return False
+            
+            # ========== 发送指令 ==========
+            self.log(f"🚀 发送交易指令: {command}" + (f" [{symbol}]" if symbol else ""))
+            self.send_command_to_executor(command, symbol)
+            self.log("📤 指令已发送到Executor")
+            return True
+    
+    def monitor_loop_async(self):
+        """Monitoring loop on the asyncio pipeline (pipeline_mode = "async")"""
+        self.log(f"开始自动盯盘模式(异步流水线) - 交易品种: {self.trading_pair}, 扫描周期: {self.monitoring_interval}秒")
+        self.pipeline = AsyncMonitorPipeline(self, MARKET_DATA_CACHE)
+        try:
+            self.pipeline.run()
+        except Exception as e:
+            self.log(f"❌ 异步流水线错误: {str(e)}")
+        self.log("异步流水线已停止")
+    
     def set_mode(self, mode):
         """Set the working mode"""
         if mode == "monitor":
@@ -1786,7 +1931,7 @@ class AutoGPTTrading:
             self.log(f"规则: {self.rules}")
             
             # 检查交易品种和策略配置
-            if not self.trading_pair:
+            if not self.trading_pair and not self.symbols:
                 self.log("错误: 请先设置交易品种")
                 return False
             
@@ -1804,13 +1949,27 @@ class AutoGPTTrading:
             self.log(f"长策略: {'已设置' if self.long_strategy else '未设置'}")
             self.log(f"短策略: {'已设置' if self.short_strategy else '未设置'}")
             
-            # 启动监控线程（如果未在运行）
-            if self.monitor_thread is None or not self.monitor_thread.is_alive():
-                self.monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
+            # 配置了多品种列表时由调度器并发扫描，否则使用单品种监控线程
+            states = parse_symbols(self.symbols, self.monitoring_interval,
+                                   self.indicators_config.get('timeframe', 1))
+            if states:
+                if self.scheduler is None or not self.scheduler.thread or not self.scheduler.thread.is_alive():
+                    self.scheduler = ScanScheduler(self, states, self.data_workers, self.llm_workers)
+                    self.scheduler.start()
+                    self.log(f"多品种调度已启动: {len(states)} 个品种")
+                else:
+                    self.log("多品种调度已在运行")
+            elif self.monitor_thread is None or not self.monitor_thread.is_alive():
+                loop = self.monitor_loop_async if self.pipeline_mode == "async" else self.monitor_loop
+                self.monitor_thread = threading.Thread(target=loop, daemon=True)
                 self.monitor_thread.start()
                 self.log("监控线程已启动")
             else:
                 self.log("监控线程已在运行")
+            
+            # 启动风控引擎（规则中配置了移动止损、回撤、点差等参数时）
+            if self.mt5_connected and self.risk_engine.has_rules():
+                self.risk_engine.start()
                 
         else:
             self.mode = "discussion"
@@ -1869,6 +2028,45 @@ class AutoGPTTrading:
 监控间隔: {self.monitoring_interval}秒
 模式: {self.mode}"""
         
+        if user_input == "风控状态":
+            status = self.risk_engine.stats()
+            with self._gate_lock:
+                status['pre_llm_gate'] = {'last': self.last_gate, 'counts': dict(self.gate_stats)}
+            status['decision_cache'] = self.decision_cache.stats()
+            return json.dumps(status, indent=2, ensure_ascii=False)
+        
+        if user_input == "性能统计":
+            stats = {'ollama': self.ollama.stats(), 'log_pipeline': self.log_pipeline.stats(),
+                     'command_channel': self.command_channel.stats(),
+                     'candle_store': self.candle_store.stats(),
+                     'symbol_registry': self.symbol_registry.stats(),
+                     'order_books': self.order_books.stats(),
+                     'prompt_templates': self.prompt_compiler.stats(),
+                     'decisions': dict(self.decision_stats.stats(), format=self.decision_format),
+                     'llm_store': self.llm_store.stats()}
+            if self.scheduler is not None:
+                stats['scheduler'] = self.scheduler.stats()
+            if self.pipeline is not None:
+                stats['async_pipeline'] = self.pipeline.stats()
+            return json.dumps(stats, indent=2, ensure_ascii=False)
+        
+        if user_input.startswith("提示词对比"):
+            if not self.mt5_connected:
+                return "MT5未连接，无法进行提示词对比"
+            rounds = user_input.replace("提示词对比", "").strip()
+            rounds = int(rounds) if rounds.isdigit() else 10
+            return json.dumps(run_prompt_ab(self, rounds), indent=2, ensure_ascii=False)
+        
+        if user_input.startswith("模型记录"):
+            mode = user_input.replace("模型记录", "", 1).strip()
+            if mode not in STORE_MODES:
+                return f"用法: 模型记录 <{'|'.join(STORE_MODES)}>，当前: {self.llm_store.mode}"
+            self.llm_store.configure(mode, self.llm_store.max_bytes / 1024 / 1024)
+            return f"模型调用记录模式: {mode}"
+        
+        if user_input.startswith("回测"):
+            return self.run_backtest(user_input.replace("回测", "", 1).strip())
+        
         # Auto-configure: Analyze conversation to auto-detect and set configuration
         if user_input in ["自动配置", "帮我配置", "配置交易", "开始配置"]:
             return self.auto_configure_from_context()
@@ -1899,6 +2097,49 @@ class AutoGPTTrading:
             self.conversation_history.append({"role": "assistant", "content": response})
         
         return response if response else "抱歉，我遇到了一些问题，请重试。"
+    
+    def run_backtest(self, args):
+        """回测 [规则|模型] [天数|CSV路径]: replay history through the current configuration"""
+        parts = args.split(maxsplit=1)
+        decider = RuleDecider()
+        if parts and parts[0] in ("规则", "模型"):
+            if parts[0] == "模型":
+                decider = LLMDecider(self)
+            parts = parts[1:]
+        source = parts[0] if parts else "30"
+        symbol = self.trading_pair
+        if not symbol:
+            return "错误: 请先设置交易品种"
+        
+        digits, point, contract_size = 5, None, 1.0
+        info = self.symbol_registry.get(symbol) if self.mt5_connected else None
+        if info is not None:
+            digits, point, contract_size = info.digits, info.point, info.trade_contract_size
+        
+        try:
+            if source.isdigit():
+                bars = int(source) * 1440 // self.timeframe
+                rates = fetch_history(self.candle_store.series(symbol, self.timeframe),
+                                      mt5 if self.mt5_connected else None,
+                                      info.name if info is not None else symbol, self.timeframe, bars)
+            else:
+                rates = load_csv(source)
+        except Exception as e:
+            return f"读取历史K线失败: {str(e)}"
+        if len(rates) == 0:
+            return f"没有 {symbol} 的历史K线可供回测"
+        
+        self.log(f"📊 开始回测 {symbol}: {len(rates)} 根K线, 决策器={decider.name}")
+        backtest = Backtest(self, rates, decider, symbol=symbol, digits=digits, point=point,
+                            contract_size=contract_size).run()
+        summary = backtest.summary()
+        try:
+            summary['output'] = backtest.save()
+        except OSError as e:
+            self.log(f"保存回测结果失败: {str(e)}")
+        self.log(f"📊 回测完成: {summary['trades']} 笔交易, 净利润 {summary['net_profit']}, "
+                 f"耗时 {summary['elapsed_seconds']}秒")
+        return json.dumps(summary, indent=2, ensure_ascii=False)
         
     def stop(self):
         """Stop the application"""
@@ -1906,14 +2147,19 @@ class AutoGPTTrading:
         self.mode = "discussion"
         self.save_config()
         
+        if MT5_AVAILABLE:
+            self.order_books.release_all()
+        self.llm_store.close()
+        
         # Perform log rotation when exiting
+        self.log_pipeline.flush()
         self._rotate_log_on_exit()
     
     def _rotate_log_on_exit(self):
         """Rotate log file when the application exits"""
         import shutil
         
-        LOG_DIR = "E:\\TradingSystem\\logs"
+        LOG_DIR = os.path.join(os.path.dirname(self.log_file), "logs")
         
         try:
             # Create logs directory if it doesn't exist
@@ -1921,12 +2167,12 @@ class AutoGPTTrading:
                 os.makedirs(LOG_DIR)
             
             # Check if log file exists
-            if not os.path.exists(LOG_FILE):
+            if not os.path.exists(self.log_file):
                 return
             
             # Get log file info
-            log_size = os.path.getsize(LOG_FILE)
-            log_mtime = datetime.fromtimestamp(os.path.getmtime(LOG_FILE))
+            log_size = os.path.getsize(self.log_file)
+            log_mtime = datetime.fromtimestamp(os.path.getmtime(self.log_file))
             
             # Only rotate if log file has content or is from a previous day
             today = datetime.now().date()
@@ -1934,13 +2180,13 @@ class AutoGPTTrading:
             if log_size > 0 or log_mtime.date() < today:
                 # Generate timestamp for old log file
                 timestamp_str = log_mtime.strftime("%Y%m%d_%H%M%S")
-                log_filename = os.path.basename(LOG_FILE)
+                log_filename = os.path.basename(self.log_file)
                 old_log_name = f"{log_filename.replace('.log', '')}_{timestamp_str}.log"
                 old_log_path = os.path.join(LOG_DIR, old_log_name)
                 
                 # Move old log to logs directory
                 try:
-                    shutil.move(LOG_FILE, old_log_path)
+                    shutil.move(self.log_file, old_log_path)
                     print(f"[LOG] 旧日志已保存到: {old_log_path}")
                 except Exception as e:
                     print(f"[LOG] 移动日志文件失败: {str(e)}")
@@ -1967,7 +2213,7 @@ def main():
     
     # Check if Ollama is available
     try:
-        response = requests.get(f"{OLLAMA_HOST}/api/tags", timeout=5)
+        response = bot.ollama.get('/api/tags', read_timeout=5)
         if response.status_code == 200:
             print("[OK] Ollama connected")
         else:
@@ -1983,6 +2229,11 @@ def main():
     print("  设置策略 [策略]   - 设置交易策略")
     print("  设置间隔 [秒]     - 设置监控间隔")
     print("  查看配置          - 查看当前配置")
+    print("  风控状态          - 查看风控引擎状态和规则耗时")
+    print("  性能统计          - 查看Ollama、日志队列、指令通道和调度/流水线统计")
+    print("  提示词对比 [轮数]  - 用实时行情对比verbose/compact提示词的决策一致率和延迟")
+    print("  回测 [规则|模型] [天数|CSV路径] - 用历史K线回测当前策略配置，输出交易列表和资金曲线")
+    print("  模型记录 <off|record|replay|replay_only> - 记录模型回答/从记录库回放（无需加载模型）")
     print("  策略固定，开始盯盘 - 开始自动监控")
     print("  退出              - 退出程序")
     print("-" * 50)
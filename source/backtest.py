@@ -0,0 +1,490 @@
+"""
+Backtest - Replay historical bars through the analysis path offline
+Indicator series are computed once over the whole history with the
+vectorized kernels, and every bar is then run through the agent's own
+signal code, entry gates and a pluggable decider. Entries fill at the next
+bar's open with the bar's spread, SL/TP are checked against each bar's
+range, and the result is a trade list plus a per-bar equity curve.
+"""
+
+import csv
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import indicators
+from candle_store import RATE_DTYPE, _as_rates
+from decision_cache import DecisionCache, fingerprint
+from indicator_engine import (IndicatorEngine, SMA_PERIODS, EMA_PERIODS, RSI_PERIOD,
+                              BOLLINGER_PERIOD, BOLLINGER_STD_DEV, ATR_PERIOD, SIGNAL_WINDOW_BARS)
+
+BACKTEST_DIR = "E:\\TradingSystem\\backtests"
+
+# Bars skipped before the first decision so the slow averages are warm
+BACKTEST_WARMUP = max(SMA_PERIODS)
+
+# Starting account balance
+INITIAL_BALANCE = 10000.0
+
+# Time formats accepted in CSV files (MT5 exports use dots)
+_CSV_TIME_FORMATS = ("%Y.%m.%d %H:%M:%S", "%Y.%m.%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M")
+
+
+def _parse_time(text):
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    for fmt in _CSV_TIME_FORMATS:
+        try:
+            return int(datetime.strptime(text, fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析时间: {text}")
+
+
+def load_csv(path):
+    """Read OHLC history into a RATE_DTYPE array
+
+    Accepts a header with time/open/high/low/close (plus optional
+    tick_volume, spread, real_volume), or the MT5 export layout with
+    separate <DATE> and <TIME> columns. Times are taken as server time.
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        reader = csv.reader(f, dialect)
+        header = [h.strip().strip('<>').lower() for h in next(reader)]
+        col = {name: i for i, name in enumerate(header)}
+        rows = []
+        for row in reader:
+            if not row:
+                continue
+            if 'time' in col and 'date' in col:
+                stamp = _parse_time(f"{row[col['date']]} {row[col['time']]}")
+            else:
+                stamp = _parse_time(row[col.get('time', col.get('date', 0))])
+            rows.append((stamp, row))
+
+    rates = np.zeros(len(rows), dtype=RATE_DTYPE)
+    rates['time'] = [stamp for stamp, _ in rows]
+    for name, aliases in (('open', ('open',)), ('high', ('high',)), ('low', ('low',)),
+                          ('close', ('close',)), ('tick_volume', ('tick_volume', 'tickvol')),
+                          ('spread', ('spread',)), ('real_volume', ('real_volume', 'vol', 'volume'))):
+        index = next((col[a] for a in aliases if a in col), None)
+        if index is not None:
+            rates[name] = [float(row[index]) for _, row in rows]
+    rates.sort(order='time')
+    return rates
+
+
+def fetch_history(series, mt5, symbol, timeframe, bars):
+    """The last bars closed bars, from the candle store or the terminal (mt5 may be None)
+
+    The store only backfills once, so a look-back longer than what it holds
+    is fetched from the terminal directly.
+    """
+    if mt5 is not None:
+        series.sync(mt5, symbol, timeframe, bars)
+    rates = series.closed(bars)
+    if len(rates) < bars and mt5 is not None:
+        fetched = mt5.copy_rates_from_pos(symbol, timeframe, 1, bars)
+        if fetched is not None and len(fetched) > len(rates):
+            rates = _as_rates(fetched)
+    return rates
+
+
+def _as_list(series):
+    """Float series -> list with None where the indicator is not ready"""
+    return [None if math.isnan(v) else v for v in series.tolist()]
+
+
+class IndicatorSeries:
+    """Full-history indicator series, read per bar like IndicatorEngine.snapshot()
+
+    Bar i is treated as the forming bar at its close: values are the series
+    at i, previous values the series at i - 1 (the closed bars).
+    """
+
+    def __init__(self, rates):
+        _, highs, lows, closes = indicators.ohlc(rates)
+        series = {}
+        for period in SMA_PERIODS:
+            series[f"ma{period}"] = indicators.sma(closes, period)
+        for period in EMA_PERIODS:
+            series[f"ema{period}"] = indicators.ema(closes, period)
+        series["rsi"] = indicators.rsi(closes, RSI_PERIOD)
+        series["bb_upper"], series["bb_middle"], series["bb_lower"] = indicators.bollinger(
+            closes, BOLLINGER_PERIOD, BOLLINGER_STD_DEV)
+        series["atr"] = indicators.atr(highs, lows, closes, ATR_PERIOD)
+        self.columns = {name: _as_list(values) for name, values in series.items()}
+
+    def snapshot(self, i):
+        values = {name: column[i] for name, column in self.columns.items()}
+        prev = {name: column[i - 1] for name, column in self.columns.items()} if i else dict.fromkeys(values)
+        return values, prev
+
+
+class HigherTimeframe:
+    """Confirmation timeframe replayed from the base bars with IndicatorEngine peeks"""
+
+    def __init__(self, minutes, history):
+        self.minutes = minutes
+        self.seconds = minutes * 60
+        self.engine = IndicatorEngine(history=history)
+        self.bucket = None
+        self.bar = None
+
+    def step(self, t, o, h, l, c):
+        bucket = t // self.seconds * self.seconds
+        if bucket != self.bucket:
+            self.bucket = bucket
+            self.bar = (bucket, o, h, l, c)
+            self.engine.replay(self.bar, new_bar=True)
+        else:
+            _, first_open, high, low, _ = self.bar
+            self.bar = (bucket, first_open, max(high, h), min(low, l), c)
+            self.engine.replay(self.bar, new_bar=False)
+
+
+# ========== Deciders ==========
+
+class RuleDecider:
+    """Deterministic decider: the side with more signals wins, 待机 on a tie"""
+
+    name = 'rule'
+
+    def decide(self, symbol, market_data, indicators, position_count):
+        bullish = bearish = 0
+        for signal in indicators.get('signals', []):
+            if '做多' in signal or '向上' in signal or '反弹' in signal:
+                bullish += 1
+            elif '做空' in signal or '向下' in signal or '回落' in signal:
+                bearish += 1
+        for higher in indicators.get('higher_timeframes') or []:
+            # Confirmation timeframes veto trades against their trend
+            if higher['trend'] == '上涨':
+                bearish = 0
+            elif higher['trend'] == '下跌':
+                bullish = 0
+        if bullish > bearish:
+            return "做多"
+        if bearish > bullish:
+            return "做空"
+        return "待机"
+
+    def stats(self):
+        return {}
+
+
+class LLMDecider:
+    """The agent's prompt and model call, cached per quantized market state
+
+    The cache never expires during a run, so every distinct fingerprint costs
+    at most one generation; failed calls are not cached.
+    """
+
+    name = 'llm'
+
+    def __init__(self, agent, cache=None):
+        self.agent = agent
+        self.cache = cache or DecisionCache(max_entries=100000, ttl=float('inf'))
+        self.calls = 0
+        self.failures = 0
+
+    def decide(self, symbol, market_data, indicators, position_count):
+        key = fingerprint(indicators, None, position_count, self.agent._decision_config_hash(symbol))
+        direction = self.cache.get(key)
+        if direction is not None:
+            return direction
+        analysis = self.agent.analysis_request(symbol, market_data, indicators, None, key)
+        command = self.agent.complete_analysis(analysis)
+        self.calls += 1
+        if not analysis.get('answered'):
+            self.failures += 1
+            return "待机"
+        direction = command[:2]
+        self.cache.put(key, direction)
+        return direction
+
+    def stats(self):
+        return {'llm_calls': self.calls, 'llm_failures': self.failures,
+                'cache_hit_rate': round(self.cache.hit_rate, 4)}
+
+
+# ========== Simulation ==========
+
+class Position:
+    __slots__ = ('direction', 'entry_time', 'entry_price', 'sl', 'tp', 'volume')
+
+    def __init__(self, direction, entry_time, entry_price, sl, tp, volume):
+        self.direction = direction
+        self.entry_time = entry_time
+        self.entry_price = entry_price
+        self.sl = sl
+        self.tp = tp
+        self.volume = volume
+
+
+class Backtest:
+    """One replay of rates for the agent's current strategy configuration
+
+    Bars are bid OHLC as MT5 stores them; asks are bid + spread points.
+    Decisions are taken at a bar's close and fill at the next bar's open.
+    When both SL and TP fall inside one bar the SL is assumed to hit first.
+    Spread, session, drawdown, daily loss and max-position rules are
+    enforced; trailing stops and partial closes are not simulated.
+    """
+
+    def __init__(self, agent, rates, decider, symbol=None, timeframe=None, digits=5, point=None,
+                 contract_size=1.0, initial_balance=INITIAL_BALANCE, warmup=BACKTEST_WARMUP):
+        self.agent = agent
+        self.rates = rates
+        self.decider = decider
+        self.symbol = symbol or agent.trading_pair
+        self.timeframe = timeframe or agent.timeframe
+        self.digits = digits
+        self.point = point if point is not None else 10 ** -digits
+        self.contract_size = contract_size
+        self.volume = agent.lot_size
+        self.initial_balance = initial_balance
+        self.warmup = max(warmup, SIGNAL_WINDOW_BARS)
+        self.trades = []
+        self.gates = {}
+        self.decisions = {}
+        self.equity = np.full(len(rates), np.nan)
+
+    # ========== Fills ==========
+
+    def _close(self, position, t, bid, reason):
+        ask = bid + self.spread_price
+        if position.direction == "做多":
+            exit_price, diff = bid, bid - position.entry_price
+        else:
+            exit_price, diff = ask, position.entry_price - ask
+        profit = diff * position.volume * self.contract_size
+        self.balance += profit
+        self.trades.append({
+            'direction': position.direction,
+            'entry_time': position.entry_time,
+            'entry_price': position.entry_price,
+            'sl': position.sl,
+            'tp': position.tp,
+            'exit_time': t,
+            'exit_price': round(exit_price, self.digits),
+            'reason': reason,
+            'profit': round(profit, 2),
+        })
+
+    def _check_exits(self, t, o, h, l):
+        """Close positions whose SL/TP lies inside this bar's range"""
+        spread = self.spread_price
+        still_open = []
+        for p in self.positions:
+            if p.direction == "做多":
+                # Long exits trade at the bid
+                if p.sl is not None and l <= p.sl:
+                    self._close(p, t, min(o, p.sl), 'sl')
+                elif p.tp is not None and h >= p.tp:
+                    self._close(p, t, max(o, p.tp), 'tp')
+                else:
+                    still_open.append(p)
+            else:
+                # Short exits trade at the ask
+                if p.sl is not None and h + spread >= p.sl:
+                    self._close(p, t, max(o + spread, p.sl) - spread, 'sl')
+                elif p.tp is not None and l + spread <= p.tp:
+                    self._close(p, t, min(o + spread, p.tp) - spread, 'tp')
+                else:
+                    still_open.append(p)
+        self.positions = still_open
+
+    def _mark(self, close):
+        equity = self.balance
+        ask = close + self.spread_price
+        for p in self.positions:
+            diff = close - p.entry_price if p.direction == "做多" else p.entry_price - ask
+            equity += diff * p.volume * self.contract_size
+        return equity
+
+    def _close_all(self, t, close, reason):
+        for p in self.positions:
+            self._close(p, t, close, reason)
+        self.positions = []
+
+    # ========== Risk rules ==========
+
+    def _check_halt(self, t, close, equity):
+        agent = self.agent
+        day = t // 86400
+        if day != self.day:
+            self.day = day
+            self.day_start_balance = self.balance
+            self.halt_reason = None
+        self.peak_equity = max(self.peak_equity, equity)
+        if self.halt_reason:
+            return
+        limit = getattr(agent, 'max_drawdown_percent', None)
+        if limit is not None and (self.peak_equity - equity) / self.peak_equity * 100 >= limit:
+            self.halt_reason = 'max_drawdown'
+        daily = getattr(agent, 'daily_max_loss', None)
+        if daily is not None and self.day_start_balance - equity >= daily:
+            self.halt_reason = 'daily_loss'
+        if self.halt_reason:
+            self._close_all(t, close, self.halt_reason)
+
+    def _gate(self, t, spread):
+        """Entry gates in the order of AutoGPTTrading._pre_llm_gate"""
+        risk = self.agent.risk_engine
+        if risk.spread_block(spread):
+            return 'spread_limit'
+        if risk.session_block(datetime.fromtimestamp(t, tz=timezone.utc)):
+            return 'trading_session'
+        if self.halt_reason:
+            return 'risk_halt'
+        if len(self.positions) >= self.agent.max_positions:
+            return 'max_positions'
+        return None
+
+    # ========== Replay ==========
+
+    def run(self):
+        agent = self.agent
+        rates = self.rates
+        n = len(rates)
+        started = time.perf_counter()
+        times = rates['time'].tolist()
+        opens, highs, lows, closes = (rates[k].tolist() for k in ('open', 'high', 'low', 'close'))
+        spreads = rates['spread'].tolist()
+        series = IndicatorSeries(rates)
+        self.candle_count = agent.indicators_config.get('candle_count', 200)
+        higher = [HigherTimeframe(m, self.candle_count) for m in agent.confirm_timeframes
+                  if m > self.timeframe and m % self.timeframe == 0]
+        indicators_enabled = agent.indicators_config.get('enabled', True)
+
+        self.balance = self.peak_equity = self.day_start_balance = self.initial_balance
+        self.positions = []
+        self.day = None
+        self.halt_reason = None
+        pending = None
+
+        for i in range(n):
+            t, o, h, l, c = times[i], opens[i], highs[i], lows[i], closes[i]
+            self.spread_price = spreads[i] * self.point
+            for tf in higher:
+                tf.step(t, o, h, l, c)
+
+            if pending is not None:
+                direction, sl, tp = pending
+                entry = o + self.spread_price if direction == "做多" else o
+                self.positions.append(Position(direction, t, round(entry, self.digits), sl, tp, self.volume))
+                pending = None
+            self._check_exits(t, o, h, l)
+            self._check_halt(t, c, self._mark(c))
+            self.equity[i] = self._mark(c)
+
+            if i < self.warmup or i == n - 1:
+                continue
+            gate = self._gate(t, spreads[i])
+            if gate is None:
+                pending = self._decide(i, t, c, spreads[i], series, higher, indicators_enabled)
+            else:
+                self.gates[gate] = self.gates.get(gate, 0) + 1
+
+        if n:
+            self._close_all(times[-1], closes[-1], 'end')
+            self.equity[-1] = self.balance
+        self.elapsed = time.perf_counter() - started
+        return self
+
+    def _decide(self, i, t, close, spread, series, higher, indicators_enabled):
+        """Signal gate and decider for bar i; returns a pending (direction, sl, tp) or None"""
+        agent = self.agent
+        ask = round(close + spread * self.point, self.digits)
+        market_data = {'symbol': self.symbol, 'price': ask, 'bid': close, 'ask': ask,
+                       'digits': self.digits, 'point': self.point, 'spread': spread, 'source': 'backtest'}
+        indicators = None
+        if indicators_enabled:
+            values, prev = series.snapshot(i)
+            start = max(i - SIGNAL_WINDOW_BARS, 0)
+            rates = self.rates[start:i + 1]
+            bars = list(zip(rates['time'].tolist(), rates['open'].tolist(), rates['high'].tolist(),
+                            rates['low'].tolist(), rates['close'].tolist()))
+            higher_timeframes = [agent.higher_timeframe_entry(tf.minutes, tf.engine) for tf in higher]
+            indicators = agent.build_indicators(values, prev, bars, self.timeframe,
+                                                min(i + 1, self.candle_count), higher_timeframes)
+        gate = agent._signal_gate(indicators)
+        if gate:
+            self.gates[gate[0]] = self.gates.get(gate[0], 0) + 1
+            return None
+        self.gates['passed'] = self.gates.get('passed', 0) + 1
+
+        direction = self.decider.decide(self.symbol, market_data, indicators or {}, len(self.positions))
+        self.decisions[direction] = self.decisions.get(direction, 0) + 1
+        if direction not in ("做多", "做空"):
+            return None
+        long_sl, long_tp, short_sl, short_tp = agent._sl_tp_prices(ask, self.digits)
+        if direction == "做多":
+            return direction, long_sl, long_tp
+        return direction, short_sl, short_tp
+
+    # ========== Results ==========
+
+    def summary(self):
+        profits = np.array([trade['profit'] for trade in self.trades])
+        wins = profits[profits > 0]
+        losses = profits[profits < 0]
+        equity = self.equity[~np.isnan(self.equity)]
+        peaks = np.maximum.accumulate(equity) if len(equity) else equity
+        drawdown = float(((peaks - equity) / peaks).max() * 100) if len(equity) else 0.0
+        return {
+            'symbol': self.symbol,
+            'timeframe': f"{self.timeframe}分钟",
+            'decider': self.decider.name,
+            'bars': len(self.rates),
+            'from': _format_time(self.rates['time'][0]) if len(self.rates) else None,
+            'to': _format_time(self.rates['time'][-1]) if len(self.rates) else None,
+            'trades': len(self.trades),
+            'win_rate': round(len(wins) / len(profits), 4) if len(profits) else None,
+            'net_profit': round(float(profits.sum()), 2),
+            'profit_factor': round(float(wins.sum() / -losses.sum()), 3) if len(losses) else None,
+            'max_drawdown_percent': round(drawdown, 3),
+            'final_balance': round(self.balance, 2),
+            'exits': {reason: sum(1 for t in self.trades if t['reason'] == reason)
+                      for reason in ('tp', 'sl', 'max_drawdown', 'daily_loss', 'end')},
+            'decisions': self.decisions,
+            'gates': self.gates,
+            'decider_stats': self.decider.stats(),
+            'elapsed_seconds': round(self.elapsed, 2),
+            'bars_per_second': round(len(self.rates) / self.elapsed) if self.elapsed else None,
+        }
+
+    def save(self, directory=BACKTEST_DIR):
+        """Write trades.csv and equity.csv into a new run directory; returns its path"""
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(directory, f"{self.symbol}_{self.timeframe}m_{self.decider.name}_{stamp}")
+        os.makedirs(path, exist_ok=True)
+        fields = ['direction', 'entry_time', 'entry_price', 'sl', 'tp', 'exit_time', 'exit_price',
+                  'reason', 'profit']
+        with open(os.path.join(path, 'trades.csv'), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for trade in self.trades:
+                row = dict(trade)
+                row['entry_time'] = _format_time(row['entry_time'])
+                row['exit_time'] = _format_time(row['exit_time'])
+                writer.writerow(row)
+        with open(os.path.join(path, 'equity.csv'), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['time', 'equity'])
+            for t, value in zip(self.rates['time'].tolist(), self.equity.tolist()):
+                if not math.isnan(value):
+                    writer.writerow([_format_time(t), round(value, 2)])
+        return path
+
+
+def _format_time(t):
+    return datetime.fromtimestamp(int(t), tz=timezone.utc).strftime("%Y.%m.%d %H:%M")
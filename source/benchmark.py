@@ -0,0 +1,404 @@
+"""
+Benchmark - Stage latency of the scan, decision and execution path
+Runs the real agent and executor code in one process against the simulated
+MT5 terminal (mock_mt5) and the Ollama stand-in (mock_ollama), so results
+depend on the code and the configured backend latencies, not on the market.
+Each round times search_market_data, get_mt5_candles_and_indicators,
+get_mt5_level2_data, the prompt build, call_ollama (plain and streamed)
+and a command's trip send_command_to_executor -> monitor_commands pickup ->
+order done. The web UI's /get_logs and /test_data are load-tested with
+concurrent clients. Results are written as JSON and compared with a stored
+baseline; a regression makes the exit code 1.
+
+Usage:
+    python benchmark.py [--rounds 30] [--mt5-latency-ms 1] [--ttft-ms 300] [--save-baseline]
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import mock_mt5
+import mock_ollama
+
+BENCHMARK_DIR = "E:\\TradingSystem\\benchmarks"
+BASELINE_FILE = "E:\\TradingSystem\\benchmarks\\baseline.json"
+
+# Ports of the in-process backends (kept off the live Ollama and executor ports)
+BENCH_OLLAMA_PORT = 11534
+BENCH_COMMAND_PORT = 5155
+
+BENCH_SYMBOL = "EURUSD"
+BENCH_ROUNDS = 30
+
+# Seconds to wait for the executor to pick up / finish one command
+COMMAND_TIMEOUT = 5
+
+HTTP_REQUESTS = 300
+HTTP_CONCURRENCY = 8
+HTTP_PATHS = ("/get_logs", "/test_data?symbol={symbol}")
+
+# A p50 latency this much above the baseline (and at least REGRESSION_MIN_MS) is a regression;
+# likewise a throughput this much below it
+REGRESSION_TOLERANCE = 0.25
+REGRESSION_MIN_MS = 1.0
+
+
+def summarize(samples):
+    """Latency summary of a list of milliseconds"""
+    if not samples:
+        return {'count': 0}
+    values = np.asarray(samples, dtype=float)
+    return {
+        'count': len(values),
+        'avg_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+class StageTimer:
+    """Milliseconds per named stage"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, elapsed_ms):
+        self.samples.setdefault(stage, []).append(elapsed_ms)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        yield
+        self.add(stage, (time.perf_counter() - start) * 1000)
+
+    def summary(self):
+        return {stage: summarize(samples) for stage, samples in self.samples.items()}
+
+
+# ========== Backends ==========
+
+def start_backends(options):
+    """Simulated MT5 and Ollama; must run before the agent modules are imported"""
+    mock_mt5.install(latency_ms=options.mt5_latency_ms, seed=options.seed)
+    server, ollama = mock_ollama.start_server(
+        options.ollama_port, responder=mock_ollama.Responder(seed=options.seed),
+        ttft_ms=options.ttft_ms, tokens_per_sec=options.tokens_per_sec, parallel=options.parallel)
+
+    import ollama_client
+    # Every get_client() user (agent, web UI) talks to the stand-in
+    ollama_client._client = ollama_client.OllamaClient(host=f"http://127.0.0.1:{options.ollama_port}")
+    return server, ollama
+
+
+class Pipeline:
+    """Agent and executor wired through a private command port and file"""
+
+    def __init__(self, symbol, command_port=BENCH_COMMAND_PORT):
+        from autogpt_trading import AutoGPTTrading
+        from candle_store import CandleStore
+        from command_channel import CommandReceiver, CommandSender
+        from executor_agent import ExecutorAgent
+
+        self.symbol = symbol
+        # Everything the pair writes stays in a private directory: no live
+        # candle store, logs, commands file, web log endpoint or flag thread
+        self.workdir = tempfile.mkdtemp(prefix='benchmark_')
+        self.commands_file = os.path.join(self.workdir, 'commands.txt')
+        self.picked = {}  # command -> perf_counter at monitor_commands pickup
+        self.done = {}    # seq -> perf_counter of the executor's done reply
+        self.done_event = threading.Condition()
+
+        agent = AutoGPTTrading(log_file=os.path.join(self.workdir, 'autogpt.log'), web_url=None,
+                               commands_file=self.commands_file,
+                               candle_store=CandleStore(os.path.join(self.workdir, 'candles')),
+                               watch_flags=False)
+        agent.mode = "discussion"
+        agent.trading_pair = symbol
+        agent.long_strategy = agent.long_strategy or "均线金叉做多"
+        agent.short_strategy = agent.short_strategy or "均线死叉做空"
+        agent.long_sl_percent = agent.long_sl_percent or 0.5
+        agent.long_tp_percent = agent.long_tp_percent or 1.0
+        agent.short_sl_percent = agent.short_sl_percent or 0.5
+        agent.short_tp_percent = agent.short_tp_percent or 1.0
+        agent.llm_store.configure('off')  # every round must reach the model
+        agent.command_channel = CommandSender(self.commands_file, port=command_port, on_done=self._on_done)
+        self.agent = agent
+
+        executor = ExecutorAgent(log_file=os.path.join(self.workdir, 'executor.log'), web_url=None,
+                                 commands_file=self.commands_file,
+                                 templates_dir=os.path.join(self.workdir, 'templates'))
+        executor.execution_mode = "api"
+        executor.trading_pair = symbol
+        executor.load_trading_config = lambda: None  # keep the benchmark settings
+        executor.command_receiver = CommandReceiver(self.commands_file, executor.log, port=command_port)
+        execute_command = executor.execute_command
+
+        def picked_up(command, *args, **kwargs):
+            self.picked[command] = time.perf_counter()
+            return execute_command(command, *args, **kwargs)
+
+        executor.execute_command = picked_up
+        self.executor = executor
+        threading.Thread(target=executor.monitor_commands, daemon=True).start()
+        time.sleep(0.2)  # let the receiver bind its port
+
+    def _on_done(self, reply):
+        with self.done_event:
+            self.done[reply.get('seq')] = time.perf_counter()
+            self.done_event.notify_all()
+
+    def _wait(self, check):
+        deadline = time.time() + COMMAND_TIMEOUT
+        with self.done_event:
+            while not check():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.done_event.wait(min(remaining, 0.01))
+        return True
+
+    def scan(self, timer):
+        """Data, prompt and model stages of one analysis; returns (market_data, analysis)"""
+        agent, symbol = self.agent, self.symbol
+        with timer.time('search_market_data'):
+            market_data = agent.search_market_data(symbol)
+        with timer.time('get_mt5_candles_and_indicators'):
+            indicators = agent.get_mt5_candles_and_indicators(
+                symbol, timeframe_minutes=agent.indicators_config.get('timeframe', 1),
+                count=agent.indicators_config.get('candle_count', 200))
+        with timer.time('get_mt5_level2_data'):
+            level2_data = agent.get_mt5_level2_data(symbol)
+        with timer.time('prompt_build'):
+            analysis = agent.analysis_request(symbol, market_data, indicators, level2_data, None)
+        with timer.time('call_ollama'):
+            agent.call_ollama(analysis['prompt'], analysis['system_prompt'])
+        normalize = lambda line: agent._normalize_decision_line(line, *analysis['levels'])
+        with timer.time('call_ollama_until'):
+            agent.call_ollama_until(analysis['prompt'], analysis['system_prompt'], normalize)
+        return market_data, analysis
+
+    def execute(self, timer, market_data, analysis, is_buy):
+        """One command from send_command_to_executor to the executor's done reply"""
+        agent = self.agent
+        long_sl, long_tp, short_sl, short_tp = analysis['levels']
+        long_sl_price, long_tp_price, short_sl_price, short_tp_price = analysis['prices']
+        if is_buy:
+            command = agent._command_for_direction("做多", long_sl_price, long_tp_price, long_sl, long_tp)
+        else:
+            command = agent._command_for_direction("做空", short_sl_price, short_tp_price, short_sl, short_tp)
+        agent._scan.current_price = market_data.get('price', 0)
+        agent._scan.current_digits = market_data.get('digits', 5)
+
+        start = time.perf_counter()
+        agent.send_command_to_executor(command, self.symbol)
+        sent = time.perf_counter()
+        timer.add('send_command_to_executor', (sent - start) * 1000)
+        seq = agent.command_channel.seq
+        if not self._wait(lambda: command in self.picked):
+            return False
+        picked = self.picked.pop(command)
+        timer.add('monitor_commands_pickup', (picked - start) * 1000)
+        if not self._wait(lambda: seq in self.done):
+            return False
+        done = self.done.pop(seq)
+        timer.add('order_execution', (done - picked) * 1000)
+        timer.add('command_to_done', (done - start) * 1000)
+        return True
+
+    def close(self):
+        # stop() would save config.json with the benchmark settings
+        self.agent.running = False
+        self.executor.running = False
+        self.executor.command_receiver.stop()
+
+
+def run_pipeline(options):
+    timer = StageTimer()
+    pipeline = Pipeline(options.symbol)
+    failures = 0
+    try:
+        pipeline.scan(timer)  # warm-up: candle store seed, symbol cache, Level 2 subscription
+        timer.samples.clear()
+        for i in range(options.rounds):
+            market_data, analysis = pipeline.scan(timer)
+            if not pipeline.execute(timer, market_data, analysis, is_buy=i % 2 == 0):
+                failures += 1
+    finally:
+        pipeline.close()
+    return timer.summary(), failures
+
+
+# ========== Web UI ==========
+
+def run_http(options):
+    """Throughput of the web UI endpoints under concurrent clients"""
+    try:
+        import requests
+        import web_interface
+        from werkzeug.serving import make_server
+    except ImportError as e:
+        return {'skipped': str(e)}
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no access log line per request
+
+    web_interface.chat_history.extend(
+        {'type': 'log', 'message': f"benchmark log line {i}", 'timestamp': datetime.now().isoformat()}
+        for i in range(50))
+    server = make_server('127.0.0.1', 0, web_interface.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    local = threading.local()
+
+    def fetch(url):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok = session.get(url, timeout=30).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return ok, (time.perf_counter() - start) * 1000
+
+    results = {}
+    try:
+        for path in HTTP_PATHS:
+            path = path.format(symbol=options.symbol)
+            url = base + path
+            fetch(url)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options.http_concurrency) as pool:
+                outcomes = list(pool.map(fetch, [url] * options.http_requests))
+            elapsed = time.perf_counter() - start
+            result = summarize([ms for _, ms in outcomes])
+            result['errors'] = sum(not ok for ok, _ in outcomes)
+            result['requests_per_sec'] = round(len(outcomes) / elapsed, 1)
+            results[path.split('?')[0]] = result
+    finally:
+        server.shutdown()
+    return results
+
+
+# ========== Baseline ==========
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Metrics that got worse than the baseline by more than tolerance"""
+    regressions = []
+    for stage, current in results.get('stages', {}).items():
+        base = baseline.get('stages', {}).get(stage, {})
+        if 'p50_ms' not in current or 'p50_ms' not in base:
+            continue
+        if (current['p50_ms'] > base['p50_ms'] * (1 + tolerance)
+                and current['p50_ms'] - base['p50_ms'] >= REGRESSION_MIN_MS):
+            regressions.append({'metric': f"{stage}.p50_ms", 'baseline': base['p50_ms'],
+                                'current': current['p50_ms']})
+    for path, current in results.get('http', {}).items():
+        base = baseline.get('http', {}).get(path, {})
+        if not isinstance(current, dict) or 'requests_per_sec' not in current or 'requests_per_sec' not in base:
+            continue
+        if current['requests_per_sec'] < base['requests_per_sec'] * (1 - tolerance):
+            regressions.append({'metric': f"{path}.requests_per_sec", 'baseline': base['requests_per_sec'],
+                                'current': current['requests_per_sec']})
+    for regression in regressions:
+        regression['change'] = (round(regression['current'] / regression['baseline'] - 1, 3)
+                                if regression['baseline'] else None)
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the trading pipeline against simulated backends")
+    parser.add_argument('--rounds', type=int, default=BENCH_ROUNDS)
+    parser.add_argument('--symbol', default=BENCH_SYMBOL)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mt5-latency-ms', type=float, default=1.0, help="simulated delay per MT5 call")
+    parser.add_argument('--ttft-ms', type=float, default=mock_ollama.MOCK_TTFT_MS)
+    parser.add_argument('--tokens-per-sec', type=float, default=mock_ollama.MOCK_TOKENS_PER_SEC)
+    parser.add_argument('--parallel', type=int, default=mock_ollama.MOCK_PARALLEL)
+    parser.add_argument('--ollama-port', type=int, default=BENCH_OLLAMA_PORT)
+    parser.add_argument('--http-requests', type=int, default=HTTP_REQUESTS)
+    parser.add_argument('--http-concurrency', type=int, default=HTTP_CONCURRENCY)
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--output', help="results file (default: a new file in BENCHMARK_DIR)")
+    parser.add_argument('--verbose', action='store_true', help="show the agents' log output")
+    options = parser.parse_args()
+
+    config = {key: getattr(options, key) for key in
+              ('rounds', 'symbol', 'seed', 'mt5_latency_ms', 'ttft_ms', 'tokens_per_sec', 'parallel',
+               'http_requests', 'http_concurrency')}
+    server, ollama = start_backends(options)
+    started = time.perf_counter()
+    quiet = contextlib.nullcontext() if options.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with quiet:
+        stages, failures = run_pipeline(options)
+        http = {} if options.skip_http else run_http(options)
+    server.shutdown()
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': config,
+        'elapsed_seconds': round(time.perf_counter() - started, 2),
+        'stages': stages,
+        'command_failures': failures,
+        'http': http,
+        'backends': {'mt5': mock_mt5.stats(), 'ollama': ollama.stats()},
+    }
+
+    baseline = load_baseline(options.baseline)
+    if baseline is not None:
+        if baseline.get('config') != config:
+            print(f"⚠️ 基准配置不同，比较仅供参考: {json.dumps(baseline.get('config'), ensure_ascii=False)}")
+        results['regressions'] = compare(results, baseline, options.tolerance)
+
+    output = options.output or os.path.join(
+        BENCHMARK_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    write_json(output, results)
+    if options.save_baseline:
+        write_json(options.baseline, {key: value for key, value in results.items() if key != 'regressions'})
+
+    print(json.dumps({key: results[key] for key in ('stages', 'http', 'command_failures')},
+                     indent=2, ensure_ascii=False))
+    print(f"结果已保存: {output}")
+    regressions = results.get('regressions')
+    if regressions:
+        for r in regressions:
+            print(f"❌ 性能回退 {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.1%})")
+        return 1
+    if baseline is None:
+        print("没有基准结果可比较（用 --save-baseline 保存）")
+    else:
+        print("✅ 无性能回退")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Candle Store - Append-only local history of MT5 bars per symbol/timeframe
+Closed bars are written once to a compact binary file of MT5 rate records and
+kept in a growable in-memory array. Each sync only asks the terminal for the
+bars newer than the last stored one, and slices are served as views of that
+array, so warm restarts and long look-backs never re-download history.
+"""
+
+import os
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+CANDLE_DIR = "E:\\TradingSystem\\candles"
+
+# Record layout of copy_rates_* results (60 bytes per bar)
+RATE_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+
+# Bar times are trade server time encoded as UTC; the range end is pushed
+# ahead so servers east of UTC still return their forming bar
+SYNC_LOOKAHEAD = timedelta(days=1)
+
+# Initial in-memory capacity, doubled whenever it fills up
+INITIAL_CAPACITY = 1024
+
+
+def _as_rates(rates):
+    """Copy any copy_rates_* result into a RATE_DTYPE array"""
+    src = np.asarray(rates)
+    out = np.zeros(len(src), dtype=RATE_DTYPE)
+    names = src.dtype.names or ()
+    for name in RATE_DTYPE.names:
+        if name in names:
+            out[name] = src[name]
+    return out
+
+
+class CandleSeries:
+    """Closed bars of one symbol/timeframe plus the bar that is still forming
+
+    Only bars older than the newest one returned by the terminal are treated
+    as closed and persisted. In read-only mode (used by the web interface,
+    which runs in its own process) new bars are picked up from the file the
+    trading agent writes and from the terminal, but nothing is written.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.persist = True
+        self.lock = threading.Lock()
+        self._buf = np.zeros(INITIAL_CAPACITY, dtype=RATE_DTYPE)
+        self._n = 0
+        self._disk_records = 0
+        self.forming = None
+        self.syncs = 0
+        self.backfills = 0
+        self.bars_fetched = 0
+        self._load()
+
+    @property
+    def count(self):
+        return self._n
+
+    @property
+    def last_time(self):
+        return int(self._buf['time'][self._n - 1]) if self._n else None
+
+    def _load(self):
+        """Read whole records from disk, dropping a torn tail or out-of-order bars"""
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        whole = size // RATE_DTYPE.itemsize
+        if whole * RATE_DTYPE.itemsize != size and not self.read_only:
+            with open(self.path, 'r+b') as f:
+                f.truncate(whole * RATE_DTYPE.itemsize)
+        self._read_from_disk(whole)
+
+    def _read_from_disk(self, whole=None):
+        if whole is None:
+            if not os.path.exists(self.path):
+                return
+            whole = os.path.getsize(self.path) // RATE_DTYPE.itemsize
+        if whole <= self._disk_records:
+            return
+        records = np.fromfile(self.path, dtype=RATE_DTYPE, count=whole - self._disk_records,
+                              offset=self._disk_records * RATE_DTYPE.itemsize)
+        self._disk_records = whole
+        self._append_memory(records)
+
+    def _append_memory(self, records):
+        """Append bars strictly newer than the last stored one; returns them"""
+        if len(records) == 0:
+            return records
+        times = records['time']
+        last = self.last_time
+        if last is not None:
+            records = records[times > last]
+            times = records['time']
+        if len(records) > 1 and np.any(np.diff(times) <= 0):
+            # Keep the strictly increasing prefix only
+            bad = int(np.argmax(np.diff(times) <= 0))
+            records = records[:bad + 1]
+        need = self._n + len(records)
+        if need > len(self._buf):
+            capacity = len(self._buf)
+            while capacity < need:
+                capacity *= 2
+            grown = np.zeros(capacity, dtype=RATE_DTYPE)
+            grown[:self._n] = self._buf[:self._n]
+            self._buf = grown
+        self._buf[self._n:need] = records
+        self._n = need
+        return records
+
+    def _append(self, records):
+        added = self._append_memory(records)
+        if len(added) == 0 or self.read_only or not self.persist:
+            return added
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.write(added.tobytes())
+            self._disk_records += len(added)
+        except OSError:
+            # Keep serving from memory; the next process start backfills again
+            self.persist = False
+        return added
+
+    def sync(self, mt5, symbol, timeframe, backfill):
+        """Fetch bars newer than the last stored one; returns False on no data"""
+        with self.lock:
+            if self.read_only:
+                self._read_from_disk()
+            rates = None
+            last = self.last_time
+            if last is not None:
+                date_from = datetime.fromtimestamp(last, tz=timezone.utc)
+                rates = mt5.copy_rates_range(symbol, timeframe, date_from,
+                                             datetime.now(timezone.utc) + SYNC_LOOKAHEAD)
+            if rates is None or len(rates) == 0:
+                # Empty store, or the terminal could not serve the range
+                rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, backfill)
+                self.backfills += 1
+            if rates is None or len(rates) == 0:
+                return self.forming is not None
+            rates = _as_rates(rates)
+            self.syncs += 1
+            self.bars_fetched += len(rates)
+            self._append(rates[:-1])
+            self.forming = rates[-1:]
+            return True
+
+    def _closed_end(self):
+        """Number of stored bars older than the forming bar"""
+        if self.forming is None:
+            return self._n
+        return int(np.searchsorted(self._buf['time'][:self._n], self.forming['time'][0], side='left'))
+
+    def closed(self, count=None):
+        """View of the last count closed bars (all of them when count is None)"""
+        end = self._closed_end()
+        start = 0 if count is None else max(end - count, 0)
+        return self._buf[start:end]
+
+    def since(self, time):
+        """Closed bars from time onwards followed by the forming bar"""
+        end = self._closed_end()
+        start = int(np.searchsorted(self._buf['time'][:end], time, side='left'))
+        return np.concatenate((self._buf[start:end], self.forming))
+
+    def window(self, count):
+        """The last count bars including the forming one, like copy_rates_from_pos"""
+        return np.concatenate((self.closed(count - 1), self.forming))
+
+
+class CandleStore:
+    """Registry of CandleSeries keyed by (symbol, timeframe)"""
+
+    def __init__(self, directory=CANDLE_DIR, read_only=False):
+        self.directory = directory
+        self.read_only = read_only
+        self.series_map = {}
+        self.lock = threading.Lock()
+
+    def path(self, symbol, timeframe):
+        safe = re.sub(r'[^A-Za-z0-9._-]', '_', symbol)
+        return os.path.join(self.directory, f"{safe}_{timeframe}.bin")
+
+    def series(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        with self.lock:
+            series = self.series_map.get(key)
+            if series is None:
+                series = CandleSeries(self.path(symbol, timeframe), read_only=self.read_only)
+                self.series_map[key] = series
+            return series
+
+    def stats(self):
+        with self.lock:
+            items = list(self.series_map.items())
+        return {
+            f"{symbol}/{timeframe}": {
+                'bars': series.count,
+                'syncs': series.syncs,
+                'backfills': series.backfills,
+                'bars_fetched': series.bars_fetched,
+                'persisted': series.persist and not series.read_only,
+            }
+            for (symbol, timeframe), series in items
+        }
@@ -0,0 +1,344 @@
+"""
+Command Channel - Low-latency command delivery from AutoGPTTrading to ExecutorAgent
+Commands travel as JSON lines over a localhost TCP socket with sequence
+numbers and acks. If the executor's socket cannot be reached the command is
+written to commands.txt with an atomic rename; the executor watches the file
+with a change notification (Windows) instead of polling it every second.
+"""
+
+import json
+import os
+import queue
+import re
+import socket
+import tempfile
+import threading
+import time
+
+from latency import LatencyHistogram
+
+# Try to import win32 change notifications for the file fallback
+try:
+    import win32con
+    import win32event
+    import win32file
+    WIN32_NOTIFY_AVAILABLE = True
+except ImportError:
+    WIN32_NOTIFY_AVAILABLE = False
+
+COMMAND_HOST = "127.0.0.1"
+COMMAND_PORT = 5055
+CONNECT_TIMEOUT = 0.2    # seconds
+ACK_TIMEOUT = 0.5        # seconds to wait for the executor's receipt ack
+FILE_POLL_INTERVAL = 0.05  # seconds, only used when change notifications are unavailable
+REPLACE_RETRIES = 5      # os.replace can fail while the reader has the file open (Windows)
+
+_SEQ = re.compile(r'@seq=(\d+)')
+_SENT = re.compile(r'@sent=([\d.]+)')
+_SIGNAL = re.compile(r'@signal=([\d.]+)')
+
+
+def write_atomic(path, text):
+    """Write a file via temp file + rename so readers never see a partial write"""
+    # A unique temp file per call: the sender and the executor both write commands.txt
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        for attempt in range(REPLACE_RETRIES):
+            try:
+                os.replace(tmp_path, path)
+                return
+            except PermissionError:
+                if attempt == REPLACE_RETRIES - 1:
+                    raise
+                time.sleep(0.01)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class CommandSender:
+    """Agent side: send commands with sequence numbers, fall back to the file"""
+
+    def __init__(self, commands_file, host=COMMAND_HOST, port=COMMAND_PORT, on_done=None):
+        self.commands_file = commands_file
+        self.host = host
+        self.port = port
+        self.on_done = on_done
+        # Millisecond start value keeps sequence numbers increasing across restarts
+        self.seq = int(time.time() * 1000)
+        self.sock = None
+        self.lock = threading.Lock()
+        self.pending = {}  # seq -> threading.Event set by the receipt ack
+        self.sent_socket = 0
+        self.sent_file = 0
+        self.ack_latency = LatencyHistogram()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(None)
+        self.sock = sock
+        threading.Thread(target=self._read_replies, args=(sock,), daemon=True).start()
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _read_replies(self, sock):
+        try:
+            for raw in sock.makefile('r', encoding='utf-8'):
+                reply = json.loads(raw)
+                if reply.get('status') == 'done':
+                    if self.on_done:
+                        self.on_done(reply)
+                    continue
+                event = self.pending.get(reply.get('seq'))
+                if event is not None:
+                    event.set()
+        except (OSError, ValueError):
+            pass
+
+    def send(self, command, price_info, signal_time=None):
+        """Deliver a command; returns (seq, channel) with channel 'socket' or 'file'"""
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            sent_at = time.time()
+            message = {'seq': seq, 'command': command, 'price_info': price_info,
+                       'sent': sent_at, 'signal': signal_time or sent_at}
+            event = threading.Event()
+            self.pending[seq] = event
+            try:
+                if self.sock is None:
+                    self._connect()
+                self.sock.sendall((json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8'))
+                if event.wait(ACK_TIMEOUT):
+                    self.ack_latency.observe((time.time() - sent_at) * 1000)
+                    self.sent_socket += 1
+                    return seq, 'socket'
+                self._close()
+            except OSError:
+                self._close()
+            finally:
+                self.pending.pop(seq, None)
+            # Executor not listening (or no ack): the file fallback carries the same seq,
+            # so a late socket delivery and the file are not both executed
+            write_atomic(self.commands_file,
+                         f"NEW:{command}\n{price_info}@seq={seq}@sent={sent_at}@signal={message['signal']}\n")
+            self.sent_file += 1
+            return seq, 'file'
+
+    def stats(self):
+        return {
+            'connected': self.sock is not None,
+            'sent_socket': self.sent_socket,
+            'sent_file': self.sent_file,
+            'ack_latency': self.ack_latency.as_dict(),
+        }
+
+
+class CommandReceiver:
+    """Executor side: socket server plus watched file, merged into one queue"""
+
+    def __init__(self, commands_file, log, host=COMMAND_HOST, port=COMMAND_PORT):
+        self.commands_file = commands_file
+        self.log = log
+        self.host = host
+        self.port = port
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.last_seq = 0
+        self.last_file_command = ""
+        self.running = False
+        self.server = None      # listening socket, closed by stop() to release the port
+        self.connections = set()
+        self.delivery_latency = LatencyHistogram()
+        self.signal_to_click = LatencyHistogram()
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._serve, daemon=True).start()
+        threading.Thread(target=self._watch_file, daemon=True).start()
+
+    def stop(self):
+        """Stop both channels and release the port (accept() returns with an error)"""
+        self.running = False
+        with self.lock:
+            server, self.server = self.server, None
+            connections, self.connections = list(self.connections), set()
+        for sock in [server] + connections:
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # wakes a blocked accept()/read on Linux too
+            except OSError:
+                pass
+            sock.close()
+
+    def get(self, timeout=1):
+        """Next command message, or None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _accept(self, message):
+        """Deduplicate by sequence number (or by text for seq-less file commands)"""
+        with self.lock:
+            seq = message.get('seq')
+            if seq is not None:
+                if seq <= self.last_seq:
+                    return False
+                self.last_seq = seq
+            elif message['command'] == self.last_file_command:
+                return False
+            if message['channel'] == 'file':
+                self.last_file_command = message['command']
+        message['received'] = time.time()
+        if message.get('sent'):
+            self.delivery_latency.observe((message['received'] - message['sent']) * 1000)
+        self.queue.put(message)
+        return True
+
+    # ========== Socket ==========
+
+    def _serve(self):
+        try:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, self.port))
+            server.listen(4)
+        except OSError as e:
+            self.log(f"指令端口{self.port}监听失败，仅使用文件通道: {str(e)}")
+            return
+        with self.lock:
+            if not self.running:
+                server.close()
+                return
+            self.server = server
+        self.log(f"指令通道已监听 {self.host}:{self.port}")
+        while self.running:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                break  # closed by stop()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.connections.add(conn)
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        try:
+            for raw in conn.makefile('r', encoding='utf-8'):
+                message = json.loads(raw)
+                message['channel'] = 'socket'
+                message['conn'] = conn
+                accepted = self._accept(message)
+                self._send(conn, {'seq': message.get('seq'),
+                                  'status': 'received' if accepted else 'duplicate'})
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                self.connections.discard(conn)
+
+    def _send(self, conn, reply):
+        try:
+            conn.sendall((json.dumps(reply, ensure_ascii=False) + "\n").encode('utf-8'))
+        except OSError:
+            pass
+
+    # ========== File fallback ==========
+
+    def _parse_file(self):
+        """The pending NEW: command in the file as a message dict, or None"""
+        try:
+            with open(self.commands_file, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return None
+        if not lines or not lines[0].startswith("NEW:"):
+            return None
+        command = lines[0][4:].strip()
+        price_info = lines[1].strip() if len(lines) > 1 else ""
+        if not command:
+            return None
+        message = {'command': command, 'price_info': price_info, 'channel': 'file'}
+        for key, pattern, cast in (('seq', _SEQ, int), ('sent', _SENT, float), ('signal', _SIGNAL, float)):
+            match = pattern.search(price_info)
+            if match:
+                message[key] = cast(match.group(1))
+        return message
+
+    def _read_file(self):
+        message = self._parse_file()
+        if message is not None:
+            self._accept(message)
+
+    def _watch_file(self):
+        directory = os.path.dirname(os.path.abspath(self.commands_file))
+        handle = None
+        if WIN32_NOTIFY_AVAILABLE:
+            try:
+                handle = win32file.FindFirstChangeNotification(
+                    directory, False,
+                    win32con.FILE_NOTIFY_CHANGE_LAST_WRITE | win32con.FILE_NOTIFY_CHANGE_FILE_NAME)
+            except Exception as e:
+                self.log(f"文件变更通知不可用，改用轮询: {str(e)}")
+        last_mtime = None
+        while self.running:
+            try:
+                if handle is not None:
+                    if win32event.WaitForSingleObject(handle, 1000) == win32event.WAIT_OBJECT_0:
+                        win32file.FindNextChangeNotification(handle)
+                else:
+                    time.sleep(FILE_POLL_INTERVAL)
+                mtime = os.path.getmtime(self.commands_file) if os.path.exists(self.commands_file) else None
+                if mtime != last_mtime:
+                    last_mtime = mtime
+                    self._read_file()
+            except Exception as e:
+                self.log(f"指令文件监听错误: {str(e)}")
+                time.sleep(1)
+
+    # ========== Completion ==========
+
+    def complete(self, message, ok):
+        """Record latency, ack completion over the socket, mark file commands DONE"""
+        now = time.time()
+        signal_ms = (now - message['signal']) * 1000 if message.get('signal') else None
+        if signal_ms is not None:
+            self.signal_to_click.observe(signal_ms)
+        if message['channel'] == 'socket':
+            self._send(message['conn'], {'seq': message.get('seq'), 'status': 'done', 'ok': ok,
+                                         'signal_to_click_ms': signal_ms})
+        else:
+            # The sender may have written a newer command since this one was read;
+            # only mark the file DONE while it still holds the command being acked
+            current = self._parse_file()
+            if current is None or current.get('seq') != message.get('seq') \
+                    or current['command'] != message['command']:
+                return signal_ms
+            try:
+                write_atomic(self.commands_file, f"DONE:{message['command']}\n{message['price_info']}\n")
+            except Exception as e:
+                self.log(f"❌ 标记命令为DONE失败: {str(e)}")
+        return signal_ms
+
+    def stats(self):
+        return {
+            'last_seq': self.last_seq,
+            'pending': self.queue.qsize(),
+            'delivery_latency': self.delivery_latency.as_dict(),
+            'signal_to_click': self.signal_to_click.as_dict(),
+        }
@@ -0,0 +1,125 @@
+"""
+Decision Cache - Reuse LLM decisions for identical quantized market states
+analyze_market asks the model the same question every scan while the
+discrete inputs do not change. The cache keys the decision on a canonical
+fingerprint of those inputs and stores only the direction, so SL/TP prices
+are always rebuilt from the fresh price.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a cached decision stays valid
+DECISION_CACHE_TTL = 30
+
+# Maximum number of fingerprints kept (least recently used are evicted)
+DECISION_CACHE_SIZE = 256
+
+# RSI is bucketed into bands of this width before fingerprinting
+RSI_BUCKET_SIZE = 5
+
+# Numbers inside signal text, e.g. "RSI超卖(28.3)" or "收盘39950.12 > ..."
+_SIGNAL_VALUE = re.compile(r'\(\s*-?\d+(?:\.\d+)?%?\s*\)')
+
+# Moving averages compared against the price
+_MA_KEYS = ('ma5', 'ma10', 'ma20', 'ma50', 'ma200', 'ema12', 'ema26')
+
+
+def canonical_signal(signal):
+    """Strip the numeric detail from a signal, keeping only its kind"""
+    return _SIGNAL_VALUE.sub('', signal).split(':')[0].strip()
+
+
+def config_hash(*parts):
+    """Short stable hash of the configuration that shapes the prompt"""
+    text = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def fingerprint(indicators, level2_data, position_count, config_key):
+    """Canonical fingerprint of the quantized decision inputs"""
+    state = {'config': config_key, 'positions': position_count}
+    if indicators:
+        state['signals'] = sorted({canonical_signal(s) for s in indicators.get('signals', [])})
+        rsi = indicators.get('rsi')
+        state['rsi'] = int(rsi // RSI_BUCKET_SIZE) if rsi is not None else None
+        price = indicators.get('close_price')
+        if price is not None:
+            # Price above (+) or below (-) each available moving average
+            state['ma'] = ''.join(
+                '+' if price > indicators[key] else '-'
+                for key in _MA_KEYS if indicators.get(key) is not None)
+            bb_upper, bb_lower = indicators.get('bb_upper'), indicators.get('bb_lower')
+            if bb_upper is not None and bb_lower is not None:
+                state['bb'] = 'above' if price > bb_upper else 'below' if price < bb_lower else 'inside'
+        if indicators.get('macd_fast') is not None and indicators.get('macd_slow') is not None:
+            state['macd'] = indicators['macd_fast'] > indicators['macd_slow']
+        higher = indicators.get('higher_timeframes')
+        if higher:
+            state['higher'] = [(h['timeframe'], h['trend']) for h in higher]
+    if level2_data and level2_data.get('available'):
+        state['level2'] = level2_data.get('sentiment')
+    return json.dumps(state, sort_keys=True, ensure_ascii=False)
+
+
+class DecisionCache:
+    """TTL + LRU cache of fingerprint -> decision direction"""
+
+    def __init__(self, max_entries=DECISION_CACHE_SIZE, ttl=DECISION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.lock = threading.Lock()  # Shared by the scheduler's analysis workers
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            direction, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                del self.entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return direction
+
+    def put(self, key, direction):
+        with self.lock:
+            self.entries[key] = (direction, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hit_rate, 4),
+            'ttl': self.ttl,
+            'rsi_bucket': RSI_BUCKET_SIZE,
+        }
@@ -0,0 +1,109 @@
+"""
+Decision Schema - Structured trading decisions through Ollama's format field
+The model is constrained to a small JSON object instead of free text. The
+answer is validated field by field and its SL/TP are checked against the
+prices the agent computed, so a malformed answer is counted as a failure
+instead of silently turning into 待机.
+"""
+
+import json
+import threading
+
+DIRECTIONS = ("做多", "做空", "待机")
+
+DECISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "direction": {"type": "string", "enum": list(DIRECTIONS)},
+        "sl": {"type": ["number", "null"]},
+        "tp": {"type": ["number", "null"]},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "reasons": {"type": "array", "items": {"type": "string"}, "maxItems": 3},
+    },
+    "required": ["direction", "sl", "tp", "confidence", "reasons"],
+}
+
+# Generation cap for one JSON decision (the object is ~40-80 tokens)
+DECISION_NUM_PREDICT = 128
+
+# Appended to the prompt; the schema constrains decoding, this tells the model why
+DECISION_INSTRUCTION = (
+    '\n以JSON输出决策: {"direction": "做多|做空|待机", "sl": 止损价格或null, "tp": 止盈价格或null, '
+    '"confidence": 0到1, "reasons": ["最多3条简短理由"]}。sl/tp必须使用上方已计算好的价格。'
+)
+
+# Relative SL/TP deviation from the computed price tolerated as rounding
+PRICE_TOLERANCE = 1e-6
+
+
+class DecisionError(ValueError):
+    """The model's answer is not a valid decision"""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+def parse_decision(text):
+    """Parse and validate the JSON answer; raises DecisionError"""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError) as e:
+        raise DecisionError('invalid_json', f"JSON解析失败: {e}")
+    if not isinstance(data, dict):
+        raise DecisionError('schema', "决策不是JSON对象")
+    direction = data.get('direction')
+    if direction not in DIRECTIONS:
+        raise DecisionError('schema', f"无效方向: {direction!r}")
+    decision = {'direction': direction}
+    for key in ('sl', 'tp'):
+        value = data.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise DecisionError('schema', f"{key}不是数字: {value!r}")
+        decision[key] = value
+    confidence = data.get('confidence')
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+        raise DecisionError('schema', f"无效置信度: {confidence!r}")
+    decision['confidence'] = float(confidence)
+    reasons = data.get('reasons') or []
+    decision['reasons'] = [str(r) for r in reasons][:3] if isinstance(reasons, list) else [str(reasons)]
+    return decision
+
+
+def price_matches(value, expected):
+    if value is None or expected is None:
+        return value is None and expected is None
+    return abs(value - expected) <= abs(expected) * PRICE_TOLERANCE + 1e-12
+
+
+class DecisionStats:
+    """Counters of structured decisions and why they failed"""
+
+    def __init__(self):
+        self.ok = 0
+        self.failures = {}        # kind -> count
+        self.price_corrected = 0  # valid decisions whose SL/TP differed from the computed prices
+        self.directions = {}
+        self.lock = threading.Lock()
+
+    def record(self, decision=None, error=None, corrected=False):
+        with self.lock:
+            if error is not None:
+                self.failures[error.kind] = self.failures.get(error.kind, 0) + 1
+                return
+            self.ok += 1
+            self.price_corrected += corrected
+            direction = decision['direction']
+            self.directions[direction] = self.directions.get(direction, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            total = self.ok + sum(self.failures.values())
+            return {
+                'decisions': total,
+                'ok': self.ok,
+                'failures': dict(self.failures),
+                'failure_rate': round(1 - self.ok / total, 4) if total else None,
+                'price_corrected': self.price_corrected,
+                'directions': dict(self.directions),
+            }
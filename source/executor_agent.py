@@ -1,6 +1,7 @@
 """
 Executor Agent - Controls MT5 via PyAutoGUI + OpenCV Image Recognition
-Monitors commands and executes trades by recognizing MT5 buttons and clicking
+Monitors commands and executes trades by recognizing MT5 buttons and clicking,
+or through mt5.order_send when config.json sets "execution_mode": "api"
 """
 
 import os
@@ -8,10 +9,22 @@ import sys
 import time
 import json
 import threading
-import pyautogui
 import numpy as np
 from datetime import datetime
-import requests
+
+import mt5_trade
+from log_pipeline import LogPipeline, WEB_LOG_URL
+from command_channel import CommandReceiver
+from trade_verifier import TradeVerifier
+from symbol_registry import SymbolRegistry
+
+# Try to import PyAutoGUI (only needed for the GUI execution mode)
+try:
+    import pyautogui
+    PYAUTOGUI_AVAILABLE = True
+except ImportError:
+    PYAUTOGUI_AVAILABLE = False
+    print("[WARNING] PyAutoGUI not installed, only API execution mode is available")
 
 # Try to import pyperclip for copy-paste
 try:
@@ -43,6 +56,9 @@ LOG_FILE = "E:\\TradingSystem\\executor.log"
 CONFIG_FILE = "E:\\TradingSystem\\config.json"
 MT5_WINDOW_TITLE = "MetaTrader 5"
 
+# Returned by execute_api when the GUI path has to be used instead
+API_UNAVAILABLE = "api_unavailable"
+
 # MT5 window positions (will be calibrated on first run)
 MT5_CONFIG_FILE = "E:\\TradingSystem\\mt5_positions.json"
 
@@ -50,24 +66,40 @@ MT5_CONFIG_FILE = "E:\\TradingSystem\\mt5_positions.json"
 TEMPLATES_DIR = "E:\\TradingSystem\\templates"
 
 class ExecutorAgent:
-    def __init__(self):
+    def __init__(self, log_file=LOG_FILE, web_url=WEB_LOG_URL, commands_file=COMMANDS_FILE,
+                 templates_dir=TEMPLATES_DIR):
+        """Defaults are the live install; benchmarks pass private paths and web_url=None"""
+        self.log_pipeline = LogPipeline(log_file, web_url=web_url)  # Non-blocking file/web logging
+        self.commands_file = commands_file
+        self.templates_dir = templates_dir
         self.running = True
         self.last_command = ""
         self.mt5_positions = {}
         self.mt5_connected = False
+        self.last_processed_command = ""
+        self.command_receiver = CommandReceiver(commands_file, self.log)
+        self.trade_verifier = TradeVerifier(self.log)  # Deal-event confirmation of submitted orders
+        self.symbol_registry = SymbolRegistry(log=self.log)  # Cached digits/filling modes for rounding and orders
+        self.execution_mode = "gui"  # "gui" (click MT5) or "api" (mt5.order_send)
+        self.trading_pair = ""
+        self.order_symbol = ""  # Symbol of the command being executed (@symbol= or trading_pair)
+        self.lot_size = 0.01
+        self.submitted_stops = (None, None)  # SL/TP typed into the last GUI order window
         self.load_positions()
+        self.load_trading_config()
 
         # PyAutoGUI settings
-        pyautogui.PAUSE = 0.01  # Pause between actions (minimum for speed)
-        pyautogui.FAILSAFE = True  # Move mouse to corner to abort
+        if PYAUTOGUI_AVAILABLE:
+            pyautogui.PAUSE = 0.01  # Pause between actions (minimum for speed)
+            pyautogui.FAILSAFE = True  # Move mouse to corner to abort
 
         # OpenCV settings - 已禁用，使用坐标点击
         self.use_opencv = False
         self.confidence = 0.8  # Template matching confidence
 
         # Ensure templates directory exists
-        if not os.path.exists(TEMPLATES_DIR):
-            os.makedirs(TEMPLATES_DIR)
+        if not os.path.exists(self.templates_dir):
+            os.makedirs(self.templates_dir)
         
         # Try to connect to MT5 for API verification
         self.connect_mt5()
@@ -81,6 +113,17 @@ class ExecutorAgent:
             except:
                 self.mt5_positions = {}
 
+    def load_trading_config(self):
+        """Load execution mode, symbol and lot size from config.json"""
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except:
+            return
+        self.execution_mode = config.get('execution_mode', 'gui')
+        self.trading_pair = config.get('trading_pair', '')
+        self.lot_size = config.get('lot_size', 0.01)
+
     def save_positions(self):
         """Save MT5 window positions"""
         with open(MT5_CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -108,6 +151,7 @@ class ExecutorAgent:
             
             self.log(f"MT5 API已连接 - 账户: {account_info.login}, 余额: {account_info.balance}")
             self.mt5_connected = True
+            self.symbol_registry.invalidate()
             return True
             
         except Exception as e:
@@ -115,38 +159,32 @@ class ExecutorAgent:
             self.mt5_connected = False
             return False
     
-    def check_mt5_positions(self, timeout_seconds=30):
-        """Check if new position was opened in MT5 (API verification)"""
-        if not self.mt5_connected or not MT5_AVAILABLE:
+    def verify_trade(self, snapshot, is_buy, on_verified=None, **match):
+        """Confirm a submitted order from MT5 deal events
+
+        With on_verified the check runs on the verifier thread and None is
+        returned right away; otherwise it blocks and returns the result.
+        """
+        if snapshot is None:
             self.log("MT5 API未连接，跳过交易验证")
             return False
-        
-        try:
-            # Get initial positions count
-            initial_positions = mt5.positions_get()
-            initial_count = len(initial_positions) if initial_positions else 0
-            self.log(f"初始持仓数: {initial_count}")
-            
-            # Wait for new position (polling)
-            start_time = time.time()
-            while time.time() - start_time < timeout_seconds:
-                current_positions = mt5.positions_get()
-                current_count = len(current_positions) if current_positions else 0
-                
-                if current_count > initial_count:
-                    # New position opened
-                    self.log(f"交易验证成功: 新持仓已打开 (当前持仓数: {current_count})")
-                    return True
-                
-                time.sleep(1)  # Check every second
-            
-            # Timeout reached, no new position
-            self.log(f"交易验证失败: {timeout_seconds}秒内未检测到新持仓")
-            return False
-            
-        except Exception as e:
-            self.log(f"持仓检查错误: {str(e)}")
-            return False
+
+        def report(ok, detail):
+            if ok:
+                self.log(f"✅ 交易验证成功：{detail}")
+            else:
+                self.log(f"❌ 交易验证失败：{detail}，放弃此次交易")
+            if on_verified is not None:
+                on_verified(ok)
+
+        # Callers pass the terminal's name when they know it; deals never carry an alias
+        match.setdefault('symbol', self.order_symbol or None)
+        if on_verified is not None:
+            self.trade_verifier.expect(snapshot, is_buy=is_buy, on_result=report, **match)
+            return None
+        ok, detail = self.trade_verifier.wait(snapshot, is_buy=is_buy, **match)
+        report(ok, detail)
+        return ok
 
     def log(self, message):
         """Log message to file and web interface"""
@@ -154,22 +192,8 @@ class ExecutorAgent:
         log_message = f"[{timestamp}] {message}"
         print(log_message)
         
-        # Write to log file
-        try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as f:
-                f.write(log_message + "\n")
-        except:
-            pass
-        
-        # Also send to web interface logs
-        try:
-            requests.post('http://localhost:5000/save_log', 
-                         json={'type': 'log', 'message': message},
-                         timeout=1)
-        except:
-            # Web interface might not be running or not accessible
-            # Silently ignore errors to avoid disrupting trading
-            pass
+        # File append and web UI shipping happen in the pipeline's worker thread
+        self.log_pipeline.emit(log_message, message)
 
     def find_mt5_window(self):
         """Find MT5 window"""
@@ -236,7 +260,7 @@ class ExecutorAgent:
             screenshot_gray = cv2.cvtColor(screenshot_np, cv2.COLOR_BGR2GRAY)
 
             # Load template
-            template_path = os.path.join(TEMPLATES_DIR, f"{template_name}.png")
+            template_path = os.path.join(self.templates_dir, f"{template_name}.png")
             if not os.path.exists(template_path):
                 self.log(f"模板不存在: {template_path}")
                 return None
@@ -314,10 +338,10 @@ class ExecutorAgent:
             screenshot = pyautogui.screenshot(region=(x - width//2, y - height//2, width, height))
 
             # Ensure templates directory exists
-            os.makedirs(TEMPLATES_DIR, exist_ok=True)
+            os.makedirs(self.templates_dir, exist_ok=True)
 
             # Save template
-            template_path = os.path.join(TEMPLATES_DIR, f"{template_name}.png")
+            template_path = os.path.join(self.templates_dir, f"{template_name}.png")
             screenshot.save(template_path)
 
             self.log(f"已保存模板: {template_path}")
@@ -460,6 +484,8 @@ class ExecutorAgent:
             self.click_position("buy_btn")
             time.sleep(0.8)  # Rule 7: Confirm order wait
             self.log("买入订单已提交")
+            self.submitted_stops = (sl_price if "sl_input" in self.mt5_positions else None,
+                                    tp_price if "tp_input" in self.mt5_positions else None)
             return True
             
         except Exception as e:
@@ -547,12 +573,69 @@ class ExecutorAgent:
             self.click_position("sell_btn")
             time.sleep(0.3)
             self.log("卖出订单已提交")
+            self.submitted_stops = (sl_price if "sl_input" in self.mt5_positions else None,
+                                    tp_price if "tp_input" in self.mt5_positions else None)
             return True
 
         except Exception as e:
             self.log(f"卖出失败: {str(e)}")
             return False
 
+    def execute_api(self, cmd_type, stop_loss=None, take_profit=None, current_price=None, digits=5, stop_loss_is_percent=False, take_profit_is_percent=False, on_verified=None):
+        """Execute order through mt5.order_send
+
+        Returns True/False for the trade result (None while the deal is
+        confirmed asynchronously), or API_UNAVAILABLE if the API path is
+        unusable here (not connected, algo trading disabled) and the GUI
+        path should be used instead.
+        """
+        if not MT5_AVAILABLE or not self.mt5_connected:
+            self.log("MT5 API未连接，无法使用API下单")
+            return API_UNAVAILABLE
+        if not self.order_symbol:
+            self.log("未指定交易品种（config.json trading_pair），无法使用API下单")
+            return API_UNAVAILABLE
+
+        is_buy = cmd_type == "buy"
+        info = self.symbol_registry.get(self.order_symbol)
+        tick = mt5.symbol_info_tick(info.name) if info is not None else None
+        if info is None or tick is None:
+            self.log(f"无法获取{self.order_symbol}品种信息/报价: {mt5.last_error()}")
+            return API_UNAVAILABLE
+        # Orders and deals use the terminal's name; order_symbol stays the configured
+        # one so a GUI fallback still recognizes the chart symbol
+        symbol = info.name
+
+        # 百分比止损止盈以当前成交方向的报价为基准
+        base_price = tick.ask if is_buy else tick.bid
+        sl_price = stop_loss
+        if stop_loss is not None and stop_loss_is_percent:
+            sl_price = round(base_price * (1 - stop_loss/100 if is_buy else 1 + stop_loss/100), info.digits)
+        tp_price = take_profit
+        if take_profit is not None and take_profit_is_percent:
+            tp_price = round(base_price * (1 + take_profit/100 if is_buy else 1 - take_profit/100), info.digits)
+
+        volume = max(mt5_trade.round_volume(self.lot_size, info), info.volume_min)
+        self.log(f"⚡ API下单: {'买入' if is_buy else '卖出'} {symbol} {volume}手, 止损: {sl_price}, 止盈: {tp_price}")
+
+        start = time.perf_counter()
+        ok, result, message = mt5_trade.send_market(symbol, is_buy, volume, sl_price, tp_price,
+                                                    comment="AutoGPT", info=info)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if result is None or result.retcode in mt5_trade.AUTOTRADING_DISABLED_RETCODES:
+            self.log(f"❌ API下单不可用 ({elapsed_ms:.0f}ms): {message}")
+            return API_UNAVAILABLE
+        if not ok:
+            self.log(f"❌ API下单失败 ({elapsed_ms:.0f}ms): {message}")
+            return False
+        self.log(f"✅ API下单成功 ({elapsed_ms:.0f}ms): 订单#{result.order} 成交#{result.deal} 价格{result.price} - {message}")
+        if result.deal:
+            # TRADE_RETCODE_DONE with a deal ticket is the terminal's own fill confirmation
+            return True
+        # Order placed but not filled yet: wait for its deal by order ticket
+        return self.verify_trade((set(), set()), is_buy, on_verified, symbol=symbol, order=result.order)
+
     def parse_command(self, command):
         """Parse trading command - with percentage support"""
         command = command.strip()
@@ -618,8 +701,13 @@ class ExecutorAgent:
 
         return None, None, None, None, None, False, False
 
-    def execute_command(self, command, current_price=None, digits=5):
-        """Execute a trading command"""
+    def execute_command(self, command, current_price=None, digits=5, on_verified=None, symbol=None):
+        """Execute a trading command
+
+        Returns True/False, or None when on_verified(ok) will be called once
+        the order's deal is confirmed. symbol comes from multi-symbol
+        scheduling; GUI mode always trades the chart that is open in MT5.
+        """
         if not command or command == self.last_command:
             return False
 
@@ -639,6 +727,36 @@ class ExecutorAgent:
         else:
             self.log(f"❓ 未知指令类型: {cmd_type}")
 
+        # API mode: order latency bounded by the terminal, GUI clicking kept as fallback
+        if cmd_type in ("buy", "sell"):
+            self.load_trading_config()
+            self.order_symbol = symbol or self.trading_pair
+            # Round SL/TP with the terminal's digits rather than the command's hint
+            info = self.symbol_registry.get(self.order_symbol) if self.mt5_connected and MT5_AVAILABLE else None
+            if info is not None:
+                digits = info.digits
+            if self.execution_mode == "api":
+                result = self.execute_api(cmd_type, stop_loss, take_profit, current_price, digits, stop_loss_is_percent, take_profit_is_percent, on_verified)
+                if result is not API_UNAVAILABLE:
+                    return result
+                self.log("⚠️ API下单不可用，回退到GUI点击下单")
+            if self.order_symbol != self.trading_pair:
+                self.log(f"❌ GUI下单只能交易当前图表品种{self.trading_pair}，{self.order_symbol}需要API执行模式")
+                return False
+            if not PYAUTOGUI_AVAILABLE:
+                self.log("❌ PyAutoGUI未安装，无法GUI下单")
+                return False
+            # Tickets that exist before the click; GUI orders carry magic 0
+            snapshot = self.trade_verifier.snapshot() if self.mt5_connected and MT5_AVAILABLE else None
+            # GUI orders have no ticket, so the fill must also carry the SL/TP we typed.
+            # The lot is whatever the order window already holds, so volume is not matched
+            self.submitted_stops = (None, None)
+            gui_match = {
+                'symbol': info.name if info else (self.order_symbol or None),
+                'magic': 0,
+                'point': info.point if info else 10 ** -digits,
+            }
+
         if cmd_type == "buy":
             self.log("🟢 开始执行买入操作...")
             # 执行买入操作（不再激活MT5窗口，直接按F9）
@@ -646,15 +764,10 @@ class ExecutorAgent:
             success = self.execute_buy(symbol, lot, stop_loss, take_profit, current_price, digits, stop_loss_is_percent, take_profit_is_percent)
             
             if success:
-                self.log("✅ 买入订单已提交，等待MT5 API验证...")
-                # 验证交易是否成功
-                self.log("🔍 验证MT5持仓状态...")
-                if self.check_mt5_positions():
-                    self.log("✅ 交易验证成功：MT5账户确认新持仓")
-                    return True
-                else:
-                    self.log("❌ 交易验证失败：MT5账户未检测到新持仓，放弃此次交易")
-                    return False
+                self.log("✅ 买入订单已提交，等待MT5成交确认...")
+                # 验证交易是否成功（匹配新成交/持仓）
+                sl, tp = self.submitted_stops
+                return self.verify_trade(snapshot, True, on_verified, sl=sl, tp=tp, **gui_match)
             else:
                 self.log("❌ 买入操作失败，放弃此次交易")
                 return False
@@ -666,15 +779,10 @@ class ExecutorAgent:
             success = self.execute_sell(symbol, lot, stop_loss, take_profit, current_price, digits, stop_loss_is_percent, take_profit_is_percent)
             
             if success:
-                self.log("✅ 卖出订单已提交，等待MT5 API验证...")
-                # 验证交易是否成功
-                self.log("🔍 验证MT5持仓状态...")
-                if self.check_mt5_positions():
-                    self.log("✅ 交易验证成功：MT5账户确认新持仓")
-                    return True
-                else:
-                    self.log("❌ 交易验证失败：MT5账户未检测到新持仓，放弃此次交易")
-                    return False
+                self.log("✅ 卖出订单已提交，等待MT5成交确认...")
+                # 验证交易是否成功（匹配新成交/持仓）
+                sl, tp = self.submitted_stops
+                return self.verify_trade(snapshot, False, on_verified, sl=sl, tp=tp, **gui_match)
             else:
                 self.log("❌ 卖出操作失败，放弃此次交易")
                 return False
@@ -686,82 +794,72 @@ class ExecutorAgent:
         return False
 
     def monitor_commands(self):
-        """Monitor commands file"""
-        self.log("开始监控指令文件...")
-        
-        # Track last processed command to avoid re-executing
-        self.last_processed_command = ""
+        """Execute commands from the socket channel and the watched commands file"""
+        self.log("开始监听交易指令（socket + 文件）...")
+        self.command_receiver.start()
 
         while self.running:
             try:
-                if os.path.exists(COMMANDS_FILE):
-                    with open(COMMANDS_FILE, 'r', encoding='utf-8') as f:
-                        lines = f.readlines()
-
-                    if lines:
-                        first_line = lines[0].strip()
-                        
-                        # Only process commands that start with "NEW:"
-                        if first_line.startswith("NEW:"):
-                            # Extract the actual command (remove "NEW:" prefix)
-                            command = first_line[4:].strip()  # Remove "NEW:" prefix
-                            
-                            # Skip if this is the same command as last processed
-                            if command == self.last_processed_command:
-                                time.sleep(1)
-                                continue
-                            
-                            price_info = lines[1].strip() if len(lines) > 1 else ""
-
-                            # Parse price info: @price=1.0850@digits=5
-                            current_price = None
-                            digits = 5
-                            import re
-                            price_match = re.search(r'@price=([\d.]+)', price_info)
-                            digits_match = re.search(r'@digits=(\d+)', price_info)
-
-                            if price_match:
-                                current_price = float(price_match.group(1))
-                            if digits_match:
-                                digits = int(digits_match.group(1))
-
-                            if command:
-                                self.last_processed_command = command
-                                self.log(f"📥 检测到新交易指令: {command}")
-                                self.log(f"📊 价格信息: {price_info}")
-                                if current_price:
-                                    self.log(f"💰 当前价格: {current_price}, 小数位数: {digits}")
-                                
-                                # 执行命令
-                                result = self.execute_command(command, current_price, digits)
-                                
-                                if result:
-                                    self.log("✅ 交易执行成功")
-                                else:
-                                    self.log("❌ 交易执行失败")
-                                
-                                # Mark command as DONE
-                                try:
-                                    with open(COMMANDS_FILE, 'w', encoding='utf-8') as wf:
-                                        wf.write("DONE:" + command + "\n")
-                                        wf.write(price_info + "\n")
-                                    self.log("📝 指令已标记为DONE")
-                                except Exception as e:
-                                    self.log(f"❌ 标记命令为DONE失败: {str(e)}")
-
-                time.sleep(1)  # Check every second
+                message = self.command_receiver.get(timeout=1)
+                if message is None:
+                    continue
+
+                command = message['command']
+                price_info = message.get('price_info', '')
+
+                # Skip if this is the same command as last processed (e.g. 待机 on every scan)
+                if command == self.last_processed_command:
+                    continue
+
+                # Parse price info: @price=1.0850@digits=5
+                current_price = None
+                digits = 5
+                import re
+                price_match = re.search(r'@price=([\d.]+)', price_info)
+                digits_match = re.search(r'@digits=(\d+)', price_info)
+                symbol_match = re.search(r'@symbol=([^@\s]+)', price_info)
+
+                if price_match:
+                    current_price = float(price_match.group(1))
+                if digits_match:
+                    digits = int(digits_match.group(1))
+
+                self.last_processed_command = command
+                self.log(f"📥 检测到新交易指令#{message.get('seq', '-')} ({message['channel']}): {command}")
+                self.log(f"📊 价格信息: {price_info}")
+                if current_price:
+                    self.log(f"💰 当前价格: {current_price}, 小数位数: {digits}")
+
+                # 执行命令；成交确认在验证线程中完成，不阻塞下一条指令
+                result = self.execute_command(command, current_price, digits,
+                                              on_verified=lambda ok, message=message: self.finish_command(message, ok),
+                                              symbol=symbol_match.group(1) if symbol_match else None)
+                if result is not None:
+                    self.finish_command(message, result)
 
             except Exception as e:
                 self.log(f"监控循环错误: {str(e)}")
                 time.sleep(5)
 
+    def finish_command(self, message, result):
+        """Report a command's outcome back through its channel"""
+        if result:
+            self.log("✅ 交易执行成功")
+        else:
+            self.log("❌ 交易执行失败")
+
+        # Ack over the socket or mark the file command DONE
+        signal_ms = self.command_receiver.complete(message, result)
+        if signal_ms is not None:
+            self.log(f"⏱️ 信号→成交延迟: {signal_ms:.0f}ms")
+
     def start(self):
         """Start the executor"""
         self.log("Executor Agent 启动")
         
         # Clear commands.txt on startup to avoid executing old commands from previous session
         try:
-            with open(COMMANDS_FILE, 'w', encoding='utf-8') as f:
+            with open(self.commands_file, 'w', encoding='utf-8') as f:
                 f.write('')
             self.log("已清空命令文件")
         except Exception as e:
@@ -774,6 +872,7 @@ class ExecutorAgent:
             print("输入 '退出' 退出程序")
         else:
             self.log(f"已加载 {len(self.mt5_positions)} 个位置配置")
+        self.log(f"执行模式: {'API (mt5.order_send)' if self.execution_mode == 'api' else 'GUI点击'}")
 
         # Start monitoring in background
         monitor_thread = threading.Thread(target=self.monitor_commands)
@@ -787,6 +886,7 @@ class ExecutorAgent:
 
                 if user_input == "退出":
                     self.running = False
+                    self.command_receiver.stop()
                     print("再见!")
                     break
 
@@ -797,6 +897,9 @@ class ExecutorAgent:
                     print(f"运行状态: {'运行中' if self.running else '已停止'}")
                     print(f"已校准位置: {list(self.mt5_positions.keys())}")
                     print(f"OpenCV可用: {self.use_opencv}")
+                    print(f"执行模式: {self.execution_mode}")
+                    print(f"成交验证: {json.dumps(self.trade_verifier.stats(), ensure_ascii=False)}")
+                    print(f"指令通道: {json.dumps(self.command_receiver.stats(), ensure_ascii=False)}")
 
                 elif user_input.startswith("capture "):
                     # Capture button template: capture <button_name>
@@ -823,6 +926,7 @@ class ExecutorAgent:
 
             except KeyboardInterrupt:
                 self.running = False
+                self.command_receiver.stop()
                 print("\n程序已停止")
                 break
             except Exception as e:
@@ -844,9 +948,9 @@ def main():
     print("=" * 50)
 
     # Check PyAutoGUI
-    try:
+    if PYAUTOGUI_AVAILABLE:
         print("[OK] PyAutoGUI installed")
-    except ImportError:
+    else:
         print("[ERROR] PyAutoGUI not installed, installing...")
         os.system("pip install pyautogui")
 
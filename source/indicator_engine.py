@@ -0,0 +1,369 @@
+"""
+Indicator Engine - Incremental technical indicators for the monitor loop
+Keeps running state per symbol/timeframe so every scan only consumes the bars
+that closed since the previous scan instead of recomputing the whole window.
+"""
+
+import math
+from collections import deque
+
+import indicators
+
+# Closed bars kept for window-based signals (breakout, pullback, recent candles)
+SIGNAL_WINDOW_BARS = 30
+
+SMA_PERIODS = (5, 10, 20, 50, 200)
+EMA_PERIODS = (12, 26)
+RSI_PERIOD = 14
+BOLLINGER_PERIOD = 20
+BOLLINGER_STD_DEV = 2
+ATR_PERIOD = 14
+
+# Closed bars replayed through the window-based states when seeding; the
+# recursive states (EMA, RSI) are loaded from vectorized series instead
+SEED_TAIL_BARS = max(max(SMA_PERIODS), BOLLINGER_PERIOD, ATR_PERIOD + 1, SIGNAL_WINDOW_BARS)
+
+
+class RollingSMA:
+    """Simple moving average with a running sum"""
+
+    def __init__(self, period):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+
+    def update(self, value):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(value)
+        self.total += value
+
+    @property
+    def value(self):
+        if len(self.window) < self.period:
+            return None
+        return self.total / self.period
+
+    def peek(self, value):
+        """SMA as if value were appended, without committing it"""
+        if len(self.window) + 1 < self.period:
+            return None
+        total = self.total + value
+        if len(self.window) == self.period:
+            total -= self.window[0]
+        return total / self.period
+
+
+class RollingEMA:
+    """Exponential moving average seeded with the first value it sees"""
+
+    def __init__(self, period):
+        self.period = period
+        self.multiplier = 2 / (period + 1)
+        self.ema = None
+        self.count = 0
+
+    def update(self, value):
+        self.ema = value if self.ema is None else (value - self.ema) * self.multiplier + self.ema
+        self.count += 1
+
+    def load(self, ema, count):
+        """Restore state from a vectorized EMA computed over count values"""
+        self.ema = ema
+        self.count = count
+
+    @property
+    def value(self):
+        if self.count < self.period:
+            return None
+        return self.ema
+
+    def peek(self, value):
+        if self.count + 1 < self.period:
+            return None
+        if self.ema is None:
+            return value
+        return (value - self.ema) * self.multiplier + self.ema
+
+
+class RollingBollinger:
+    """Bollinger bands from a rolling sum and sum of squares"""
+
+    def __init__(self, period=BOLLINGER_PERIOD, std_dev=BOLLINGER_STD_DEV):
+        self.period = period
+        self.std_dev = std_dev
+        self.window = deque(maxlen=period)
+        # Values are shifted by the first price seen to keep the sum of
+        # squares small and avoid cancellation on large quotes like US30
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def update(self, value):
+        if self.shift is None:
+            self.shift = value
+        x = value - self.shift
+        if len(self.window) == self.period:
+            old = self.window[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.window.append(x)
+        self.total += x
+        self.total_sq += x * x
+
+    def _bands(self, total, total_sq):
+        mean = total / self.period
+        variance = max(total_sq / self.period - mean * mean, 0.0)
+        std = math.sqrt(variance)
+        middle = mean + self.shift
+        return middle + self.std_dev * std, middle, middle - self.std_dev * std
+
+    @property
+    def value(self):
+        if len(self.window) < self.period:
+            return None, None, None
+        return self._bands(self.total, self.total_sq)
+
+    def peek(self, value):
+        if len(self.window) + 1 < self.period:
+            return None, None, None
+        x = value - self.shift
+        total = self.total + x
+        total_sq = self.total_sq + x * x
+        if len(self.window) == self.period:
+            old = self.window[0]
+            total -= old
+            total_sq -= old * old
+        return self._bands(total, total_sq)
+
+
+class RollingRSI:
+    """RSI with Wilder-smoothed average gain/loss"""
+
+    def __init__(self, period=RSI_PERIOD):
+        self.period = period
+        self.prev_close = None
+        self.seed_gains = 0.0
+        self.seed_losses = 0.0
+        self.deltas = 0
+        self.avg_gain = None
+        self.avg_loss = None
+
+    def _next(self, close):
+        """Return (deltas, avg_gain, avg_loss) after consuming close"""
+        if self.prev_close is None:
+            return 0, None, None
+        delta = close - self.prev_close
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        deltas = self.deltas + 1
+        if self.avg_gain is None:
+            if deltas < self.period:
+                return deltas, None, None
+            return (deltas,
+                    (self.seed_gains + gain) / self.period,
+                    (self.seed_losses + loss) / self.period)
+        return (deltas,
+                (self.avg_gain * (self.period - 1) + gain) / self.period,
+                (self.avg_loss * (self.period - 1) + loss) / self.period)
+
+    def update(self, close):
+        deltas, avg_gain, avg_loss = self._next(close)
+        if self.prev_close is not None and self.avg_gain is None:
+            delta = close - self.prev_close
+            self.seed_gains += delta if delta > 0 else 0.0
+            self.seed_losses += -delta if delta < 0 else 0.0
+        self.deltas = deltas
+        if avg_gain is not None:
+            self.avg_gain, self.avg_loss = avg_gain, avg_loss
+        self.prev_close = close
+
+    def load(self, prev_close, deltas, avg_gain, avg_loss):
+        """Restore state from vectorized Wilder averages"""
+        self.prev_close = prev_close
+        self.deltas = deltas
+        self.avg_gain = avg_gain
+        self.avg_loss = avg_loss
+
+    @staticmethod
+    def _rsi(avg_gain, avg_loss):
+        if avg_gain is None:
+            return None
+        if avg_loss == 0:
+            return 100
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+
+    @property
+    def value(self):
+        return self._rsi(self.avg_gain, self.avg_loss)
+
+    def peek(self, close):
+        _, avg_gain, avg_loss = self._next(close)
+        return self._rsi(avg_gain, avg_loss)
+
+
+class RollingATR:
+    """Average true range as a rolling mean of true ranges"""
+
+    def __init__(self, period=ATR_PERIOD):
+        self.sma = RollingSMA(period)
+        self.prev_close = None
+
+    def _true_range(self, high, low):
+        return max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+
+    def update(self, high, low, close):
+        if self.prev_close is not None:
+            self.sma.update(self._true_range(high, low))
+        self.prev_close = close
+
+    @property
+    def value(self):
+        return self.sma.value
+
+    def peek(self, high, low):
+        if self.prev_close is None:
+            return None
+        return self.sma.peek(self._true_range(high, low))
+
+
+class IndicatorEngine:
+    """Streaming indicator state for one symbol/timeframe
+
+    Closed bars are committed into the running state exactly once. The bar
+    that is still forming is only evaluated with peek(), so the "previous"
+    values used for cross detection are simply the committed values.
+    """
+
+    def __init__(self, history=200):
+        self.history = history
+        self.smas = {p: RollingSMA(p) for p in SMA_PERIODS}
+        self.emas = {p: RollingEMA(p) for p in EMA_PERIODS}
+        self.rsi = RollingRSI()
+        self.bollinger = RollingBollinger()
+        self.atr = RollingATR()
+        self.closed_bars = deque(maxlen=SIGNAL_WINDOW_BARS)
+        self.forming_bar = None
+        self.last_closed_time = None
+        self.total_bars = 0
+
+    @staticmethod
+    def _bar(rate):
+        return (int(rate[0]), float(rate[1]), float(rate[2]), float(rate[3]), float(rate[4]))
+
+    def _commit_windows(self, bar):
+        _, _, high, low, close = bar
+        for sma in self.smas.values():
+            sma.update(close)
+        self.bollinger.update(close)
+        self.atr.update(high, low, close)
+        self.closed_bars.append(bar)
+        self.last_closed_time = bar[0]
+        self.total_bars += 1
+
+    def _commit(self, bar):
+        self._commit_windows(bar)
+        close = bar[4]
+        for ema in self.emas.values():
+            ema.update(close)
+        self.rsi.update(close)
+
+    def seed(self, rates):
+        """Rebuild state from a full window of rates (last element is forming)"""
+        self.__init__(self.history)
+        closed = rates[:-1]
+        if len(closed) > RSI_PERIOD:
+            # Recursive states from vectorized kernels, windows from the tail only
+            closes = indicators.ohlc(closed)[3]
+            for period, ema in self.emas.items():
+                ema.load(float(indicators.ema(closes, period, warmup=False)[-1]), len(closes))
+            avg_gain, avg_loss = indicators.wilder_averages(closes, RSI_PERIOD)
+            self.rsi.load(float(closes[-1]), len(closes) - 1, float(avg_gain[-1]), float(avg_loss[-1]))
+            for rate in closed[-SEED_TAIL_BARS:]:
+                self._commit_windows(self._bar(rate))
+            self.total_bars = len(closed)
+        else:
+            for rate in closed:
+                self._commit(self._bar(rate))
+        self.forming_bar = self._bar(rates[-1])
+
+    def update(self, rates):
+        """Consume the new bars of a short window of rates
+
+        Returns False when the window does not overlap the committed state
+        (bars were missed), in which case the caller must seed() again.
+        """
+        if self.last_closed_time is None:
+            return False
+        if int(rates[0][0]) > self.last_closed_time:
+            return False
+        for rate in rates[:-1]:
+            if int(rate[0]) > self.last_closed_time:
+                self._commit(self._bar(rate))
+        self.forming_bar = self._bar(rates[-1])
+        return True
+
+    def replay(self, bar, new_bar):
+        """Bar-by-bar replay: bar is the forming bar; new_bar commits the previous one first"""
+        if new_bar and self.forming_bar is not None:
+            self._commit(self.forming_bar)
+        self.forming_bar = bar
+
+    @property
+    def bar_count(self):
+        """Bars in the equivalent full window, including the forming bar"""
+        return min(self.total_bars + 1, self.history)
+
+    def snapshot(self):
+        """Current values (with the forming bar) and previous values (closed bars)"""
+        _, _, high, low, close = self.forming_bar
+        values = {}
+        prev = {}
+        for period, sma in self.smas.items():
+            values[f"ma{period}"] = sma.peek(close)
+            prev[f"ma{period}"] = sma.value
+        for period, ema in self.emas.items():
+            values[f"ema{period}"] = ema.peek(close)
+            prev[f"ema{period}"] = ema.value
+        values["rsi"] = self.rsi.peek(close)
+        prev["rsi"] = self.rsi.value
+        values["bb_upper"], values["bb_middle"], values["bb_lower"] = self.bollinger.peek(close)
+        values["atr"] = self.atr.peek(high, low)
+        return values, prev
+
+    def window(self):
+        """Recent closed bars followed by the forming bar, as (time, o, h, l, c)"""
+        return list(self.closed_bars) + [self.forming_bar]
+
+
+class ResampledEngine:
+    """IndicatorEngine for a higher timeframe built from base-timeframe bars
+
+    Higher bars are aggregated from the local candle series instead of being
+    fetched from the terminal. Each scan only resamples the base bars since
+    the last closed higher bar, so a confirmation timeframe costs no MT5 call.
+    """
+
+    def __init__(self, minutes, base_minutes=1, history=200):
+        self.minutes = minutes
+        self.seconds = minutes * 60
+        self.factor = minutes // base_minutes
+        self.engine = IndicatorEngine(history=history)
+
+    def sync(self, series):
+        """Feed the resampled bars of series into the engine; False without data"""
+        engine = self.engine
+        if engine.last_closed_time is not None:
+            rates = indicators.resample(series.since(engine.last_closed_time), self.seconds)
+            if len(rates) > 0 and engine.update(rates):
+                return True
+
+        # Seed from enough base bars for the full window plus one partial bucket
+        base = series.window((engine.history + 1) * self.factor)
+        rates = indicators.resample(base, self.seconds)
+        if len(rates) > 1 and rates[0]['time'] < base[0]['time']:
+            rates = rates[1:]
+        if len(rates) == 0:
+            return False
+        engine.seed(rates)
+        return True
@@ -0,0 +1,188 @@
+"""
+Indicators - NumPy-vectorized technical indicator kernels
+Shared by the trading agent and the web interface. Every function works
+directly on the columns of the record array returned by copy_rates_from_pos
+and returns the full indicator series (NaN where there is not enough data).
+"""
+
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Try to import SciPy for the IIR filter used by EMA/RSI
+try:
+    from scipy.signal import lfilter
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+# Largest growth factor allowed inside one closed-form EMA chunk
+_EMA_CHUNK_GROWTH = 1e6
+
+
+def ohlc(rates):
+    """Return (opens, highs, lows, closes) float arrays from MT5 rates"""
+    if getattr(rates, 'dtype', None) is not None and rates.dtype.names:
+        return (rates['open'].astype(float), rates['high'].astype(float),
+                rates['low'].astype(float), rates['close'].astype(float))
+    arr = np.asarray([tuple(r)[1:5] for r in rates], dtype=float).reshape(-1, 4)
+    return arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3]
+
+
+def last_value(series, offset=-1):
+    """Value of a series at offset as a float, or None if missing"""
+    if len(series) < -offset:
+        return None
+    value = series[offset]
+    return None if np.isnan(value) else float(value)
+
+
+def _ema_filter(values, alpha):
+    """y[0] = x[0], y[t] = (1 - alpha) * y[t-1] + alpha * x[t]"""
+    x = np.asarray(values, dtype=float)
+    if len(x) == 0 or alpha >= 1:
+        return x.copy()
+    decay = 1.0 - alpha
+    if SCIPY_AVAILABLE:
+        y, _ = lfilter([alpha], [1.0, -decay], x, zi=[decay * x[0]])
+        return y
+
+    # Closed form per chunk: y[k] = d^(k+1) * y0 + a * d^k * cumsum(x[j] / d^j)
+    # Chunks keep d^-k bounded so the cumulative sum stays accurate
+    chunk = max(1, int(math.log(_EMA_CHUNK_GROWTH) / -math.log(decay)))
+    powers = decay ** np.arange(chunk + 1)
+    y = np.empty_like(x)
+    prev = x[0]
+    for start in range(0, len(x), chunk):
+        seg = x[start:start + chunk]
+        n = len(seg)
+        scaled = np.cumsum(seg / powers[:n])
+        y[start:start + n] = powers[1:n + 1] * prev + alpha * powers[:n] * scaled
+        prev = y[start + n - 1]
+    return y
+
+
+def sma(values, period):
+    """Simple moving average via cumulative sums"""
+    x = np.asarray(values, dtype=float)
+    out = np.full(len(x), np.nan)
+    if len(x) < period:
+        return out
+    # Shift by the first value to keep the cumulative sum small
+    base = x[0]
+    csum = np.concatenate(([0.0], np.cumsum(x - base)))
+    out[period - 1:] = (csum[period:] - csum[:-period]) / period + base
+    return out
+
+
+def ema(values, period, warmup=True):
+    """Exponential moving average seeded with the first value
+
+    With warmup=True the first period-1 values are NaN, matching the
+    "not enough bars" rule used by the trading agent.
+    """
+    out = _ema_filter(values, 2 / (period + 1))
+    if warmup:
+        out[:period - 1] = np.nan
+    return out
+
+
+def wilder_averages(closes, period=14):
+    """Wilder-smoothed average gain/loss series aligned to the deltas"""
+    deltas = np.diff(np.asarray(closes, dtype=float))
+    avg_gain = np.full(len(deltas), np.nan)
+    avg_loss = np.full(len(deltas), np.nan)
+    if len(deltas) < period:
+        return avg_gain, avg_loss
+    gains = np.where(deltas > 0, deltas, 0.0)
+    losses = np.where(deltas < 0, -deltas, 0.0)
+    # Seed with the simple average of the first period, then smooth with 1/period
+    seeded_gains = np.concatenate(([gains[:period].mean()], gains[period:]))
+    seeded_losses = np.concatenate(([losses[:period].mean()], losses[period:]))
+    avg_gain[period - 1:] = _ema_filter(seeded_gains, 1 / period)
+    avg_loss[period - 1:] = _ema_filter(seeded_losses, 1 / period)
+    return avg_gain, avg_loss
+
+
+def rsi(closes, period=14):
+    """Relative Strength Index (Wilder)"""
+    out = np.full(len(closes), np.nan)
+    avg_gain, avg_loss = wilder_averages(closes, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = 100 - 100 / (1 + avg_gain / avg_loss)
+    values = np.where(avg_loss == 0, 100.0, values)
+    values[np.isnan(avg_gain)] = np.nan
+    out[1:] = values
+    return out
+
+
+def macd(closes, fast=12, slow=26, signal=9):
+    """MACD line, signal line and histogram"""
+    macd_line = ema(closes, fast) - ema(closes, slow)
+    signal_line = np.full(len(macd_line), np.nan)
+    valid = np.flatnonzero(~np.isnan(macd_line))
+    if len(valid):
+        signal_line[valid[0]:] = ema(macd_line[valid[0]:], signal)
+    return macd_line, signal_line, macd_line - signal_line
+
+
+def bollinger(closes, period=20, std_dev=2):
+    """Bollinger bands (upper, middle, lower) with a rolling population std"""
+    x = np.asarray(closes, dtype=float)
+    middle = sma(x, period)
+    std = np.full(len(x), np.nan)
+    if len(x) >= period:
+        std[period - 1:] = sliding_window_view(x, period).std(axis=-1)
+    return middle + std_dev * std, middle, middle - std_dev * std
+
+
+def true_range(highs, lows, closes):
+    """True range series (first bar has no previous close and is NaN)"""
+    highs = np.asarray(highs, dtype=float)
+    lows = np.asarray(lows, dtype=float)
+    closes = np.asarray(closes, dtype=float)
+    tr = np.full(len(closes), np.nan)
+    if len(closes) > 1:
+        prev_close = closes[:-1]
+        tr[1:] = np.maximum.reduce([
+            highs[1:] - lows[1:],
+            np.abs(highs[1:] - prev_close),
+            np.abs(lows[1:] - prev_close),
+        ])
+    return tr
+
+
+def atr(highs, lows, closes, period=14):
+    """Average True Range as a rolling mean of the true range"""
+    tr = true_range(highs, lows, closes)
+    out = np.full(len(tr), np.nan)
+    if len(tr) > period:
+        out[1:] = sma(tr[1:], period)
+    return out
+
+
+def resample(rates, seconds):
+    """Aggregate MT5 rates into bars of seconds, aligned to multiples of it
+
+    Works on any record array with the copy_rates_* field names and returns
+    the same dtype: first open, highest high, lowest low, last close and
+    summed volumes per bucket.
+    """
+    if len(rates) == 0:
+        return rates[:0].copy()
+    buckets = rates['time'] // seconds * seconds
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.concatenate((starts[1:], [len(rates)])) - 1
+    out = np.zeros(len(starts), dtype=rates.dtype)
+    out['time'] = buckets[starts]
+    out['open'] = rates['open'][starts]
+    out['high'] = np.maximum.reduceat(rates['high'], starts)
+    out['low'] = np.minimum.reduceat(rates['low'], starts)
+    out['close'] = rates['close'][ends]
+    names = rates.dtype.names
+    for name in ('tick_volume', 'real_volume'):
+        if name in names:
+            out[name] = np.add.reduceat(rates[name], starts)
+    if 'spread' in names:
+        out['spread'] = rates['spread'][ends]
+    return out
@@ -0,0 +1,220 @@
+"""
+LLM Store - Content-addressed record/replay of Ollama generations
+Every generation is stored in SQLite under a hash of the model, the system
+prompt and the user prompt (plus output options such as a JSON schema),
+together with its latency and token counts. In replay mode a stored answer
+is served without contacting Ollama, so re-running a day of scans or a
+backtest needs no model. The file is kept under a size bound by evicting
+the least recently used answers.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+LLM_STORE_FILE = "E:\\TradingSystem\\llm_store.sqlite"
+
+# Upper bound of the stored response text
+LLM_STORE_MAX_MB = 200
+
+# Fraction of the bound kept after an eviction pass (avoids evicting on every insert)
+EVICT_TARGET = 0.9
+
+# off: pass through; record: call the model and store every answer;
+# replay: serve stored answers, call (and record) the model on a miss;
+# replay_only: serve stored answers, never call the model
+STORE_MODES = ('off', 'record', 'replay', 'replay_only')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    system_hash TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    response TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    latency_ms REAL,
+    prompt_eval_count INTEGER,
+    eval_count INTEGER,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS generations_last_used ON generations (last_used);
+"""
+
+
+def text_hash(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def request_key(model, system_hash, prompt_hash, options=None):
+    """Content address of one generation request"""
+    parts = [model, system_hash, prompt_hash]
+    if options:
+        parts.append(json.dumps(options, sort_keys=True, ensure_ascii=False))
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class LLMStore:
+    """SQLite-backed generation store shared by the agent's Ollama calls
+
+    The connection is shared across threads behind a lock; every write is
+    committed immediately (WAL journal), which is cheap next to a model call.
+    Store errors are logged once and turn the store off instead of failing
+    the scan.
+    """
+
+    def __init__(self, path=LLM_STORE_FILE, mode='record', max_mb=LLM_STORE_MAX_MB, log=None):
+        self.path = path
+        self.mode = mode if mode in STORE_MODES else 'record'
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.log = log
+        self.lock = threading.Lock()
+        self.db = None
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.records = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def configure(self, mode, max_mb=LLM_STORE_MAX_MB):
+        self.mode = mode if mode in STORE_MODES else 'record'
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    @property
+    def replaying(self):
+        return self.mode in ('replay', 'replay_only')
+
+    def _open(self):
+        if self.db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(_SCHEMA)
+            self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+        return self.db
+
+    def _fail(self, e):
+        self.errors += 1
+        if self.log:
+            self.log(f"LLM记录库错误，已停用: {str(e)}")
+        self.mode = 'off'
+
+    # ========== Replay ==========
+
+    def lookup(self, model, system_prompt, prompt, options=None):
+        """(served, response) for a request in replay modes
+
+        served is False when the model has to be called. A replay_only
+        miss is served with response None, like a failed call.
+        """
+        if not self.replaying:
+            return False, None
+        key = request_key(model, text_hash(system_prompt), text_hash(prompt), options)
+        with self.lock:
+            try:
+                db = self._open()
+                row = db.execute("SELECT response FROM generations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE generations SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                               (time.time(), key))
+                    db.commit()
+            except (sqlite3.Error, OSError) as e:
+                self._fail(e)
+                return False, None
+            if row is not None:
+                self.hits += 1
+                return True, row[0]
+            self.misses += 1
+        if self.mode == 'replay_only':
+            return True, None
+        return False, None
+
+    # ========== Record ==========
+
+    def record(self, model, system_prompt, prompt, response, latency_ms, body=None, options=None,
+               complete=True):
+        """Store one answer; complete=False for a stream cancelled after the decision line"""
+        if self.mode == 'off' or not response:
+            return
+        system_hash, prompt_hash = text_hash(system_prompt), text_hash(prompt)
+        key = request_key(model, system_hash, prompt_hash, options)
+        size = len(response.encode('utf-8'))
+        now = time.time()
+        body = body or {}
+        with self.lock:
+            try:
+                db = self._open()
+                old = db.execute("SELECT size FROM generations WHERE key = ?", (key,)).fetchone()
+                db.execute(
+                    "INSERT OR REPLACE INTO generations (key, model, system_hash, prompt_hash, response, "
+                    "complete, latency_ms, prompt_eval_count, eval_count, size, created, last_used, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                    (key, model, system_hash, prompt_hash, response, int(complete), latency_ms,
+                     body.get('prompt_eval_count'), body.get('eval_count'), size, now, now))
+                self.total_bytes += size - (old[0] if old else 0)
+                self.records += 1
+                if self.total_bytes > self.max_bytes:
+                    self._evict(db)
+                db.commit()
+            except (sqlite3.Error, OSError) as e:
+                self._fail(e)
+
+    def _evict(self, db):
+        """Drop least recently used answers down to EVICT_TARGET of the bound"""
+        target = self.max_bytes * EVICT_TARGET
+        rows = db.execute("SELECT key, size FROM generations ORDER BY last_used").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            doomed.append((key,))
+            self.total_bytes -= size
+        db.executemany("DELETE FROM generations WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def clear(self):
+        with self.lock:
+            try:
+                db = self._open()
+                db.execute("DELETE FROM generations")
+                db.commit()
+                self.total_bytes = 0
+            except (sqlite3.Error, OSError) as e:
+                self._fail(e)
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def stats(self):
+        with self.lock:
+            entries = None
+            if self.db is not None:
+                try:
+                    entries = self.db.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            lookups = self.hits + self.misses
+            return {
+                'mode': self.mode,
+                'entries': entries,
+                'size_mb': round(self.total_bytes / 1024 / 1024, 2),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'records': self.records,
+                'evictions': self.evictions,
+                'errors': self.errors,
+            }
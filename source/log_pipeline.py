@@ -0,0 +1,142 @@
+"""
+Log Pipeline - Non-blocking logging shared by the agent and the executor
+log() only appends to a bounded ring buffer; a background worker appends
+batches to the log file and ships them to the web UI in one POST per flush,
+so a slow disk or a stopped web UI never stalls the trading loop.
+"""
+
+import threading
+import time
+from collections import deque
+
+import requests
+
+# Web UI endpoint that accepts {'batch': [{'type', 'message'}, ...]}
+WEB_LOG_URL = "http://localhost:5000/save_log"
+
+# Records kept in memory before the oldest are dropped
+LOG_BUFFER_SIZE = 10000
+
+# Seconds between worker flushes
+LOG_FLUSH_INTERVAL = 0.5
+
+# Maximum records shipped to the web UI per POST
+WEB_BATCH_SIZE = 500
+
+# Seconds to stop shipping after the web UI could not be reached
+WEB_RETRY_INTERVAL = 5
+
+
+class LogPipeline:
+    """Bounded ring buffer drained by a background writer thread
+
+    Consecutive identical messages are coalesced into one record with a
+    repeat count; when the buffer is full the oldest record is dropped.
+    Both are counted in stats().
+    """
+
+    def __init__(self, log_file, web_url=WEB_LOG_URL, capacity=LOG_BUFFER_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL):
+        self.log_file = log_file
+        self.web_url = web_url
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.buffer = deque()
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.session = requests.Session()
+        self.web_retry_at = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.written = 0
+        self.shipped = 0
+        self.web_skipped = 0
+        self.file_errors = 0
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def emit(self, line, message, record_type='log'):
+        """Queue a formatted log line; never blocks on I/O"""
+        with self.lock:
+            self.enqueued += 1
+            if self.buffer:
+                last = self.buffer[-1]
+                if last[1] == message and last[2] == record_type:
+                    last[3] += 1
+                    self.coalesced += 1
+                    return
+            if len(self.buffer) >= self.capacity:
+                self.buffer.popleft()
+                self.dropped += 1
+            self.buffer.append([line, message, record_type, 1])
+
+    def run(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Logging must never take the process down
+                time.sleep(self.flush_interval)
+
+    def _take(self):
+        with self.lock:
+            batch = list(self.buffer)
+            self.buffer.clear()
+        return batch
+
+    def flush(self):
+        """Drain the buffer now (also used before log rotation)"""
+        with self.write_lock:
+            batch = self._take()
+            if not batch:
+                return
+            self._write_file(batch)
+            self._ship(batch)
+
+    def _write_file(self, batch):
+        lines = []
+        for line, _, _, repeat in batch:
+            lines.append(line if repeat == 1 else f"{line} (重复{repeat}次)")
+        try:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            self.written += len(batch)
+        except Exception:
+            self.file_errors += 1
+
+    def _ship(self, batch):
+        if not self.web_url:
+            return
+        if time.time() < self.web_retry_at:
+            self.web_skipped += len(batch)
+            return
+        records = [{'type': record_type, 'message': message if repeat == 1 else f"{message} (重复{repeat}次)"}
+                   for _, message, record_type, repeat in batch]
+        for i in range(0, len(records), WEB_BATCH_SIZE):
+            chunk = records[i:i + WEB_BATCH_SIZE]
+            try:
+                self.session.post(self.web_url, json={'batch': chunk}, timeout=(0.5, 2))
+                self.shipped += len(chunk)
+            except Exception:
+                # Web interface might not be running; back off instead of retrying every flush
+                self.web_retry_at = time.time() + WEB_RETRY_INTERVAL
+                self.web_skipped += len(records) - i
+                return
+
+    def stats(self):
+        with self.lock:
+            pending = len(self.buffer)
+        return {
+            'pending': pending,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'written': self.written,
+            'shipped': self.shipped,
+            'web_skipped': self.web_skipped,
+            'file_errors': self.file_errors,
+        }
@@ -0,0 +1,611 @@
+"""
+Mock MT5 - Simulated MetaTrader5 terminal for hardware-free load and latency tests
+A drop-in stand-in for the MetaTrader5 package. install() registers it under
+that name before the agents import it; prices come from a seeded random walk
+or from recorded bars replayed on a simulated clock, and every API call can
+be given an artificial latency. Orders fill at the simulated quotes, SL/TP
+are triggered by the tick stream, and deals are kept for history queries.
+
+Usage (either agent, optionally under a profiler):
+    python mock_mt5.py [--latency-ms 2] [--speed 60] [--rates EURUSD=bars.csv] autogpt_trading.py
+    python -m cProfile -o scan.prof mock_mt5.py executor_agent.py
+"""
+
+import argparse
+import random
+import runpy
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from candle_store import RATE_DTYPE
+
+# ========== MetaTrader5 constants used by the system ==========
+
+TIMEFRAME_M1, TIMEFRAME_M2, TIMEFRAME_M3, TIMEFRAME_M4, TIMEFRAME_M5 = 1, 2, 3, 4, 5
+TIMEFRAME_M6, TIMEFRAME_M10, TIMEFRAME_M12, TIMEFRAME_M15, TIMEFRAME_M20, TIMEFRAME_M30 = 6, 10, 12, 15, 20, 30
+TIMEFRAME_H1, TIMEFRAME_H2, TIMEFRAME_H3, TIMEFRAME_H4 = 16385, 16386, 16387, 16388
+TIMEFRAME_H6, TIMEFRAME_H8, TIMEFRAME_H12, TIMEFRAME_D1 = 16390, 16392, 16396, 16408
+
+ORDER_TYPE_BUY, ORDER_TYPE_SELL = 0, 1
+POSITION_TYPE_BUY, POSITION_TYPE_SELL = 0, 1
+DEAL_TYPE_BUY, DEAL_TYPE_SELL = 0, 1
+DEAL_ENTRY_IN, DEAL_ENTRY_OUT = 0, 1
+DEAL_REASON_CLIENT, DEAL_REASON_EXPERT, DEAL_REASON_SL, DEAL_REASON_TP = 0, 3, 4, 5
+TRADE_ACTION_DEAL, TRADE_ACTION_SLTP = 1, 6
+ORDER_FILLING_FOK, ORDER_FILLING_IOC, ORDER_FILLING_RETURN = 0, 1, 2
+ORDER_TIME_GTC = 0
+BOOK_TYPE_SELL, BOOK_TYPE_BUY = 1, 2
+
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_PLACED = 10008
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_DONE_PARTIAL = 10010
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_PRICE_OFF = 10021
+TRADE_RETCODE_INVALID_FILL = 10030
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+RES_S_OK, RES_E_NOT_FOUND, RES_E_INVALID_PARAMS = 1, -4, -2
+
+# ========== Result records (field names follow the MetaTrader5 package) ==========
+
+SymbolInfo = namedtuple('SymbolInfo', [
+    'name', 'description', 'visible', 'select', 'digits', 'point', 'spread', 'trade_contract_size',
+    'trade_tick_size', 'trade_tick_value', 'volume_min', 'volume_max', 'volume_step', 'filling_mode',
+    'trade_mode', 'currency_base', 'currency_profit', 'bid', 'ask'])
+Tick = namedtuple('Tick', ['time', 'bid', 'ask', 'last', 'volume', 'time_msc', 'flags', 'volume_real'])
+BookInfo = namedtuple('BookInfo', ['type', 'price', 'volume', 'volume_dbl'])
+AccountInfo = namedtuple('AccountInfo', [
+    'login', 'server', 'name', 'currency', 'leverage', 'balance', 'equity', 'profit', 'margin', 'margin_free'])
+TradePosition = namedtuple('TradePosition', [
+    'ticket', 'time', 'time_msc', 'type', 'magic', 'identifier', 'volume', 'price_open', 'sl', 'tp',
+    'price_current', 'swap', 'profit', 'symbol', 'comment'])
+TradeDeal = namedtuple('TradeDeal', [
+    'ticket', 'order', 'time', 'time_msc', 'type', 'entry', 'magic', 'position_id', 'reason', 'volume',
+    'price', 'commission', 'swap', 'profit', 'fee', 'symbol', 'comment'])
+OrderSendResult = namedtuple('OrderSendResult', [
+    'retcode', 'deal', 'order', 'volume', 'price', 'bid', 'ask', 'comment', 'request_id',
+    'retcode_external', 'request'])
+TerminalInfo = namedtuple('TerminalInfo', ['connected', 'trade_allowed', 'name', 'build'])
+
+# ========== Simulation defaults ==========
+
+# name: (start price, digits, spread points, contract size, daily relative volatility)
+DEFAULT_SYMBOLS = {
+    'EURUSD': (1.0850, 5, 10, 100000, 0.005),
+    'GBPUSD': (1.2700, 5, 14, 100000, 0.006),
+    'USDJPY': (151.50, 3, 12, 100000, 0.006),
+    'XAUUSD': (2350.00, 2, 25, 100, 0.010),
+    'US30': (39000.0, 1, 20, 1, 0.009),
+}
+
+# Simulated seconds between live ticks, and between synthetic history ticks
+TICK_INTERVAL = 1.0
+HISTORY_TICK_INTERVAL = 15.0
+
+# Minutes of synthetic history before the simulation starts
+HISTORY_MINUTES = 20000
+
+# Simulated seconds of ticks generated ahead per extension
+TICK_CHUNK_SECONDS = 600
+
+# Price levels per side of the simulated order book
+BOOK_LEVELS = 10
+
+DEFAULT_BALANCE = 10000.0
+
+
+def timeframe_seconds(timeframe):
+    """Bar length of an MT5 timeframe constant (minutes below 16385)"""
+    if timeframe < 16385:
+        return timeframe * 60
+    if timeframe == TIMEFRAME_D1:
+        return 86400
+    return (timeframe - 16384) * 3600
+
+
+class PriceFeed:
+    """Bid ticks of one symbol on the simulated clock
+
+    Synthetic feeds extend a log random walk whenever the clock passes the
+    generated ticks; recorded feeds expand bars into open/extreme/extreme/close
+    ticks and stop at the last recorded bar.
+    """
+
+    def __init__(self, name, price, digits, spread, contract_size, volatility, start, seed, rates=None):
+        self.name = name
+        self.digits = digits
+        self.point = 10.0 ** -digits
+        self.spread = spread
+        self.contract_size = contract_size
+        self.sigma = volatility / np.sqrt(86400.0)  # per sqrt(second)
+        self.rng = np.random.default_rng(seed)
+        self.recorded = rates is not None
+        self.spread_series = None
+        if self.recorded:
+            self.times, self.bids = self._expand(rates, start)
+        else:
+            times = start - HISTORY_MINUTES * 60 + np.arange(0, HISTORY_MINUTES * 60, HISTORY_TICK_INTERVAL)
+            self.times = times
+            self.bids = self._walk(price, HISTORY_TICK_INTERVAL, len(times))
+
+    def _walk(self, last, dt, n):
+        steps = self.rng.normal(0.0, self.sigma * np.sqrt(dt), n)
+        return np.round(last * np.exp(np.cumsum(steps)), self.digits)
+
+    def _expand(self, rates, start):
+        """Bars -> 4 ticks each; the middle recorded bar is aligned to the start of the simulation"""
+        seconds = int(np.median(np.diff(rates['time']))) if len(rates) > 1 else 60
+        bullish = rates['close'] >= rates['open']
+        first = np.where(bullish, rates['low'], rates['high'])
+        second = np.where(bullish, rates['high'], rates['low'])
+        bids = np.column_stack((rates['open'], first, second, rates['close'])).ravel()
+        offsets = np.array([0.0, 0.25, 0.5, 0.75]) * seconds
+        aligned = rates['time'] - rates['time'][len(rates) // 2] + start // seconds * seconds
+        times = (aligned[:, None] + offsets).ravel().astype(float)
+        if rates['spread'].any():
+            self.spread_series = np.repeat(rates['spread'], 4)
+        return times, np.round(bids, self.digits)
+
+    def advance(self, now):
+        """Generate ticks up to now (synthetic feeds only)"""
+        while not self.recorded and self.times[-1] < now:
+            n = int(TICK_CHUNK_SECONDS / TICK_INTERVAL)
+            times = self.times[-1] + TICK_INTERVAL * np.arange(1, n + 1)
+            self.times = np.concatenate((self.times, times))
+            self.bids = np.concatenate((self.bids, self._walk(self.bids[-1], TICK_INTERVAL, n)))
+
+    def index(self, now):
+        """Index of the last tick at or before now"""
+        return max(int(np.searchsorted(self.times, now, side='right')) - 1, 0)
+
+    def spread_at(self, i):
+        return int(self.spread_series[i]) if self.spread_series is not None else self.spread
+
+    def quote(self, now):
+        i = self.index(now)
+        bid = float(self.bids[i])
+        return float(self.times[i]), bid, round(bid + self.spread_at(i) * self.point, self.digits)
+
+    def bars(self, seconds, t0, t1):
+        """Bars of length seconds built from the ticks in [t0, t1)"""
+        lo = int(np.searchsorted(self.times, t0, side='left'))
+        hi = int(np.searchsorted(self.times, t1, side='left'))
+        if hi <= lo:
+            return np.zeros(0, dtype=RATE_DTYPE)
+        times, bids = self.times[lo:hi], self.bids[lo:hi]
+        buckets = (times // seconds * seconds).astype(np.int64)
+        starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+        ends = np.concatenate((starts[1:], [len(bids)]))
+        out = np.zeros(len(starts), dtype=RATE_DTYPE)
+        out['time'] = buckets[starts]
+        out['open'] = bids[starts]
+        out['high'] = np.maximum.reduceat(bids, starts)
+        out['low'] = np.minimum.reduceat(bids, starts)
+        out['close'] = bids[ends - 1]
+        out['tick_volume'] = ends - starts
+        out['spread'] = [self.spread_at(lo + e - 1) for e in ends]
+        return out
+
+
+class SimulatedTerminal:
+    """State behind the module-level MetaTrader5 functions"""
+
+    def __init__(self, symbols=None, latency_ms=0.0, jitter_ms=0.0, speed=1.0, seed=1,
+                 balance=DEFAULT_BALANCE, recorded=None):
+        self.symbol_specs = dict(DEFAULT_SYMBOLS, **(symbols or {}))
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.speed = speed
+        self.seed = seed
+        self.recorded = recorded or {}  # symbol -> rates array
+        self.lock = threading.RLock()
+        self.random = random.Random(seed)
+        self.wall_start = time.time()
+        self.sim_start = float(int(self.wall_start))
+        self.feeds = {}
+        self.visible = set()
+        self.balance = balance
+        self.positions = {}   # ticket -> dict
+        self.deals = []
+        self.next_ticket = 1000
+        self.checked_until = {}  # symbol -> time up to which SL/TP were checked
+        self.error = (RES_S_OK, 'Success')
+        self.calls = {}  # function -> [count, total ms]
+
+    # ========== Clock and feeds ==========
+
+    def now(self):
+        return self.sim_start + (time.time() - self.wall_start) * self.speed
+
+    def feed(self, symbol):
+        feed = self.feeds.get(symbol)
+        if feed is None:
+            spec = self.symbol_specs.get(symbol)
+            if spec is None:
+                return None
+            price, digits, spread, contract_size, volatility = spec
+            seed = self.seed * 7919 + sum(map(ord, symbol))
+            feed = PriceFeed(symbol, price, digits, spread, contract_size, volatility,
+                             self.sim_start, seed, self.recorded.get(symbol))
+            self.feeds[symbol] = feed
+            self.checked_until[symbol] = self.sim_start
+        feed.advance(self.now())
+        return feed
+
+    def _ticket(self):
+        self.next_ticket += 1
+        return self.next_ticket
+
+    # ========== Positions ==========
+
+    def _profit(self, position, bid, ask, feed):
+        if position['type'] == POSITION_TYPE_BUY:
+            diff = bid - position['price_open']
+        else:
+            diff = position['price_open'] - ask
+        return diff * position['volume'] * feed.contract_size
+
+    def _trigger_stops(self, symbol, feed, now):
+        """Close positions whose SL/TP was crossed by the ticks since the last check"""
+        start = self.checked_until.get(symbol, now)
+        self.checked_until[symbol] = now
+        positions = [p for p in self.positions.values() if p['symbol'] == symbol and (p['sl'] or p['tp'])]
+        if not positions:
+            return
+        lo = int(np.searchsorted(feed.times, start, side='right'))
+        hi = int(np.searchsorted(feed.times, now, side='right'))
+        if hi <= lo:
+            return
+        bids = feed.bids[lo:hi]
+        asks = bids + feed.spread * feed.point
+        for p in positions:
+            buy = p['type'] == POSITION_TYPE_BUY
+            prices = bids if buy else asks
+            hits = []
+            if p['sl']:
+                hits.append((np.flatnonzero(prices <= p['sl'] if buy else prices >= p['sl']), p['sl'], DEAL_REASON_SL))
+            if p['tp']:
+                hits.append((np.flatnonzero(prices >= p['tp'] if buy else prices <= p['tp']), p['tp'], DEAL_REASON_TP))
+            hits = [(idx[0], price, reason) for idx, price, reason in hits if len(idx)]
+            if hits:
+                i, price, reason = min(hits)
+                when = float(feed.times[lo + i])
+                bid = price if buy else price - feed.spread * feed.point
+                self._close(p, p['volume'], bid, bid + feed.spread * feed.point, feed, when, reason,
+                            magic=p['magic'], comment='sl' if reason == DEAL_REASON_SL else 'tp')
+
+    def _close(self, position, volume, bid, ask, feed, when, reason, magic=0, comment=''):
+        share = dict(position, volume=volume)
+        profit = round(self._profit(share, bid, ask, feed), 2)
+        price = bid if position['type'] == POSITION_TYPE_BUY else ask
+        self.balance += profit
+        ticket = self._ticket()
+        self.deals.append(TradeDeal(
+            ticket, ticket, int(when), int(when * 1000),
+            DEAL_TYPE_SELL if position['type'] == POSITION_TYPE_BUY else DEAL_TYPE_BUY,
+            DEAL_ENTRY_OUT, magic, position['ticket'], reason, volume, price, 0.0, 0.0, profit, 0.0,
+            position['symbol'], comment))
+        position['volume'] = round(position['volume'] - volume, 8)
+        if position['volume'] <= 0:
+            del self.positions[position['ticket']]
+        return ticket, price
+
+    def refresh(self):
+        """Advance every feed with open positions and fire their stops"""
+        now = self.now()
+        for symbol in {p['symbol'] for p in self.positions.values()}:
+            self._trigger_stops(symbol, self.feed(symbol), now)
+
+    def position_record(self, p):
+        feed = self.feed(p['symbol'])
+        _, bid, ask = feed.quote(self.now())
+        return TradePosition(
+            p['ticket'], int(p['time']), int(p['time'] * 1000), p['type'], p['magic'], p['ticket'],
+            p['volume'], p['price_open'], p['sl'], p['tp'], bid if p['type'] == POSITION_TYPE_BUY else ask,
+            0.0, round(self._profit(p, bid, ask, feed), 2), p['symbol'], p['comment'])
+
+    # ========== Orders ==========
+
+    def order_send(self, request):
+        action = request.get('action')
+        symbol = request.get('symbol')
+        feed = self.feed(symbol) if symbol else None
+        if feed is None:
+            return self._result(TRADE_RETCODE_INVALID, request, comment='Invalid symbol')
+        now = self.now()
+        self._trigger_stops(symbol, feed, now)
+        _, bid, ask = feed.quote(now)
+
+        if action == TRADE_ACTION_SLTP:
+            position = self.positions.get(request.get('position'))
+            if position is None:
+                return self._result(TRADE_RETCODE_POSITION_CLOSED, request, bid=bid, ask=ask)
+            position['sl'], position['tp'] = request.get('sl', 0.0), request.get('tp', 0.0)
+            return self._result(TRADE_RETCODE_DONE, request, bid=bid, ask=ask)
+        if action != TRADE_ACTION_DEAL:
+            return self._result(TRADE_RETCODE_INVALID, request, bid=bid, ask=ask)
+        if request.get('type_filling') not in (ORDER_FILLING_FOK, ORDER_FILLING_IOC, ORDER_FILLING_RETURN):
+            return self._result(TRADE_RETCODE_INVALID_FILL, request, bid=bid, ask=ask)
+
+        volume = float(request.get('volume', 0))
+        if volume < 0.01 or volume > 100:
+            return self._result(TRADE_RETCODE_INVALID_VOLUME, request, bid=bid, ask=ask)
+        is_buy = request.get('type') == ORDER_TYPE_BUY
+        price = ask if is_buy else bid
+        requested = request.get('price') or price
+        if abs(requested - price) > request.get('deviation', 0) * feed.point:
+            return self._result(TRADE_RETCODE_REQUOTE, request, bid=bid, ask=ask)
+
+        ticket = request.get('position')
+        if ticket:
+            position = self.positions.get(ticket)
+            if position is None:
+                return self._result(TRADE_RETCODE_POSITION_CLOSED, request, bid=bid, ask=ask)
+            deal, price = self._close(position, min(volume, position['volume']), bid, ask, feed, now,
+                                      DEAL_REASON_EXPERT, request.get('magic', 0), request.get('comment', ''))
+            return self._result(TRADE_RETCODE_DONE, request, deal, deal, volume, price, bid, ask)
+
+        sl, tp = request.get('sl') or 0.0, request.get('tp') or 0.0
+        if (sl and (sl >= bid if is_buy else sl <= ask)) or (tp and (tp <= ask if is_buy else tp >= bid)):
+            return self._result(TRADE_RETCODE_INVALID_STOPS, request, bid=bid, ask=ask)
+        ticket = self._ticket()
+        position = {'ticket': ticket, 'time': now, 'symbol': symbol, 'volume': volume,
+                    'type': POSITION_TYPE_BUY if is_buy else POSITION_TYPE_SELL, 'price_open': price,
+                    'sl': sl, 'tp': tp, 'magic': request.get('magic', 0), 'comment': request.get('comment', '')}
+        self.positions[ticket] = position
+        self.deals.append(TradeDeal(
+            ticket, ticket, int(now), int(now * 1000), DEAL_TYPE_BUY if is_buy else DEAL_TYPE_SELL,
+            DEAL_ENTRY_IN, position['magic'], ticket, DEAL_REASON_EXPERT, volume, price, 0.0, 0.0, 0.0, 0.0,
+            symbol, position['comment']))
+        return self._result(TRADE_RETCODE_DONE, request, ticket, ticket, volume, price, bid, ask)
+
+    def _result(self, retcode, request, deal=0, order=0, volume=0.0, price=0.0, bid=0.0, ask=0.0, comment=''):
+        if retcode == TRADE_RETCODE_DONE and not comment:
+            comment = 'Request executed'
+        return OrderSendResult(retcode, deal, order, volume, price, bid, ask, comment, 0, 0, request)
+
+    # ========== Book ==========
+
+    def book(self, symbol):
+        feed = self.feed(symbol)
+        if feed is None:
+            return None
+        _, bid, ask = feed.quote(self.now())
+        rng = random.Random(self.seed * 7919 + sum(map(ord, symbol)) + int(self.now()))
+        asks = [round(ask + i * feed.point, feed.digits) for i in range(BOOK_LEVELS - 1, -1, -1)]
+        bids = [round(bid - i * feed.point, feed.digits) for i in range(BOOK_LEVELS)]
+        levels = [(BOOK_TYPE_SELL, price) for price in asks] + [(BOOK_TYPE_BUY, price) for price in bids]
+        book = []
+        for kind, price in levels:
+            volume = rng.randint(1, 50)
+            book.append(BookInfo(kind, price, volume, float(volume)))
+        return tuple(book)
+
+    def stats(self):
+        with self.lock:
+            return {name: {'calls': count, 'avg_ms': round(total / count, 3) if count else None}
+                    for name, (count, total) in sorted(self.calls.items())}
+
+
+_terminal = SimulatedTerminal()
+
+
+def configure(**settings):
+    """Replace the simulated terminal, e.g. configure(latency_ms=5, speed=60, seed=3)"""
+    global _terminal
+    _terminal = SimulatedTerminal(**settings)
+    return _terminal
+
+
+def install(**settings):
+    """Register this module as MetaTrader5 (call before the agents are imported)"""
+    if settings:
+        configure(**settings)
+    sys.modules['MetaTrader5'] = sys.modules[__name__]
+    return _terminal
+
+
+def _api(func):
+    """Apply the configured latency, serialize state access and count the call"""
+    name = func.__name__
+
+    def wrapper(*args, **kwargs):
+        terminal = _terminal
+        start = time.perf_counter()
+        delay = terminal.latency_ms + (terminal.random.uniform(0, terminal.jitter_ms) if terminal.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        with terminal.lock:
+            result = func(terminal, *args, **kwargs)
+            entry = terminal.calls.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += (time.perf_counter() - start) * 1000
+        return result
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def _seconds(value):
+    """datetime (naive = local, like the MetaTrader5 package) or epoch -> epoch seconds"""
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+# ========== MetaTrader5 API ==========
+
+@_api
+def initialize(t, *args, **kwargs):
+    t.error = (RES_S_OK, 'Success')
+    return True
+
+
+@_api
+def shutdown(t):
+    return True
+
+
+@_api
+def last_error(t):
+    return t.error
+
+
+@_api
+def version(t):
+    return (500, 4000, 'simulated')
+
+
+@_api
+def terminal_info(t):
+    return TerminalInfo(True, True, 'Simulated MT5', 4000)
+
+
+@_api
+def account_info(t):
+    t.refresh()
+    profit = sum(t.position_record(p).profit for p in t.positions.values())
+    return AccountInfo(10000001, 'Simulated-Server', 'Simulated', 'USD', 100, round(t.balance, 2),
+                       round(t.balance + profit, 2), round(profit, 2), 0.0, round(t.balance + profit, 2))
+
+
+@_api
+def symbol_info(t, symbol):
+    feed = t.feed(symbol)
+    if feed is None:
+        t.error = (RES_E_NOT_FOUND, f'Symbol {symbol} not found')
+        return None
+    _, bid, ask = feed.quote(t.now())
+    visible = symbol in t.visible
+    return SymbolInfo(symbol, f'{symbol} (simulated)', visible, visible, feed.digits, feed.point, feed.spread,
+                      feed.contract_size, feed.point, feed.point * feed.contract_size, 0.01, 100.0, 0.01,
+                      3, 4, symbol[:3], symbol[3:] or 'USD', bid, ask)
+
+
+@_api
+def symbol_select(t, symbol, enable=True):
+    if t.feed(symbol) is None:
+        return False
+    (t.visible.add if enable else t.visible.discard)(symbol)
+    return True
+
+
+@_api
+def symbol_info_tick(t, symbol):
+    feed = t.feed(symbol)
+    if feed is None:
+        t.error = (RES_E_NOT_FOUND, f'Symbol {symbol} not found')
+        return None
+    when, bid, ask = feed.quote(t.now())
+    return Tick(int(when), bid, ask, 0.0, 0, int(when * 1000), 6, 0.0)
+
+
+@_api
+def copy_rates_from_pos(t, symbol, timeframe, start_pos, count):
+    feed = t.feed(symbol)
+    if feed is None:
+        t.error = (RES_E_NOT_FOUND, f'Symbol {symbol} not found')
+        return None
+    seconds = timeframe_seconds(timeframe)
+    now = t.now()
+    current = now // seconds * seconds
+    t0 = current - (start_pos + count - 1) * seconds
+    t1 = min(current - (start_pos - 1) * seconds, np.nextafter(now, np.inf))
+    return feed.bars(seconds, t0, t1)
+
+
+@_api
+def copy_rates_range(t, symbol, timeframe, date_from, date_to):
+    feed = t.feed(symbol)
+    if feed is None:
+        t.error = (RES_E_NOT_FOUND, f'Symbol {symbol} not found')
+        return None
+    seconds = timeframe_seconds(timeframe)
+    t0 = _seconds(date_from) // seconds * seconds
+    t1 = min(_seconds(date_to) // seconds * seconds + seconds, np.nextafter(t.now(), np.inf))
+    return feed.bars(seconds, t0, t1)
+
+
+@_api
+def market_book_add(t, symbol):
+    return t.feed(symbol) is not None
+
+
+@_api
+def market_book_get(t, symbol):
+    return t.book(symbol)
+
+
+@_api
+def market_book_release(t, symbol):
+    return True
+
+
+@_api
+def positions_get(t, symbol=None, ticket=None, group=None):
+    t.refresh()
+    return tuple(t.position_record(p) for p in list(t.positions.values())
+                 if (symbol is None or p['symbol'] == symbol) and (ticket is None or p['ticket'] == ticket))
+
+
+@_api
+def positions_total(t):
+    t.refresh()
+    return len(t.positions)
+
+
+@_api
+def history_deals_get(t, date_from=None, date_to=None, **kwargs):
+    t.refresh()
+    lo = _seconds(date_from) if date_from is not None else float('-inf')
+    hi = _seconds(date_to) if date_to is not None else float('inf')
+    return tuple(d for d in t.deals if lo <= d.time <= hi)
+
+
+@_api
+def order_send(t, request):
+    return t.order_send(request)
+
+
+def stats():
+    """Per-function call counts and average latency (including the simulated delay)"""
+    return _terminal.stats()
+
+
+def _parse_symbol_file(text):
+    symbol, _, path = text.partition('=')
+    return symbol, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a script against the simulated MT5 terminal")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="delay added to every API call")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="uniform random extra delay")
+    parser.add_argument('--speed', type=float, default=1.0, help="simulated seconds per wall second")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--balance', type=float, default=DEFAULT_BALANCE)
+    parser.add_argument('--rates', action='append', default=[], type=_parse_symbol_file,
+                        metavar='SYMBOL=CSV', help="replay recorded bars for a symbol")
+    parser.add_argument('script', help="script to run, e.g. autogpt_trading.py")
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    options = parser.parse_args()
+
+    recorded = {}
+    if options.rates:
+        from backtest import load_csv
+        recorded = {symbol: load_csv(path) for symbol, path in options.rates}
+    install(latency_ms=options.latency_ms, jitter_ms=options.jitter_ms, speed=options.speed,
+            seed=options.seed, balance=options.balance, recorded=recorded)
+    sys.argv = [options.script] + options.args
+    runpy.run_path(options.script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
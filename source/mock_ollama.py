@@ -0,0 +1,371 @@
+"""
+Mock Ollama - Local stand-in for the Ollama HTTP API with tunable latency
+Serves /api/generate (streamed NDJSON and non-streamed), /api/tags and
+/api/ps, so the agent, the web UI and the benchmarks can run without a
+model. Answers are scripted (regex rules from a JSON file) or rule based
+(a deterministic pick per prompt that quotes the prices computed in the
+prompt). Time to first token, token rate, parallel slots and queue depth
+are configurable; requests beyond the queue get 503 like a busy Ollama.
+
+Usage:
+    python mock_ollama.py [--port 11434] [--ttft-ms 300] [--tokens-per-sec 40] [--parallel 1] [--script rules.json]
+
+Script file: {"rules": [{"match": "<regex>", "response": "<text>"}, ...], "default": "<text>"}
+A response may be a list, which is cycled through on successive matches.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_client import OLLAMA_MODEL
+from prompt_templates import estimate_tokens
+
+MOCK_PORT = 11434
+
+# Delay before the first token (model load excluded), milliseconds
+MOCK_TTFT_MS = 300
+
+# Generation speed of a small quantized model on a desktop GPU
+MOCK_TOKENS_PER_SEC = 40.0
+
+# Prompt tokens evaluated per second (only the part not cached from the previous request)
+MOCK_PROMPT_TOKENS_PER_SEC = 2000.0
+
+# Requests generated at once (OLLAMA_NUM_PARALLEL) and waiting beyond that (OLLAMA_MAX_QUEUE)
+MOCK_PARALLEL = 1
+MOCK_MAX_QUEUE = 16
+
+# Share of rule-based answers per direction
+MOCK_DIRECTION_WEIGHTS = {"做多": 0.2, "做空": 0.2, "待机": 0.6}
+
+# Default num_predict when the request sets none
+MOCK_NUM_PREDICT = 512
+
+_TOKEN = re.compile(r'\s*[A-Za-z]{1,4}|\s*\d{1,3}|\s*[^\sA-Za-z\d]|\s+')
+_PRICES = {
+    key: re.compile(pattern) for key, pattern in (
+        ('long_sl', r'做多止损价格:\s*([\d.]+)'), ('long_tp', r'做多止盈价格:\s*([\d.]+)'),
+        ('short_sl', r'做空止损价格:\s*([\d.]+)'), ('short_tp', r'做空止盈价格:\s*([\d.]+)'),
+    )
+}
+_COMPACT_PRICES = re.compile(r'-\s*(做多|做空) 止损([\d.]+) 止盈([\d.]+)')
+
+
+def split_tokens(text):
+    """Rough token pieces of text (one CJK character or a short latin/digit run each)"""
+    return _TOKEN.findall(text) or ([text] if text else [])
+
+
+def prompt_prices(prompt):
+    """SL/TP prices the agent computed, as found in the analysis prompt"""
+    prices = {}
+    for key, pattern in _PRICES.items():
+        match = pattern.search(prompt)
+        if match:
+            prices[key] = float(match.group(1))
+    for direction, sl, tp in _COMPACT_PRICES.findall(prompt):
+        side = 'long' if direction == "做多" else 'short'
+        prices.setdefault(f'{side}_sl', float(sl))
+        prices.setdefault(f'{side}_tp', float(tp))
+    return prices
+
+
+class Responder:
+    """Picks the answer text for a request"""
+
+    def __init__(self, script=None, weights=None, seed=0):
+        self.rules = []
+        self.default = None
+        self.weights = weights or MOCK_DIRECTION_WEIGHTS
+        self.seed = seed
+        self.cursors = {}
+        self.lock = threading.Lock()
+        if script:
+            with open(script, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.rules = [(re.compile(rule['match']), rule['response']) for rule in data.get('rules', [])]
+            self.default = data.get('default')
+
+    def _cycle(self, index, response):
+        if not isinstance(response, list):
+            return response
+        with self.lock:
+            n = self.cursors.get(index, 0)
+            self.cursors[index] = n + 1
+        return response[n % len(response)]
+
+    def direction(self, prompt):
+        """Deterministic weighted pick per prompt, so repeated prompts get the same answer"""
+        digest = hashlib.sha256(f"{self.seed}\0{prompt}".encode('utf-8')).digest()
+        point = int.from_bytes(digest[:8], 'big') / 2 ** 64 * sum(self.weights.values())
+        for direction, weight in self.weights.items():
+            point -= weight
+            if point < 0:
+                return direction
+        return "待机"
+
+    def answer(self, payload):
+        prompt = payload.get('prompt', '')
+        text = f"{payload.get('system', '')}\n{prompt}"
+        for index, (pattern, response) in enumerate(self.rules):
+            if pattern.search(text):
+                return self._cycle(index, response)
+        if self.default is not None:
+            return self._cycle(-1, self.default)
+
+        direction = self.direction(prompt)
+        prices = prompt_prices(prompt)
+        side = {'做多': 'long', '做空': 'short'}.get(direction)
+        sl, tp = (prices.get(f'{side}_sl'), prices.get(f'{side}_tp')) if side else (None, None)
+        if payload.get('format') is not None:
+            return json.dumps({"direction": direction, "sl": sl, "tp": tp, "confidence": 0.7,
+                               "reasons": ["模拟决策"]}, ensure_ascii=False)
+        if side is None:
+            return "待机\n理由: 模拟决策，信号不足"
+        if sl is not None and tp is not None:
+            return f"{direction} 止损{sl} 止盈{tp}\n理由: 模拟决策"
+        return f"{direction}\n理由: 模拟决策"
+
+
+class MockOllama:
+    """Timing model, slots and counters shared by the request handlers"""
+
+    def __init__(self, responder=None, ttft_ms=MOCK_TTFT_MS, tokens_per_sec=MOCK_TOKENS_PER_SEC,
+                 prompt_tokens_per_sec=MOCK_PROMPT_TOKENS_PER_SEC, parallel=MOCK_PARALLEL,
+                 max_queue=MOCK_MAX_QUEUE, models=None):
+        self.responder = responder or Responder()
+        self.ttft_ms = ttft_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.prompt_tokens_per_sec = prompt_tokens_per_sec
+        self.max_queue = max_queue
+        self.models = models or [OLLAMA_MODEL]
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.parallel = parallel
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.active = 0
+        self.last_prompt = ''  # prefix cache of the previous request
+        self.requests = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.peak_waiting = 0
+        self.queue_ms = 0.0
+
+    def enter(self):
+        """Wait for a generation slot; False when the queue is full"""
+        with self.lock:
+            self.requests += 1
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+        start = time.perf_counter()
+        self.slots.acquire()
+        with self.lock:
+            self.waiting -= 1
+            self.active += 1
+            self.queue_ms += (time.perf_counter() - start) * 1000
+        return True
+
+    def leave(self, completed):
+        with self.lock:
+            self.active -= 1
+            if completed:
+                self.completed += 1
+            else:
+                self.cancelled += 1
+        self.slots.release()
+
+    def prompt_eval(self, payload):
+        """(evaluated tokens, seconds) after reusing the prefix shared with the previous prompt"""
+        text = f"{payload.get('system', '')}\n{payload.get('prompt', '')}"
+        with self.lock:
+            cached = len(os.path.commonprefix([self.last_prompt, text]))
+            self.last_prompt = text
+        tokens = max(estimate_tokens(text[cached:]), 1)
+        return tokens, tokens / self.prompt_tokens_per_sec if self.prompt_tokens_per_sec > 0 else 0.0
+
+    def token_delay(self):
+        return 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def stats(self):
+        with self.lock:
+            started = self.completed + self.cancelled
+            return {
+                'requests': self.requests,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'rejected': self.rejected,
+                'active': self.active,
+                'waiting': self.waiting,
+                'peak_waiting': self.peak_waiting,
+                'avg_queue_ms': round(self.queue_ms / started, 1) if started else None,
+                'parallel': self.parallel,
+                'ttft_ms': self.ttft_ms,
+                'tokens_per_sec': self.tokens_per_sec,
+            }
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like Ollama, so the pooled client reuses connections
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json(200, {'models': [
+                {'name': name, 'model': name, 'modified_at': _timestamp(), 'size': 0,
+                 'details': {'format': 'gguf', 'family': 'mock'}} for name in self.mock.models]})
+        elif self.path == '/api/ps':
+            self._send_json(200, {'models': [{'name': name, 'model': name} for name in self.mock.models]})
+        elif self.path == '/api/version':
+            self._send_json(200, {'version': 'mock'})
+        elif self.path == '/stats':
+            self._send_json(200, self.mock.stats())
+        elif self.path == '/':
+            self._send_json(200, 'Ollama is running')
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON'})
+            return
+        if self.path != '/api/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+        model = payload.get('model')
+        if model not in self.mock.models:
+            self._send_json(404, {'error': f"model '{model}' not found"})
+            return
+        if not self.mock.enter():
+            self._send_json(503, {'error': 'server busy, please try again.  maximum pending requests exceeded'})
+            return
+        completed = False
+        try:
+            completed = self._generate(payload)
+        finally:
+            self.mock.leave(completed)
+
+    def _generate(self, payload):
+        """Emit the answer at the configured pace; False if the client went away"""
+        mock = self.mock
+        start = time.perf_counter()
+        prompt_tokens, prompt_seconds = mock.prompt_eval(payload)
+        time.sleep(mock.ttft_ms / 1000 + prompt_seconds)
+        prompt_done = time.perf_counter()
+
+        tokens = split_tokens(mock.responder.answer(payload))
+        num_predict = (payload.get('options') or {}).get('num_predict') or MOCK_NUM_PREDICT
+        done_reason = 'stop'
+        if num_predict > 0 and len(tokens) > num_predict:
+            tokens, done_reason = tokens[:num_predict], 'length'
+        stream = payload.get('stream', True)
+        delay = mock.token_delay()
+
+        if stream:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i and delay:
+                    time.sleep(delay)
+                if stream:
+                    self._chunk({'model': payload['model'], 'created_at': _timestamp(),
+                                 'response': token, 'done': False})
+            if not stream and delay and tokens:
+                time.sleep(delay * (len(tokens) - 1))
+            end = time.perf_counter()
+            final = {
+                'model': payload['model'], 'created_at': _timestamp(),
+                'response': '' if stream else ''.join(tokens), 'done': True, 'done_reason': done_reason,
+                'total_duration': int((end - start) * 1e9), 'load_duration': 0,
+                'prompt_eval_count': prompt_tokens, 'prompt_eval_duration': int(prompt_seconds * 1e9),
+                'eval_count': len(tokens), 'eval_duration': int((end - prompt_done) * 1e9),
+            }
+            if stream:
+                self._chunk(final)
+                self.wfile.write(b'0\r\n\r\n')
+            else:
+                self._send_json(200, final)
+            return True
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消流式生成（如已解析出决策行）
+            self.close_connection = True
+            return False
+
+    def _chunk(self, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8') + b'\n'
+        self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+def start_server(port=MOCK_PORT, host='127.0.0.1', **options):
+    """Serve on a background thread; returns (server, MockOllama). Stop with server.shutdown()"""
+    mock = MockOllama(**options)
+    handler = type('BoundMockOllamaHandler', (MockOllamaHandler,), {'mock': mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=MOCK_PORT)
+    parser.add_argument('--ttft-ms', type=float, default=MOCK_TTFT_MS, help="time to first token")
+    parser.add_argument('--tokens-per-sec', type=float, default=MOCK_TOKENS_PER_SEC, help="0 = instant")
+    parser.add_argument('--prompt-tokens-per-sec', type=float, default=MOCK_PROMPT_TOKENS_PER_SEC)
+    parser.add_argument('--parallel', type=int, default=MOCK_PARALLEL, help="requests generated at once")
+    parser.add_argument('--max-queue', type=int, default=MOCK_MAX_QUEUE, help="waiting requests before 503")
+    parser.add_argument('--script', help="JSON file with regex rules and responses")
+    parser.add_argument('--seed', type=int, default=0, help="changes the rule-based picks")
+    parser.add_argument('--model', action='append', help="model names served (default: OLLAMA_MODEL)")
+    options = parser.parse_args()
+
+    server, mock = start_server(
+        options.port, options.host, responder=Responder(options.script, seed=options.seed),
+        ttft_ms=options.ttft_ms, tokens_per_sec=options.tokens_per_sec,
+        prompt_tokens_per_sec=options.prompt_tokens_per_sec, parallel=options.parallel,
+        max_queue=options.max_queue, models=options.model)
+    print(f"Mock Ollama listening on http://{options.host}:{options.port} "
+          f"(ttft {options.ttft_ms}ms, {options.tokens_per_sec} tok/s, {options.parallel} parallel)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(mock.stats(), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+MT5 Trade Helpers - Request building and result handling for mt5.order_send
+"""
+
+# Try to import MT5 library
+try:
+    import MetaTrader5 as mt5
+    MT5_AVAILABLE = True
+except ImportError:
+    MT5_AVAILABLE = False
+
+# Magic number stamped on every order the system sends through the API
+MAGIC_NUMBER = 260220
+
+# Maximum price deviation (points) accepted for market orders
+DEVIATION_POINTS = 20
+
+# Bit flags of symbol_info().filling_mode
+SYMBOL_FILLING_FOK = 1
+SYMBOL_FILLING_IOC = 2
+
+# Trade server return codes
+RETCODE_REQUOTE = 10004
+RETCODE_PRICE_CHANGED = 10020
+RETCODE_PRICE_OFF = 10021
+RETCODE_INVALID_FILL = 10030
+RETCODE_SERVER_DISABLES_AT = 10026
+RETCODE_CLIENT_DISABLES_AT = 10027
+
+# Resent with a fresh tick
+RETRY_RETCODES = (RETCODE_REQUOTE, RETCODE_PRICE_CHANGED, RETCODE_PRICE_OFF)
+
+# Algo trading switched off - the order cannot go through the API at all
+AUTOTRADING_DISABLED_RETCODES = (RETCODE_SERVER_DISABLES_AT, RETCODE_CLIENT_DISABLES_AT)
+
+RETCODE_TEXT = {
+    10004: "重新报价",
+    10006: "请求被拒绝",
+    10008: "订单已下达",
+    10009: "请求已完成",
+    10010: "部分成交",
+    10013: "无效请求",
+    10014: "无效手数",
+    10015: "无效价格",
+    10016: "无效止损止盈",
+    10018: "市场已关闭",
+    10019: "资金不足",
+    10020: "价格已变化",
+    10021: "无报价",
+    10024: "请求过于频繁",
+    10026: "服务器禁止自动交易",
+    10027: "客户端禁止自动交易",
+    10030: "不支持的成交模式",
+}
+
+# Market orders are resent at most this many times on requotes/price changes
+MARKET_RETRIES = 2
+
+
+def filling_types(symbol_info):
+    """Order filling types the symbol allows, preferred first"""
+    allowed = getattr(symbol_info, 'filling_mode', 0) or 0
+    types = []
+    if allowed & SYMBOL_FILLING_FOK:
+        types.append(mt5.ORDER_FILLING_FOK)
+    if allowed & SYMBOL_FILLING_IOC:
+        types.append(mt5.ORDER_FILLING_IOC)
+    types.append(mt5.ORDER_FILLING_RETURN)
+    return types
+
+
+def filling_type(symbol_info):
+    """Pick an order filling type the symbol actually allows"""
+    return filling_types(symbol_info)[0]
+
+
+def round_volume(volume, symbol_info):
+    """Round a volume down to the symbol's volume step"""
+    step = getattr(symbol_info, 'volume_step', 0.01) or 0.01
+    steps = int(volume / step + 1e-9)
+    return round(steps * step, 8)
+
+
+def sltp_request(position, sl, tp):
+    """Request that modifies SL/TP of an open position"""
+    return {
+        "action": mt5.TRADE_ACTION_SLTP,
+        "symbol": position.symbol,
+        "position": position.ticket,
+        "sl": float(sl) if sl else 0.0,
+        "tp": float(tp) if tp else 0.0,
+        "magic": MAGIC_NUMBER,
+    }
+
+
+def close_request(position, volume, tick, symbol_info, comment="risk close"):
+    """Market request that closes volume of an open position"""
+    is_buy = position.type == mt5.POSITION_TYPE_BUY
+    return {
+        "action": mt5.TRADE_ACTION_DEAL,
+        "symbol": position.symbol,
+        "position": position.ticket,
+        "volume": float(volume),
+        "type": mt5.ORDER_TYPE_SELL if is_buy else mt5.ORDER_TYPE_BUY,
+        "price": tick.bid if is_buy else tick.ask,
+        "deviation": DEVIATION_POINTS,
+        "magic": MAGIC_NUMBER,
+        "comment": comment,
+        "type_time": mt5.ORDER_TIME_GTC,
+        "type_filling": filling_type(symbol_info),
+    }
+
+
+def market_request(symbol, is_buy, volume, tick, symbol_info, sl=None, tp=None,
+                   comment="", filling=None):
+    """Market request that opens a new position"""
+    return {
+        "action": mt5.TRADE_ACTION_DEAL,
+        "symbol": symbol,
+        "volume": float(volume),
+        "type": mt5.ORDER_TYPE_BUY if is_buy else mt5.ORDER_TYPE_SELL,
+        "price": tick.ask if is_buy else tick.bid,
+        "sl": float(sl) if sl else 0.0,
+        "tp": float(tp) if tp else 0.0,
+        "deviation": DEVIATION_POINTS,
+        "magic": MAGIC_NUMBER,
+        "comment": comment,
+        "type_time": mt5.ORDER_TIME_GTC,
+        "type_filling": filling if filling is not None else filling_type(symbol_info),
+    }
+
+
+def send_market(symbol, is_buy, volume, sl=None, tp=None, comment="", info=None):
+    """Open a position; resend on requotes and unsupported filling modes
+
+    info is the caller's cached symbol_info; fetched here if omitted.
+    Returns (ok, result, message) like send().
+    """
+    if info is None:
+        info = mt5.symbol_info(symbol)
+    if info is None:
+        return False, None, f"找不到品种{symbol}: {mt5.last_error()}"
+    fillings = filling_types(info)
+    attempts = 0
+    while True:
+        tick = mt5.symbol_info_tick(symbol)
+        if tick is None:
+            return False, None, f"无法获取{symbol}报价: {mt5.last_error()}"
+        request = market_request(symbol, is_buy, volume, tick, info, sl, tp, comment, fillings[0])
+        ok, result, message = send(request)
+        if ok or result is None:
+            return ok, result, message
+        if result.retcode == RETCODE_INVALID_FILL and len(fillings) > 1:
+            fillings.pop(0)
+            continue
+        if result.retcode in RETRY_RETCODES and attempts < MARKET_RETRIES:
+            attempts += 1
+            continue
+        return ok, result, message
+
+
+def send(request):
+    """Send a request; return (ok, result, message)"""
+    result = mt5.order_send(request)
+    if result is None:
+        return False, None, f"order_send返回空: {mt5.last_error()}"
+    ok = result.retcode in (mt5.TRADE_RETCODE_DONE, mt5.TRADE_RETCODE_PLACED,
+                            mt5.TRADE_RETCODE_DONE_PARTIAL)
+    text = RETCODE_TEXT.get(result.retcode, '')
+    return ok, result, f"retcode={result.retcode} {text} {getattr(result, 'comment', '')}".strip()
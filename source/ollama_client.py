@@ -0,0 +1,178 @@
+"""
+Ollama Client - Pooled keep-alive HTTP client shared by the agent and web UI
+One requests.Session per process keeps TCP connections to Ollama open, so a
+1-second scan loop does not pay connection setup on every call.
+"""
+
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from latency import LatencyHistogram
+
+# Configuration
+OLLAMA_HOST = "http://localhost:11434"
+OLLAMA_MODEL = "qwen2.5:3b-instruct-q4_K_M"
+OLLAMA_POOL_SIZE = 4         # Keep-alive connections kept per process
+OLLAMA_CONNECT_TIMEOUT = 3   # seconds
+OLLAMA_READ_TIMEOUT = 120    # seconds
+OLLAMA_MAX_RETRIES = 2       # Retries on connection errors and 502/503/504
+OLLAMA_BACKOFF_BASE = 0.2    # seconds, doubled per retry with full jitter
+OLLAMA_KEEP_ALIVE = "30m"    # Keeps the model and its prompt KV cache loaded between scans
+
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+class OllamaClient:
+    """requests.Session with a sized connection pool, split timeouts and retries"""
+
+    def __init__(self, host=OLLAMA_HOST, pool_size=OLLAMA_POOL_SIZE,
+                 connect_timeout=OLLAMA_CONNECT_TIMEOUT, read_timeout=OLLAMA_READ_TIMEOUT,
+                 max_retries=OLLAMA_MAX_RETRIES, backoff_base=OLLAMA_BACKOFF_BASE):
+        self.host = host.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.histograms = {}
+        self.retries = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.prompt_calls = 0
+        self.prompt_tokens = 0     # prompt tokens Ollama actually evaluated (cached prefix excluded)
+        self.prompt_eval_ms = 0.0
+        self.lock = threading.Lock()
+
+    def _observe(self, path, elapsed_ms):
+        with self.lock:
+            histogram = self.histograms.get(path)
+            if histogram is None:
+                histogram = self.histograms[path] = LatencyHistogram()
+            histogram.observe(elapsed_ms)
+
+    def _backoff(self, attempt):
+        with self.lock:
+            self.retries += 1
+        time.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, path, read_timeout=None, **kwargs):
+        """Send a request with retries; returns the Response or raises"""
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        url = self.host + path
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.exceptions.ConnectTimeout):
+                if attempt >= self.max_retries:
+                    with self.lock:
+                        self.errors += 1
+                    raise
+                self._backoff(attempt)
+                attempt += 1
+                continue
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                response.close()
+                self._backoff(attempt)
+                attempt += 1
+                continue
+            if not kwargs.get('stream'):
+                self._observe(path, (time.perf_counter() - start) * 1000)
+            return response
+
+    def post(self, path, payload, read_timeout=None, **kwargs):
+        return self.request('POST', path, read_timeout=read_timeout, json=payload, **kwargs)
+
+    def get(self, path, read_timeout=None, **kwargs):
+        return self.request('GET', path, read_timeout=read_timeout, **kwargs)
+
+    def stream_lines(self, path, payload, read_timeout=None):
+        """Yield complete text lines of a streamed generation
+
+        Closing the generator early closes the connection, which makes Ollama
+        stop generating. Time to the first line and to the end of the stream
+        are recorded as separate histograms.
+        """
+        start = time.perf_counter()
+        response = self.post(path, dict(payload, stream=True), read_timeout=read_timeout, stream=True)
+        first_line = True
+        try:
+            response.raise_for_status()
+            buffer = ''
+            for raw in response.iter_lines():
+                if not raw:
+                    continue
+                chunk = json.loads(raw)
+                if chunk.get('error'):
+                    raise RuntimeError(chunk['error'])
+                buffer += chunk.get('response', '')
+                while '\n' in buffer:
+                    line, buffer = buffer.split('\n', 1)
+                    if first_line:
+                        self._observe(path + ' first_line', (time.perf_counter() - start) * 1000)
+                        first_line = False
+                    yield line
+                if chunk.get('done'):
+                    self.observe_eval(chunk)
+                    break
+            if buffer:
+                if first_line:
+                    self._observe(path + ' first_line', (time.perf_counter() - start) * 1000)
+                yield buffer
+        except GeneratorExit:
+            with self.lock:
+                self.cancelled += 1
+            raise
+        finally:
+            response.close()
+            self._observe(path + ' stream', (time.perf_counter() - start) * 1000)
+
+    def observe_eval(self, body):
+        """Record prompt evaluation counters of a finished generation"""
+        if 'prompt_eval_count' not in body:
+            return
+        with self.lock:
+            self.prompt_calls += 1
+            self.prompt_tokens += body.get('prompt_eval_count') or 0
+            self.prompt_eval_ms += (body.get('prompt_eval_duration') or 0) / 1e6
+
+    def observe(self, path, elapsed_ms):
+        """Record latency measured by the caller (e.g. for streamed responses)"""
+        self._observe(path, elapsed_ms)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'host': self.host,
+                'retries': self.retries,
+                'errors': self.errors,
+                'cancelled_streams': self.cancelled,
+                'prompt_eval': {
+                    'calls': self.prompt_calls,
+                    'avg_tokens': round(self.prompt_tokens / self.prompt_calls, 1) if self.prompt_calls else None,
+                    'avg_ms': round(self.prompt_eval_ms / self.prompt_calls, 1) if self.prompt_calls else None,
+                },
+                'latency': {path: h.as_dict() for path, h in self.histograms.items()},
+            }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide shared client"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
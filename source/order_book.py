@@ -0,0 +1,254 @@
+"""
+Order Book - Compact Level 2 snapshots and depth analytics
+Each symbol holds a market_book_add subscription and a preallocated ring of
+price/volume arrays per side. A scan writes the new book into the next slot
+in place and derives depth-weighted mid, multi-level imbalance, microprice
+and order-flow pressure from those arrays instead of per-level dicts.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+# Try to import MT5 library
+try:
+    import MetaTrader5 as mt5
+    MT5_AVAILABLE = True
+except ImportError:
+    MT5_AVAILABLE = False
+
+# Price levels kept per side
+BOOK_DEPTH = 10
+
+# Snapshots kept in the ring buffer per symbol
+BOOK_HISTORY = 256
+
+# Levels over which imbalance is reported
+IMBALANCE_LEVELS = (1, 3, 5, BOOK_DEPTH)
+
+# Snapshots summed for the rolling order-flow pressure
+PRESSURE_WINDOW = 20
+
+# Seconds before a failed market_book_add is retried
+SUBSCRIBE_RETRY = 30
+
+# BookInfo.type values (ENUM_BOOK_TYPE)
+BOOK_TYPE_SELL = 1
+BOOK_TYPE_BUY = 2
+BOOK_TYPE_SELL_MARKET = 3
+BOOK_TYPE_BUY_MARKET = 4
+
+
+def _imbalance(bid_volume, ask_volume):
+    total = bid_volume + ask_volume
+    return (bid_volume - ask_volume) / total if total > 0 else 0.0
+
+
+class OrderBook:
+    """Level 2 subscription and snapshot ring for one symbol
+
+    Row i of the ring holds one snapshot: bid prices descending and ask
+    prices ascending from the touch, zero-padded past the book's depth.
+    """
+
+    def __init__(self, symbol, depth=BOOK_DEPTH, history=BOOK_HISTORY):
+        self.symbol = symbol
+        self.depth = depth
+        self.history = history
+        self.times = np.zeros(history)
+        self.bid_px = np.zeros((history, depth))
+        self.bid_vol = np.zeros((history, depth))
+        self.ask_px = np.zeros((history, depth))
+        self.ask_vol = np.zeros((history, depth))
+        self.ofi = np.zeros(history)  # order-flow imbalance at the touch vs the previous snapshot
+        self.count = 0  # snapshots written so far
+        self.subscribed = False
+        self.subscribe_failed_at = None
+        self.lock = threading.Lock()
+
+    # ========== Subscription ==========
+
+    def subscribe(self):
+        """market_book_add once; failures are retried after SUBSCRIBE_RETRY"""
+        if self.subscribed:
+            return True
+        now = time.time()
+        if self.subscribe_failed_at is not None and now - self.subscribe_failed_at < SUBSCRIBE_RETRY:
+            return False
+        if mt5.market_book_add(self.symbol):
+            self.subscribed = True
+            self.subscribe_failed_at = None
+        else:
+            self.subscribe_failed_at = now
+        return self.subscribed
+
+    def release(self):
+        if self.subscribed:
+            mt5.market_book_release(self.symbol)
+            self.subscribed = False
+
+    # ========== Snapshots ==========
+
+    @property
+    def last(self):
+        return (self.count - 1) % self.history if self.count else None
+
+    def update(self):
+        """Write the current book into the next ring slot; False if there is none"""
+        with self.lock:
+            if not self.subscribe():
+                return False
+            book = mt5.market_book_get(self.symbol)
+            if not book:
+                return False
+            # BookInfo rows: (type, price, volume, volume_dbl)
+            entries = np.array(book, dtype=float).reshape(len(book), -1)
+            types, prices = entries[:, 0], entries[:, 1]
+            volumes = entries[:, 3] if entries.shape[1] > 3 else entries[:, 2]
+            bids = (types == BOOK_TYPE_BUY) | (types == BOOK_TYPE_BUY_MARKET)
+            asks = (types == BOOK_TYPE_SELL) | (types == BOOK_TYPE_SELL_MARKET)
+
+            slot = self.count % self.history
+            self._write(self.bid_px[slot], self.bid_vol[slot], prices[bids], volumes[bids], descending=True)
+            self._write(self.ask_px[slot], self.ask_vol[slot], prices[asks], volumes[asks], descending=False)
+            self.times[slot] = time.time()
+            self.ofi[slot] = self._touch_flow(slot) if self.count else 0.0
+            self.count += 1
+            return True
+
+    def _write(self, px_row, vol_row, prices, volumes, descending):
+        order = np.argsort(-prices if descending else prices)[:self.depth]
+        n = len(order)
+        px_row[:n] = prices[order]
+        vol_row[:n] = volumes[order]
+        px_row[n:] = 0.0
+        vol_row[n:] = 0.0
+
+    def _touch_flow(self, slot):
+        """Order-flow imbalance at the best levels (Cont, Kukanov & Stoikov)"""
+        prev = (slot - 1) % self.history
+        bid, prev_bid = self.bid_px[slot, 0], self.bid_px[prev, 0]
+        ask, prev_ask = self.ask_px[slot, 0], self.ask_px[prev, 0]
+        flow = 0.0
+        if bid >= prev_bid:
+            flow += self.bid_vol[slot, 0]
+        if bid <= prev_bid:
+            flow -= self.bid_vol[prev, 0]
+        if ask <= prev_ask:
+            flow -= self.ask_vol[slot, 0]
+        if ask >= prev_ask:
+            flow += self.ask_vol[prev, 0]
+        return flow
+
+    # ========== Features ==========
+
+    def levels(self, side, count=5, slot=None):
+        """[(price, volume), ...] of the top levels of 'bid' or 'ask'"""
+        slot = self.last if slot is None else slot
+        px = self.bid_px[slot] if side == 'bid' else self.ask_px[slot]
+        vol = self.bid_vol[slot] if side == 'bid' else self.ask_vol[slot]
+        n = min(count, int(np.count_nonzero(vol)))
+        return [(float(px[i]), float(vol[i])) for i in range(n)]
+
+    def features(self, slot=None):
+        """Derived depth features of one snapshot (the latest by default)"""
+        slot = self.last if slot is None else slot
+        if slot is None:
+            return None
+        bid_px, bid_vol = self.bid_px[slot], self.bid_vol[slot]
+        ask_px, ask_vol = self.ask_px[slot], self.ask_vol[slot]
+        bid_total, ask_total = float(bid_vol.sum()), float(ask_vol.sum())
+        best_bid = float(bid_px[0]) if bid_vol[0] > 0 else None
+        best_ask = float(ask_px[0]) if ask_vol[0] > 0 else None
+
+        imbalance = {}
+        for k in IMBALANCE_LEVELS:
+            imbalance[k] = _imbalance(float(bid_vol[:k].sum()), float(ask_vol[:k].sum()))
+
+        weighted_mid = microprice = mid = None
+        if best_bid is not None and best_ask is not None:
+            mid = (best_bid + best_ask) / 2
+            # Each side's volume-weighted price, weighted by the opposite side's depth
+            bid_vwap = float(bid_px @ bid_vol) / bid_total
+            ask_vwap = float(ask_px @ ask_vol) / ask_total
+            weighted_mid = (bid_vwap * ask_total + ask_vwap * bid_total) / (bid_total + ask_total)
+            top_bid, top_ask = float(bid_vol[0]), float(ask_vol[0])
+            microprice = (best_bid * top_ask + best_ask * top_bid) / (top_bid + top_ask)
+
+        return {
+            'best_bid': best_bid,
+            'best_ask': best_ask,
+            'mid': mid,
+            'weighted_mid': weighted_mid,
+            'microprice': microprice,
+            'total_bid_volume': bid_total,
+            'total_ask_volume': ask_total,
+            'imbalance': imbalance,
+            'level_count': int(np.count_nonzero(bid_vol) + np.count_nonzero(ask_vol)),
+        }
+
+    def pressure(self, window=PRESSURE_WINDOW):
+        """Book dynamics over the last window snapshots
+
+        ofi is the summed touch order-flow imbalance, imbalance_delta the
+        change of the 5-level imbalance and depth_delta the change of
+        (bid depth - ask depth) since the oldest snapshot of the window.
+        """
+        if self.count < 2:
+            return {'ofi': 0.0, 'imbalance_delta': 0.0, 'depth_delta': 0.0, 'snapshots': self.count}
+        n = min(window, self.count, self.history)
+        last = self.last
+        first = (last - n + 1) % self.history
+        idx = (np.arange(n) + first) % self.history
+        ofi = float(self.ofi[idx[1:]].sum())
+
+        def depth(slot, k=5):
+            return float(self.bid_vol[slot, :k].sum()), float(self.ask_vol[slot, :k].sum())
+
+        bid_now, ask_now = depth(last)
+        bid_then, ask_then = depth(first)
+        return {
+            'ofi': ofi,
+            'imbalance_delta': _imbalance(bid_now, ask_now) - _imbalance(bid_then, ask_then),
+            'depth_delta': (bid_now - ask_now) - (bid_then - ask_then),
+            'snapshots': n,
+        }
+
+
+class OrderBooks:
+    """Per-symbol OrderBook registry with a shared subscription lifecycle"""
+
+    def __init__(self):
+        self.books = {}
+        self.lock = threading.Lock()
+
+    def get(self, symbol):
+        with self.lock:
+            book = self.books.get(symbol)
+            if book is None:
+                book = OrderBook(symbol)
+                self.books[symbol] = book
+            return book
+
+    def invalidate(self):
+        """Subscriptions do not survive a reconnect; resubscribe on next use"""
+        with self.lock:
+            for book in self.books.values():
+                book.subscribed = False
+                book.subscribe_failed_at = None
+
+    def release_all(self):
+        with self.lock:
+            books = list(self.books.values())
+        for book in books:
+            try:
+                book.release()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self.lock:
+            items = list(self.books.items())
+        return {symbol: {'subscribed': book.subscribed, 'snapshots': book.count}
+                for symbol, book in items}
@@ -0,0 +1,109 @@
+"""
+Prompt A/B - Compare the verbose and compact analysis prompts on live data
+Every round fetches one market snapshot and asks the model with both
+prompts (alternating which goes first, so neither always benefits from
+a warm cache). The report shows decision agreement, latency and prompt
+token counts per mode.
+"""
+
+import time
+
+from latency import LatencyHistogram
+from ollama_client import OLLAMA_MODEL, OLLAMA_KEEP_ALIVE
+from prompt_templates import PROMPT_MODES, estimate_tokens
+
+# Seconds between rounds, so rounds see different market states
+AB_ROUND_INTERVAL = 1.0
+
+
+class ModeResult:
+    """Per-mode decisions, latency and token counts"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.decisions = {}
+        self.estimated_tokens = 0
+        self.evaluated_tokens = 0
+        self.evaluated_calls = 0
+        self.failures = 0
+
+    def as_dict(self, rounds):
+        return {
+            'latency': self.latency.as_dict(),
+            'decisions': self.decisions,
+            'avg_estimated_tokens': round(self.estimated_tokens / rounds, 1) if rounds else None,
+            'avg_evaluated_tokens': (round(self.evaluated_tokens / self.evaluated_calls, 1)
+                                     if self.evaluated_calls else None),
+            'failures': self.failures,
+        }
+
+
+def _ask(agent, system_prompt, prompt, result, levels):
+    """One non-streamed generation; returns the decision direction or None"""
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "system": system_prompt,
+               "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE}
+    start = time.perf_counter()
+    try:
+        response = agent.ollama.post('/api/generate', payload)
+        response.raise_for_status()
+        body = response.json()
+    except Exception as e:
+        agent.log(f"A/B测试调用Ollama失败: {str(e)}")
+        result.failures += 1
+        return None
+    result.latency.observe((time.perf_counter() - start) * 1000)
+    if 'prompt_eval_count' in body:
+        result.evaluated_tokens += body['prompt_eval_count'] or 0
+        result.evaluated_calls += 1
+    for line in body.get('response', '').strip().split('\n'):
+        command = agent._normalize_decision_line(line, *levels)
+        if command:
+            return command[:2]
+    return "待机"
+
+
+def run_prompt_ab(agent, rounds=10, interval=AB_ROUND_INTERVAL):
+    """Run rounds live comparisons for agent.trading_pair and return a report"""
+    symbol = agent.trading_pair
+    config = agent.indicators_config
+    results = {mode: ModeResult() for mode in PROMPT_MODES}
+    agreed = completed = 0
+    levels = agent._sl_tp_percents()
+
+    for i in range(rounds):
+        if i:
+            time.sleep(interval)
+        market_data = agent.search_market_data(symbol)
+        if not market_data or not market_data.get('price'):
+            continue
+        indicators = None
+        if config.get('enabled', True):
+            indicators = agent.get_mt5_candles_and_indicators(
+                symbol, timeframe_minutes=config.get('timeframe', 1), count=config.get('candle_count', 200))
+        level2_data = agent.get_mt5_level2_data(symbol) if config.get('level2_enabled', True) else None
+        prices = agent._sl_tp_prices(market_data.get('price', 0), market_data.get('digits', 5))
+
+        decisions = {}
+        order = PROMPT_MODES if i % 2 == 0 else tuple(reversed(PROMPT_MODES))
+        for mode in order:
+            system_prompt, prompt = agent.build_analysis_prompt(
+                symbol, market_data, indicators, level2_data, prices, mode=mode)
+            result = results[mode]
+            result.estimated_tokens += estimate_tokens(system_prompt) + estimate_tokens(prompt)
+            decision = _ask(agent, system_prompt, prompt, result, levels)
+            decisions[mode] = decision
+            if decision is not None:
+                result.decisions[decision] = result.decisions.get(decision, 0) + 1
+
+        if all(decisions.get(mode) is not None for mode in PROMPT_MODES):
+            completed += 1
+            agreed += len(set(decisions.values())) == 1
+        agent.log(f"A/B第{i + 1}轮: " + ", ".join(f"{m}={decisions.get(m)}" for m in PROMPT_MODES))
+
+    return {
+        'symbol': symbol,
+        'rounds': rounds,
+        'completed': completed,
+        'agreement': round(agreed / completed, 4) if completed else None,
+        'modes': {mode: results[mode].as_dict(rounds) for mode in PROMPT_MODES},
+    }
@@ -0,0 +1,405 @@
+"""
+Prompt Templates - Precompiled analysis prompts for analyze_market
+Everything that only changes with the configuration (strategy checklists,
+rules, signal legend, Level 2 hints, decision flow) is compiled once per
+config version. A scan only renders the numeric block and appends it, so
+the system prompt and the head of the prompt are byte-identical between
+scans and Ollama can reuse their KV cache instead of re-evaluating them.
+
+Two modes exist: "verbose" (the original wording) and "compact", a dense
+key=value block for small CPU-bound models that is trimmed to a token budget.
+"""
+
+import re
+import threading
+
+from decision_cache import config_hash
+
+# Compiled templates kept (one per config version; old versions are dropped)
+TEMPLATE_CACHE_SIZE = 8
+
+PROMPT_MODES = ('verbose', 'compact')
+
+# Default token budget (system + prompt) of the compact mode
+COMPACT_TOKEN_BUDGET = 700
+
+# Token estimate for Qwen2.5's BPE: every digit is its own token, common
+# Chinese words merge ~1.4 characters per token, Latin words ~4 letters
+CJK_CHARS_PER_TOKEN = 1.4
+LATIN_CHARS_PER_TOKEN = 4
+
+_CJK = re.compile(r'[\u2e80-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]')
+_DIGIT = re.compile(r'\d')
+_LATIN = re.compile(r'[A-Za-z]+')
+_SYMBOL = re.compile(r'[^\sA-Za-z\d\u2e80-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """Approximate prompt token count for the Qwen2.5 tokenizer"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    latin = sum(-(-len(word) // LATIN_CHARS_PER_TOKEN) for word in _LATIN.findall(text))
+    return (round(cjk / CJK_CHARS_PER_TOKEN) + len(_DIGIT.findall(text)) + latin
+            + len(_SYMBOL.findall(text)) + text.count('\n'))
+
+
+SIGNAL_LEGEND = """【重要】必须根据下方计算的技术信号进行判断:
+- 金叉/死叉: 短周期均线上穿/下穿长周期均线
+- 突破: 价格突破近期高点/低点
+- 回踩确认: 突破后价格回踩但仍保持突破方向
+- 背离: 价格与指标出现背离（如顶背离、底背离）
+
+【信号解读】:
+- MA金叉(MA10上穿MA50) = 做多信号
+- MA死叉(MA10下穿MA50) = 做空信号
+- RSI<30 超卖，可能反转做多
+- RSI>70 超买，可能反转做空
+- 价格突破布林上轨可能回落，跌破下轨可能反弹
+"""
+
+LEVEL2_HINTS = """【Level2 交易提示】:
+- 买方占比>60%: 市场偏多，可能上涨
+- 买方占比<40%: 市场偏空，可能下跌
+- 买盘挂单量突然增加: 可能护盘或诱多
+- 卖盘挂单量突然增加: 可能压盘或诱空
+"""
+
+
+def _fmt(value, digits=5):
+    return f"{value:.{digits}f}" if value is not None else None
+
+
+def _section(title, lines):
+    return f"【{title}】:\n" + "\n".join(lines) + "\n" if lines else ""
+
+
+def render_indicators(indicators):
+    """Numeric indicator block; empty when indicators are unavailable"""
+    if not indicators:
+        return ""
+    get = indicators.get
+
+    ma_lines = [f"- SMA{p}: {get(f'ma{p}'):.5f}" for p in (5, 10, 20, 50, 200) if get(f'ma{p}') is not None]
+    ema_lines = [f"- EMA{p}: {get(f'ema{p}'):.5f}" for p in (12, 26) if get(f'ema{p}') is not None]
+
+    rsi_section = ""
+    if get('rsi') is not None:
+        rsi_section = f"【RSI 相对强弱指标】:\n- RSI(14): {get('rsi'):.2f}\n  (RSI>70=超买, RSI<30=超卖)\n\n"
+
+    macd_lines = []
+    if get('macd') is not None: macd_lines.append(f"- DIF: {get('macd'):.5f}")
+    if get('macd_slow') is not None: macd_lines.append(f"- DEA(EMA26): {get('macd_slow'):.5f}")
+
+    bb_lines = []
+    if get('bb_upper') is not None: bb_lines.append(f"- 上轨: {get('bb_upper'):.5f}")
+    if get('bb_middle') is not None: bb_lines.append(f"- 中轨: {get('bb_middle'):.5f}")
+    if get('bb_lower') is not None: bb_lines.append(f"- 下轨: {get('bb_lower'):.5f}")
+
+    atr_section = f"【ATR 平均真实波幅】:\n- ATR(14): {get('atr'):.5f}\n" if get('atr') is not None else ""
+
+    htf_lines = []
+    for htf in get('higher_timeframes') or []:
+        parts = [f"趋势{htf['trend']}", f"收盘 {htf['close_price']:.5f}"]
+        for key, label in (('ma20', 'SMA20'), ('ma50', 'SMA50'), ('ema12', 'EMA12'), ('ema26', 'EMA26')):
+            if htf.get(key) is not None:
+                parts.append(f"{label} {htf[key]:.5f}")
+        if htf.get('rsi') is not None:
+            parts.append(f"RSI {htf['rsi']:.2f}")
+        htf_lines.append(f"- {htf['timeframe']}: " + ", ".join(parts))
+
+    close_price = get('close_price')
+    close_str = f"- 收盘价: {close_price:.5f}" if close_price is not None else ""
+    return f"""
+【技术指标数据】(来自{get('timeframe', '1分钟')}K线, 共{get('candle_count', 0)}根):
+{close_str}
+
+{_section('移动平均线 SMA', ma_lines)}{_section('指数移动平均线 EMA', ema_lines)}{rsi_section}\
+{_section('MACD 指数平滑异同移动平均线', macd_lines)}{_section('布林带 Bollinger Bands', bb_lines)}\
+{atr_section}{_section('更高周期确认', htf_lines)}
+【⚠️ 技术信号】(Python程序计算，必须基于这些信号判断):
+{get('signal_summary', '无信号')}
+"""
+
+
+def render_level2(level2_data):
+    """Numeric Level 2 block; empty when the book is unavailable"""
+    if not level2_data or not level2_data.get('available'):
+        return ""
+    get = level2_data.get
+    bid_ratio = get('bid_ratio', 0.5)
+    bid_str = ", ".join(f"{price:.5f}({volume:g})" for price, volume in get('bid_levels', [])[:5])
+    ask_str = ", ".join(f"{price:.5f}({volume:g})" for price, volume in get('ask_levels', [])[:5])
+
+    depth_lines = []
+    if get('microprice') is not None: depth_lines.append(f"- 微观价格(Microprice): {get('microprice'):.5f}")
+    if get('weighted_mid') is not None: depth_lines.append(f"- 深度加权中间价: {get('weighted_mid'):.5f}")
+    imbalance = get('imbalance') or {}
+    if imbalance:
+        depth_lines.append("- 多档失衡(买-卖)/(买+卖): " + ", ".join(f"{k}档 {v:+.2f}" for k, v in imbalance.items()))
+    pressure = get('pressure')
+    if pressure and pressure.get('snapshots', 0) > 1:
+        depth_lines.append(f"- 盘口压力变化(近{pressure['snapshots']}次): 订单流失衡 {pressure['ofi']:+g}, "
+                           f"5档失衡变化 {pressure['imbalance_delta']:+.2f}")
+    depth_str = "\n".join(depth_lines)
+
+    return f"""
+【Level 2 市场深度】(如有):
+- 买盘总量: {get('total_bid_volume', 0)}
+- 卖盘总量: {get('total_ask_volume', 0)}
+- 买方占比: {f"{bid_ratio:.1%}" if bid_ratio is not None else "N/A"}
+- 市场情绪: {get('sentiment', '未知')}
+- 最佳买价: {_fmt(get('best_bid')) or "N/A"}
+- 最佳卖价: {_fmt(get('best_ask')) or "N/A"}
+- 深度点差: {_fmt(get('spread')) or "N/A"}
+- 买盘5档: {bid_str}
+- 卖盘5档: {ask_str}
+{depth_str}
+"""
+
+
+def _price(value):
+    return f"{value}" if value is not None else "无"
+
+
+def render_prices(prices):
+    """Pre-computed SL/TP price block; prices = (long_sl, long_tp, short_sl, short_tp)"""
+    long_sl, long_tp, short_sl, short_tp = prices
+    text = ""
+    if long_sl is not None or long_tp is not None:
+        text += "\n【做多止损止盈价格】(已计算好，直接使用):\n"
+        if long_sl is not None:
+            text += f"- 做多止损价格: {long_sl}\n"
+        if long_tp is not None:
+            text += f"- 做多止盈价格: {long_tp}\n"
+    if short_sl is not None or short_tp is not None:
+        text += "\n【做空止损止盈价格】(已计算好，直接使用):\n"
+        if short_sl is not None:
+            text += f"- 做空止损价格: {short_sl}\n"
+        if short_tp is not None:
+            text += f"- 做空止盈价格: {short_tp}\n"
+    return text
+
+
+class CompiledPrompt:
+    """Static system prompt and prompt head of one config version"""
+
+    def __init__(self, version, settings):
+        self.version = version
+        long_strategy, short_strategy = settings['long_strategy'], settings['short_strategy']
+        long_sl, long_tp = settings['long_sl'], settings['long_tp']
+        short_sl, short_tp = settings['short_sl'], settings['short_tp']
+        rules = settings['rules']
+
+        self.system = f"""你是一个专业的外汇交易分析师。
+【严格遵守规则 - 违反以下规则将导致错误交易】
+1. 必须【逐条检查】配置的做多/做空策略条件，只有【全部满足】时才可下单
+2. 不得自行决定止损止盈数值，【必须】使用已计算好的价格
+3. 做多时【必须】使用做多策略和做多价格，做空时【必须】使用做空策略和做空价格
+4. 必须根据Python程序计算的技术信号来判断，【严禁】凭感觉或猜测下单
+5. 【严禁输出平仓指令】系统只等待止盈或止损，不主动平仓
+6. 如果策略条件【任何一条】不满足，【必须】输出"待机"
+
+【策略检查清单】（做多时）:
+{long_strategy}
+→ 逐条检查上述条件，全部满足才可做多，否则必须待机
+
+【策略检查清单】（做空时）:
+{short_strategy}
+→ 逐条检查上述条件，全部满足才可做空，否则必须待机
+
+当前配置（必须严格遵守）:
+- 做多止损/止盈: {long_sl}% / {long_tp}%
+- 做空止损/止盈: {short_sl}% / {short_tp}%
+- 必须遵守规则: {rules}
+- 具体止损止盈价格在每次行情数据中给出
+
+【决策依据】:
+- 主要依据: Python程序计算的技术信号（金叉/死叉、突破、回踩确认、背离）
+- 次要参考: 指标数值和Level2市场深度
+- 必须优先考虑技术信号，再结合配置的策略
+
+【输出规则】:
+只输出以下三种指令之一（不要输出品种和数量，这些已在MT5中设定好）：
+- 做多 止损<做多止损价格> 止盈<做多止盈价格>
+- 做空 止损<做空止损价格> 止盈<做空止盈价格>
+- 待机
+
+注意：止损和止盈后面必须是计算好的具体价格数值（如"止损38300.50"），不是百分比！Executor会直接复制这些数值到MT5。
+
+不要输出其他内容，只输出指令。"""
+
+        level2_hints = LEVEL2_HINTS + "\n" if settings.get('level2_enabled', True) else ""
+        self.head = f"""你是一个专业的外汇交易分析师。根据以下分析策略和市场数据，判断是否应该交易。
+
+【警告】你必须【逐条检查】下方的策略条件，只有【全部满足】时才可下单！
+
+【做多策略】(必须逐条检查，全部满足才可做多):
+{long_strategy}
+【重要】必须同时满足以上所有条件才可做多，任何一条不满足都必须待机！
+
+【做多止损比例】: {long_sl}% (价格 × (1 - {long_sl}%))
+【做多止盈比例】: {long_tp}% (价格 × (1 + {long_tp}%))
+
+【做空策略】(必须逐条检查，全部满足才可做空):
+{short_strategy}
+【重要】必须同时满足以上所有条件才可做空，任何一条不满足都必须待机！
+
+【做空止损比例】: {short_sl}% (价格 × (1 + {short_sl}%))
+【做空止盈比例】: {short_tp}% (价格 × (1 - {short_tp}%))
+
+【必须遵守规则】: {rules}
+
+{SIGNAL_LEGEND}
+{level2_hints}【决策流程】（必须按此流程）:
+1. 逐条检查做多策略条件 → 如果全部满足 → 做多
+2. 逐条检查做空策略条件 → 如果全部满足 → 做空
+3. 任何条件不满足 → 待机
+"""
+
+    def render(self, symbol, market_data, current_price, digits, indicators, level2_data, prices,
+               history=""):
+        """Static head + optional history + this scan's numeric block"""
+        long_sl, long_tp, short_sl, short_tp = prices
+        history_block = f"\n历史对话:\n{history}\n" if history else ""
+        return f"""{self.head}{history_block}
+======== 本次行情数据 ========
+交易品种: {symbol}
+当前价格: {current_price}
+买入价(Ask): {market_data.get('ask', current_price)}
+卖出价(Bid): {market_data.get('bid', current_price)}
+小数位数: {digits}位
+点差: {market_data.get('spread', 'N/A')}点
+{render_indicators(indicators)}{render_level2(level2_data)}{render_prices(prices)}
+【输出格式】（只输出以下三种之一，不要其他内容）：
+- 做多 止损{_price(long_sl)} 止盈{_price(long_tp)}
+- 做空 止损{_price(short_sl)} 止盈{_price(short_tp)}
+- 待机
+
+注意：止损和止盈后面必须是计算好的具体价格数值，不是百分比！Executor会直接复制这些数值到MT5。
+
+根据策略判断，现在应该做什么操作？
+"""
+
+
+def _num(value, digits):
+    """Price-like value rounded to the symbol's digits"""
+    return f"{value:.{digits}f}" if value is not None else "-"
+
+
+class CompactPrompt:
+    """Dense prompt for small models: deduplicated rules, key=value data
+
+    The rules and the signal legend appear once, in the system prompt.
+    The data block is a list of prioritized lines, and the least important
+    ones are dropped until system + prompt fit the token budget.
+    """
+
+    def __init__(self, version, settings):
+        self.version = version
+        self.budget = settings.get('token_budget') or COMPACT_TOKEN_BUDGET
+        self.head = ""
+        self.system = f"""你是交易信号判定器。规则:
+1.逐条检查策略条件,全部满足才下单,否则待机
+2.止损止盈只用给定价格,禁止平仓指令
+3.以程序计算的信号(sig)为主,指标和盘口为辅
+信号: 金叉/突破/回踩确认=偏多, 死叉/跌破=偏空, RSI<30超卖 RSI>70超买
+做多条件: {settings['long_strategy']}
+做空条件: {settings['short_strategy']}
+止损/止盈: 多{settings['long_sl']}%/{settings['long_tp']}% 空{settings['short_sl']}%/{settings['short_tp']}%
+必须遵守: {settings['rules']}
+只输出一行: 做多 止损X 止盈Y | 做空 止损X 止盈Y | 待机"""
+        self.system_tokens = estimate_tokens(self.system)
+
+    def _lines(self, symbol, market_data, current_price, digits, indicators, level2_data, prices, history):
+        """(priority, text) lines; higher priority numbers are dropped first"""
+        lines = [(0, f"{symbol} px={current_price} ask={market_data.get('ask', current_price)} "
+                     f"bid={market_data.get('bid', current_price)} spread={market_data.get('spread', '-')}")]
+        if indicators:
+            get = indicators.get
+            core = [f"close={_num(get('close_price'), digits)}"]
+            core += [f"ma{p}={_num(get(f'ma{p}'), digits)}" for p in (5, 10, 20, 50, 200) if get(f'ma{p}') is not None]
+            core += [f"ema{p}={_num(get(f'ema{p}'), digits)}" for p in (12, 26) if get(f'ema{p}') is not None]
+            if get('rsi') is not None:
+                core.append(f"rsi={get('rsi'):.1f}")
+            lines.append((1, f"{get('timeframe', '1分钟')}: " + " ".join(core)))
+            extra = []
+            if get('macd') is not None:
+                extra.append(f"macd={_num(get('macd'), digits)}")
+            if get('bb_upper') is not None:
+                extra.append(f"bb={_num(get('bb_lower'), digits)}/{_num(get('bb_upper'), digits)}")
+            if get('atr') is not None:
+                extra.append(f"atr={_num(get('atr'), digits)}")
+            if extra:
+                lines.append((2, " ".join(extra)))
+            higher = get('higher_timeframes') or []
+            if higher:
+                lines.append((2, "htf: " + " ".join(
+                    f"{h['timeframe']}={h['trend']}" + (f"(rsi={h['rsi']:.0f})" if h.get('rsi') is not None else "")
+                    for h in higher)))
+            lines.append((0, f"sig={get('signal_summary', '无')}"))
+        if level2_data and level2_data.get('available'):
+            imbalance = level2_data.get('imbalance') or {}
+            parts = [f"bid_ratio={level2_data.get('bid_ratio', 0.5):.2f}"]
+            parts += [f"imb{k}={v:+.2f}" for k, v in imbalance.items() if k in (1, 5)]
+            pressure = level2_data.get('pressure') or {}
+            if pressure.get('snapshots', 0) > 1:
+                parts.append(f"ofi={pressure['ofi']:+g}")
+            if level2_data.get('microprice') is not None:
+                parts.append(f"micro={_num(level2_data['microprice'], digits)}")
+            lines.append((3, "l2: " + " ".join(parts)))
+        if history:
+            lines.append((4, f"history: {history}"))
+        long_sl, long_tp, short_sl, short_tp = prices
+        lines.append((0, f"做多 止损{_price(long_sl)} 止盈{_price(long_tp)} | "
+                         f"做空 止损{_price(short_sl)} 止盈{_price(short_tp)} | 待机"))
+        return lines
+
+    def render(self, symbol, market_data, current_price, digits, indicators, level2_data, prices,
+               history=""):
+        lines = self._lines(symbol, market_data, current_price, digits, indicators, level2_data, prices, history)
+        costs = [estimate_tokens(text) + 1 for _, text in lines]
+        total = self.system_tokens + sum(costs)
+        # Drop whole lines, least important first, until the budget is met
+        for priority in (4, 3, 2, 1):
+            if total <= self.budget:
+                break
+            for i, (p, _) in enumerate(lines):
+                if p == priority and costs[i]:
+                    total -= costs[i]
+                    costs[i] = 0
+        return "\n".join(text for (_, text), cost in zip(lines, costs) if cost)
+
+
+class PromptCompiler:
+    """Compiles and caches CompiledPrompt/CompactPrompt objects by config version"""
+
+    def __init__(self, max_entries=TEMPLATE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.templates = {}
+        self.compiles = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def compile(self, settings, mode='verbose'):
+        version = config_hash(mode, settings)
+        with self.lock:
+            compiled = self.templates.get(version)
+            if compiled is not None:
+                self.hits += 1
+                return compiled
+            template = CompactPrompt if mode == 'compact' else CompiledPrompt
+            compiled = template(version, settings)
+            if len(self.templates) >= self.max_entries:
+                self.templates.pop(next(iter(self.templates)))
+            self.templates[version] = compiled
+            self.compiles += 1
+            return compiled
+
+    def stats(self):
+        with self.lock:
+            return {
+                'versions': len(self.templates),
+                'compiles': self.compiles,
+                'hits': self.hits,
+            }
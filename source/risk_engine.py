@@ -0,0 +1,355 @@
+"""
+Risk Engine - Tick-driven local enforcement of the parsed trading rules
+Runs beside the monitor loop and acts through the MT5 API directly, so
+trailing stops, partial closes and loss limits never wait for the LLM.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import mt5_trade
+
+# Try to import MT5 library
+try:
+    import MetaTrader5 as mt5
+    MT5_AVAILABLE = True
+except ImportError:
+    MT5_AVAILABLE = False
+
+# Seconds between symbol_info_tick polls; rules are only evaluated on new ticks
+RISK_POLL_INTERVAL = 0.005
+
+# Seconds before a failed close of the same ticket is retried
+CLOSE_RETRY_INTERVAL = 1.0
+
+# Seconds before a failed partial close of the same ticket is retried
+PARTIAL_RETRY_INTERVAL = 1.0
+
+# Seconds between stop loss modifications of the same ticket, and the smallest
+# move worth a modification as a fraction of the trailing distance; without
+# them a trending market sends one TRADE_ACTION_SLTP per tick
+TRAILING_MODIFY_INTERVAL = 1.0
+TRAILING_STEP_FRACTION = 0.1
+
+# Seconds account_info/positions_get results are reused across ticks; the
+# cache is dropped as soon as the engine sends a request of its own
+ACCOUNT_REFRESH_INTERVAL = 0.1
+
+RULES = ('trailing_stop', 'partial_close', 'max_drawdown', 'daily_max_loss',
+         'spread_limit', 'trading_session')
+
+
+class RuleLatency:
+    """Evaluation latency counter for one rule"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.last_ns = 0
+
+    def add(self, elapsed_ns):
+        self.count += 1
+        self.total_ns += elapsed_ns
+        self.last_ns = elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_us': round(self.total_ns / self.count / 1000, 2) if self.count else None,
+            'max_us': round(self.max_ns / 1000, 2),
+            'last_us': round(self.last_ns / 1000, 2),
+        }
+
+
+def _parse_hhmm(text):
+    hour, minute = text.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+class RiskEngine:
+    """Evaluates the parsed rules on every new tick of the traded symbols
+
+    The trading pair is watched, or the scheduler's basket when no pair is
+    set; names go through the symbol registry so broker suffixes resolve.
+    Rules are read from the agent on each evaluation, so a config reload is
+    picked up without restarting the thread. Spread and session rules only
+    block new entries; drawdown and daily loss halt trading and close the
+    symbol's positions; trailing stop and partial close manage positions.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.thread = None
+        self.running = False
+        self.latency = {rule: RuleLatency() for rule in RULES}
+        self.block_reason = None  # why new entries must not be opened right now
+        self.halt_reason = None   # drawdown/daily loss halt, cleared on a new day
+        self.last_tick_msc = {}   # terminal name -> time_msc of the last evaluated tick
+        self.entry_blocks = {}    # terminal name -> spread/session block of its last tick
+        self.ticks = 0
+        self.account = None
+        self.positions = ()
+        self.account_fetched = 0.0
+        self.peak_equity = None
+        self.day = None
+        self.day_start_balance = None
+        self.partial_closed = set()  # tickets whose partial close went through
+        self.partial_attempts = {}   # ticket -> time of the last partial close request
+        self.modify_attempts = {}    # ticket -> time of the last trailing stop request
+        self.close_attempts = {}
+
+    def has_rules(self):
+        """True if any rule handled by the engine is configured"""
+        a = self.agent
+        return any(getattr(a, name, None) is not None for name in (
+            'trailing_stop_activation', 'partial_close_activation', 'max_drawdown_percent',
+            'daily_max_loss', 'spread_limit', 'trading_session_start'))
+
+    def start(self):
+        """Start the tick thread (no-op if already running)"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        """Poll ticks and evaluate the rules on every new one"""
+        self.agent.log("🛡️ 风控引擎已启动")
+        while self.running and self.agent.running and self.agent.mode == "monitor":
+            try:
+                for symbol in self.symbols():
+                    info = self.agent.symbol_registry.get(symbol)
+                    if info is None:
+                        continue
+                    tick = mt5.symbol_info_tick(info.name)
+                    if tick is not None and tick.time_msc != self.last_tick_msc.get(info.name):
+                        self.last_tick_msc[info.name] = tick.time_msc
+                        self.ticks += 1
+                        self.evaluate(info.name, tick, info)
+            except Exception as e:
+                self.agent.log(f"风控引擎错误: {str(e)}")
+                time.sleep(1)
+            time.sleep(RISK_POLL_INTERVAL)
+        self.running = False
+        self.block_reason = None
+        self.entry_blocks.clear()
+        self.account = None
+        self.agent.log("🛡️ 风控引擎已停止")
+
+    def symbols(self):
+        """Configured names to watch: the trading pair, else the scheduler's basket"""
+        if self.agent.trading_pair:
+            return [self.agent.trading_pair]
+        scheduler = getattr(self.agent, 'scheduler', None)
+        if scheduler is None:
+            return []
+        return [state.symbol for state in scheduler.states]
+
+    def _account_state(self):
+        """account_info and all open positions, refreshed at most every ACCOUNT_REFRESH_INTERVAL"""
+        now = time.time()
+        if self.account is None or now - self.account_fetched >= ACCOUNT_REFRESH_INTERVAL:
+            self.account = mt5.account_info()
+            self.positions = mt5.positions_get() or ()
+            self.account_fetched = now
+        return self.account, self.positions
+
+    def _timed(self, rule, func, *args):
+        start = time.perf_counter_ns()
+        try:
+            return func(*args)
+        finally:
+            self.latency[rule].add(time.perf_counter_ns() - start)
+
+    def _roll_day(self, account):
+        """Reset daily state and reconstruct the day's starting balance"""
+        today = datetime.now().date()
+        if self.day == today:
+            return
+        self.day = today
+        self.halt_reason = None
+        midnight = datetime.combine(today, datetime.min.time())
+        deals = mt5.history_deals_get(midnight, datetime.now()) or ()
+        realized = sum(d.profit + d.commission + d.swap for d in deals)
+        self.day_start_balance = account.balance - realized
+
+    # ========== Entry gates (shared with the pre-LLM gate) ==========
+
+    def spread_block(self, spread_points):
+        limit = getattr(self.agent, 'spread_limit', None)
+        if limit is not None and spread_points > limit:
+            return f"点差{spread_points}点超过限制{limit}点"
+        return None
+
+    def session_block(self, now=None):
+        start = getattr(self.agent, 'trading_session_start', None)
+        end = getattr(self.agent, 'trading_session_end', None)
+        if not start or not end:
+            return None
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        start_min, end_min = _parse_hhmm(start), _parse_hhmm(end)
+        if start_min <= end_min:
+            inside = start_min <= minute < end_min
+        else:
+            # Overnight session, e.g. 22:00-06:00
+            inside = minute >= start_min or minute < end_min
+        return None if inside else f"不在交易时段{start}-{end}内"
+
+    # ========== Account guards ==========
+
+    def _check_drawdown(self, account):
+        limit = getattr(self.agent, 'max_drawdown_percent', None)
+        equity = account.equity
+        if self.peak_equity is None or equity > self.peak_equity:
+            self.peak_equity = equity
+        if limit is None or not self.peak_equity:
+            return None
+        drawdown = (self.peak_equity - equity) / self.peak_equity * 100
+        if drawdown >= limit:
+            return f"回撤{drawdown:.2f}%达到最大回撤{limit}%"
+        return None
+
+    def _check_daily_loss(self, account):
+        limit = getattr(self.agent, 'daily_max_loss', None)
+        if limit is None or self.day_start_balance is None:
+            return None
+        loss = self.day_start_balance - account.equity
+        if loss >= limit:
+            return f"当日亏损{loss:.2f}达到每日最大亏损{limit}"
+        return None
+
+    # ========== Position management ==========
+
+    def _profit_percent(self, position, tick):
+        if position.type == mt5.POSITION_TYPE_BUY:
+            return (tick.bid - position.price_open) / position.price_open * 100
+        return (position.price_open - tick.ask) / position.price_open * 100
+
+    def _check_trailing(self, position, tick, info):
+        activation = getattr(self.agent, 'trailing_stop_activation', None)
+        distance = getattr(self.agent, 'trailing_stop_distance', None)
+        if activation is None or distance is None:
+            return None
+        now = time.time()
+        if now - self.modify_attempts.get(position.ticket, 0) < TRAILING_MODIFY_INTERVAL:
+            return None
+        if self._profit_percent(position, tick) < activation:
+            return None
+        if position.type == mt5.POSITION_TYPE_BUY:
+            new_sl = round(tick.bid * (1 - distance / 100), info.digits)
+            step = max(info.point, tick.bid * distance / 100 * TRAILING_STEP_FRACTION)
+            improves = position.sl == 0 or new_sl >= position.sl + step
+        else:
+            new_sl = round(tick.ask * (1 + distance / 100), info.digits)
+            step = max(info.point, tick.ask * distance / 100 * TRAILING_STEP_FRACTION)
+            improves = position.sl == 0 or new_sl <= position.sl - step
+        if not improves:
+            return None
+        self.modify_attempts[position.ticket] = now
+        request = mt5_trade.sltp_request(position, new_sl, position.tp)
+        return request, f"移动止损 #{position.ticket}: {position.sl} → {new_sl}"
+
+    def _check_partial(self, position, tick, info):
+        activation = getattr(self.agent, 'partial_close_activation', None)
+        percent = getattr(self.agent, 'partial_close_percent', None)
+        if activation is None or percent is None or position.ticket in self.partial_closed:
+            return None
+        now = time.time()
+        if now - self.partial_attempts.get(position.ticket, 0) < PARTIAL_RETRY_INTERVAL:
+            return None
+        if self._profit_percent(position, tick) < activation:
+            return None
+        volume = mt5_trade.round_volume(position.volume * percent / 100, info)
+        if volume < info.volume_min or volume >= position.volume:
+            return None
+        # Only one partial close per position: evaluate marks the ticket once the request is filled
+        self.partial_attempts[position.ticket] = now
+        request = mt5_trade.close_request(position, volume, tick, info, comment="partial close")
+        return request, f"部分平仓 #{position.ticket}: {volume}/{position.volume}手"
+
+    def _close_all(self, positions, tick, info, reason):
+        actions = []
+        now = time.time()
+        for position in positions:
+            if now - self.close_attempts.get(position.ticket, 0) < CLOSE_RETRY_INTERVAL:
+                continue
+            self.close_attempts[position.ticket] = now
+            request = mt5_trade.close_request(position, position.volume, tick, info, comment="risk halt")
+            actions.append((request, f"风控平仓 #{position.ticket} ({reason})"))
+        return actions
+
+    # ========== Evaluation ==========
+
+    def evaluate(self, symbol, tick, info=None):
+        """Evaluate every rule for one tick and send the resulting requests
+
+        symbol is the terminal name; info defaults to its registry entry.
+        """
+        info = info or self.agent.symbol_registry.get(symbol)
+        account, all_positions = self._account_state()
+        if info is None or account is None:
+            return
+        positions = [p for p in all_positions if p.symbol == symbol]
+        self._roll_day(account)
+
+        spread_points = round((tick.ask - tick.bid) / info.point) if info.point > 0 else 0
+        entry_block = self._timed('spread_limit', self.spread_block, spread_points)
+        session = self._timed('trading_session', self.session_block)
+        entry_block = entry_block or session
+
+        halt = self._timed('max_drawdown', self._check_drawdown, account)
+        halt = halt or self._timed('daily_max_loss', self._check_daily_loss, account)
+        if halt and not self.halt_reason:
+            self.halt_reason = halt
+            self.agent.log(f"🛑 风控触发: {halt}，停止开仓并平掉{symbol}持仓")
+
+        actions = []  # (request, description, ticket marked partially closed once it is filled)
+        if self.halt_reason:
+            actions.extend((request, description, None) for request, description
+                           in self._close_all(positions, tick, info, self.halt_reason))
+        else:
+            for position in positions:
+                action = self._timed('trailing_stop', self._check_trailing, position, tick, info)
+                if action:
+                    actions.append(action + (None,))
+                action = self._timed('partial_close', self._check_partial, position, tick, info)
+                if action:
+                    actions.append(action + (position.ticket,))
+
+        self.entry_blocks[symbol] = entry_block
+        self.block_reason = self.halt_reason or next((b for b in self.entry_blocks.values() if b), None)
+
+        # Forget tickets that are no longer open
+        open_tickets = {p.ticket for p in all_positions}
+        self.partial_closed &= open_tickets
+        for attempts in (self.partial_attempts, self.modify_attempts, self.close_attempts):
+            for ticket in list(attempts):
+                if ticket not in open_tickets:
+                    del attempts[ticket]
+
+        for request, description, partial_ticket in actions:
+            ok, _, message = mt5_trade.send(request)
+            self.agent.log(f"{'✅' if ok else '❌'} {description} - {message}")
+            if ok and partial_ticket is not None:
+                self.partial_closed.add(partial_ticket)
+        if actions:
+            # Our own SL moves and closes must be visible on the next tick
+            self.account = None
+
+    def stats(self):
+        """Per-rule evaluation latency counters"""
+        return {
+            'running': self.running,
+            'ticks': self.ticks,
+            'block_reason': self.block_reason,
+            'rules': {rule: counter.as_dict() for rule, counter in self.latency.items()},
+        }
@@ -0,0 +1,181 @@
+"""
+Scan Scheduler - Concurrent monitoring of a basket of symbols
+Each symbol has its own interval and timeframe. MT5 work (tick, indicators,
+Level 2) fans out on a thread pool; LLM analyses queue on a smaller pool
+sized to what the Ollama backend can generate in parallel.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from latency import LatencyHistogram
+
+# Threads fetching MT5 data and computing indicators
+DATA_WORKERS = 8
+
+# Concurrent LLM analyses - Ollama generates one request at a time unless
+# OLLAMA_NUM_PARALLEL is raised on the server
+LLM_WORKERS = 1
+
+# Longest sleep between due-time checks (seconds)
+SCHEDULER_TICK = 0.05
+
+
+class SymbolState:
+    """Schedule and counters of one monitored symbol"""
+
+    def __init__(self, symbol, interval, timeframe):
+        self.symbol = symbol
+        self.interval = interval
+        self.timeframe = timeframe
+        self.next_due = 0
+        self.busy = False
+        self.scans = 0
+        self.overruns = 0  # due while the previous scan was still running
+        self.errors = 0
+        self.last_command = None
+        self.latency = LatencyHistogram()
+
+    def as_dict(self):
+        return {
+            'interval': self.interval,
+            'timeframe': self.timeframe,
+            'scans': self.scans,
+            'overruns': self.overruns,
+            'errors': self.errors,
+            'busy': self.busy,
+            'last_command': self.last_command,
+            'scan_latency': self.latency.as_dict(),
+        }
+
+
+def parse_symbols(entries, default_interval, default_timeframe):
+    """Config "symbols" entries (names or {symbol, interval, timeframe}) -> SymbolState list"""
+    states = []
+    for entry in entries or []:
+        if isinstance(entry, str):
+            entry = {'symbol': entry}
+        symbol = (entry.get('symbol') or '').strip()
+        if not symbol:
+            continue
+        states.append(SymbolState(symbol,
+                                  float(entry.get('interval', default_interval)),
+                                  int(entry.get('timeframe', default_timeframe))))
+    return states
+
+
+class ScanScheduler:
+    """Owns N symbols and runs their scans through the data and LLM pools"""
+
+    def __init__(self, agent, states, data_workers=DATA_WORKERS, llm_workers=LLM_WORKERS):
+        self.agent = agent
+        self.states = states
+        self.data_workers = data_workers
+        self.llm_workers = llm_workers
+        self.thread = None
+        self.lock = threading.Lock()
+        self.llm_queue_depth = 0
+        self.max_llm_queue_depth = 0
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def running(self):
+        return self.agent.running and self.agent.mode == "monitor"
+
+    def run(self):
+        agent = self.agent
+        agent.log(f"🗂️ 多品种调度启动: {', '.join(s.symbol for s in self.states)} "
+                  f"(数据线程{self.data_workers}, LLM线程{self.llm_workers})")
+        data_pool = ThreadPoolExecutor(max_workers=self.data_workers, thread_name_prefix="scan-data")
+        llm_pool = ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix="scan-llm")
+        try:
+            while self.running():
+                now = time.time()
+                for state in self.states:
+                    if now < state.next_due:
+                        continue
+                    state.next_due = now + state.interval
+                    with self.lock:
+                        if state.busy:
+                            state.overruns += 1
+                            continue
+                        state.busy = True
+                    data_pool.submit(self._scan, state, llm_pool)
+                next_due = min(s.next_due for s in self.states)
+                time.sleep(min(max(next_due - time.time(), 0.001), SCHEDULER_TICK))
+        finally:
+            data_pool.shutdown(wait=False)
+            llm_pool.shutdown(wait=False)
+            agent.log("🗂️ 多品种调度已停止")
+
+    def _scan(self, state, llm_pool):
+        """Data stage: market data, gates, indicators, prompt"""
+        start = time.time()
+        try:
+            market_data = self.agent.get_mt5_market_data(state.symbol)
+            if not market_data:
+                with self.lock:
+                    state.errors += 1
+                self._finish(state, None, start)
+                return
+            analysis = self.agent.prepare_analysis(market_data, state.timeframe)
+            if not isinstance(analysis, dict):
+                self._finish(state, analysis, start)
+                return
+            with self.lock:
+                self.llm_queue_depth += 1
+                self.max_llm_queue_depth = max(self.max_llm_queue_depth, self.llm_queue_depth)
+            llm_pool.submit(self._decide, state, analysis, start)
+        except Exception as e:
+            with self.lock:
+                state.errors += 1
+            self.agent.log(f"❌ [{state.symbol}] 扫描错误: {str(e)}")
+            self._finish(state, None, start)
+
+    def _decide(self, state, analysis, start):
+        """LLM stage"""
+        with self.lock:
+            self.llm_queue_depth -= 1
+        try:
+            self.agent._scan.signal_time = start
+            response = self.agent.complete_analysis(analysis) if self.running() else None
+        except Exception as e:
+            with self.lock:
+                state.errors += 1
+            self.agent.log(f"❌ [{state.symbol}] 分析错误: {str(e)}")
+            response = None
+        self._finish(state, response, start)
+
+    def _finish(self, state, response, start):
+        try:
+            command = self.agent.parse_command(response) if response else None
+            with self.lock:
+                state.last_command = command
+            # 待机 needs no executor action; only entries are dispatched
+            if command and command != "待机" and self.running():
+                self.agent.log(f"✅ [{state.symbol}] 分析结果: {command}")
+                self.agent.dispatch_command(command, state.symbol)
+        finally:
+            with self.lock:
+                state.latency.observe((time.time() - start) * 1000)
+                state.scans += 1
+                state.busy = False
+
+    def stats(self):
+        # Per-symbol counters are written by the worker threads under the same lock
+        with self.lock:
+            depth, max_depth = self.llm_queue_depth, self.max_llm_queue_depth
+            symbols = {s.symbol: s.as_dict() for s in self.states}
+        return {
+            'running': self.thread is not None and self.thread.is_alive(),
+            'data_workers': self.data_workers,
+            'llm_workers': self.llm_workers,
+            'llm_queue_depth': depth,
+            'max_llm_queue_depth': max_depth,
+            'symbols': symbols,
+        }
@@ -0,0 +1,117 @@
+"""
+Symbol Registry - Resolved MT5 symbol names and cached symbol_info
+Names and aliases are resolved against the terminal once. The static
+contract data (digits, point, trade and filling modes, volume limits) is
+reused until a TTL expires or the terminal reconnects, so a scan does not
+pay for symbol_info/symbol_select round trips.
+"""
+
+import threading
+import time
+
+# Try to import MT5 library
+try:
+    import MetaTrader5 as mt5
+    MT5_AVAILABLE = True
+except ImportError:
+    MT5_AVAILABLE = False
+
+# Seconds before cached symbol info is refreshed from the terminal
+SYMBOL_INFO_TTL = 60
+
+
+def candidates(symbol):
+    """Terminal names tried for a requested symbol, in order"""
+    names = [symbol]
+    # Some brokers list forex/metals without the USD suffix
+    stripped = symbol.replace('USD', '')
+    if stripped and stripped != symbol:
+        names.append(stripped)
+    return names
+
+
+class SymbolRegistry:
+    """Requested name -> terminal name, terminal name -> cached symbol_info
+
+    The cached object is MT5's SymbolInfo. Its contract fields are what
+    callers rely on; quotes must still come from symbol_info_tick. Failed
+    lookups are cached for the same TTL so a missing symbol is not searched
+    for on every scan.
+    """
+
+    def __init__(self, log=None, ttl=SYMBOL_INFO_TTL):
+        self.log = log
+        self.ttl = ttl
+        self.aliases = {}   # requested name -> terminal name
+        self.entries = {}   # terminal name -> (symbol_info, fetched at)
+        self.missing = {}   # requested name -> time of the failed lookup
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.lookups = 0
+        self.invalidations = 0
+
+    def get(self, symbol):
+        """Cached symbol_info for symbol (or its alias), None if unknown"""
+        if not symbol:
+            return None
+        now = time.time()
+        with self.lock:
+            name = self.aliases.get(symbol)
+            entry = self.entries.get(name) if name else None
+            if entry is not None and now - entry[1] <= self.ttl:
+                self.hits += 1
+                return entry[0]
+            failed_at = self.missing.get(symbol)
+            if failed_at is not None and now - failed_at <= self.ttl:
+                self.hits += 1
+                return None
+        return self._lookup(symbol, name, now)
+
+    def resolve(self, symbol):
+        """Terminal name of symbol, None if the terminal does not list it"""
+        info = self.get(symbol)
+        return info.name if info is not None else None
+
+    def _lookup(self, symbol, known_name, now):
+        info = None
+        for name in ([known_name] if known_name else candidates(symbol)):
+            info = mt5.symbol_info(name)
+            if info is not None:
+                break
+        if info is not None and not info.visible:
+            # Hidden symbols have no quotes until they are in Market Watch
+            mt5.symbol_select(info.name, True)
+            info = mt5.symbol_info(info.name) or info
+
+        with self.lock:
+            self.lookups += 1
+            if info is None:
+                self.missing[symbol] = now
+                self.aliases.pop(symbol, None)
+            else:
+                self.missing.pop(symbol, None)
+                self.aliases[symbol] = info.name
+                self.entries[info.name] = (info, now)
+        if info is None and self.log:
+            self.log(f"MT5未找到品种: {symbol}")
+        return info
+
+    def invalidate(self):
+        """Forget everything, e.g. after (re)connecting to the terminal"""
+        with self.lock:
+            self.aliases.clear()
+            self.entries.clear()
+            self.missing.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'symbols': len(self.entries),
+                'aliases': {k: v for k, v in self.aliases.items() if k != v},
+                'missing': sorted(self.missing),
+                'hits': self.hits,
+                'lookups': self.lookups,
+                'invalidations': self.invalidations,
+                'ttl': self.ttl,
+            }
@@ -0,0 +1,243 @@
+"""
+Trade Verifier - Confirms executor orders from MT5 deal events
+Each submitted order registers an expectation; one background thread polls
+history_deals_get/positions_get for tickets that were not there before the
+order and resolves the expectation the moment a matching deal appears.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from latency import LatencyHistogram
+
+# Try to import MT5 library
+try:
+    import MetaTrader5 as mt5
+    MT5_AVAILABLE = True
+except ImportError:
+    MT5_AVAILABLE = False
+
+VERIFY_POLL_MIN = 0.01   # seconds, first poll interval after an order
+VERIFY_POLL_MAX = 0.1    # seconds, backoff cap
+VERIFY_BACKOFF = 1.5
+VERIFY_TIMEOUT = 30      # seconds before an expectation fails
+
+# Deal times are in trade server time, so the history window is kept wide and
+# new deals are recognized by ticket rather than by timestamp
+HISTORY_WINDOW = timedelta(days=1)
+
+
+class Expectation:
+    """One submitted order waiting for its deal"""
+
+    def __init__(self, snapshot, symbol, is_buy, magic, order, deal, on_result, timeout,
+                 volume=None, sl=None, tp=None, point=None):
+        self.known_deals, self.known_positions = snapshot
+        self.symbol = symbol
+        self.is_buy = is_buy
+        self.magic = magic
+        self.volume = volume
+        self.sl = sl
+        self.tp = tp
+        self.point = point or 0.0
+        self.order = order
+        self.deal = deal
+        self.on_result = on_result
+        self.created = time.time()
+        self.deadline = self.created + timeout
+
+
+class TradeVerifier:
+    """Matches new deals/positions to pending expectations
+
+    API orders are matched by their order or deal ticket. GUI orders have no
+    ticket, so they match the first unclaimed new entry deal (or position)
+    with the same symbol, direction and magic, and also the submitted SL/TP
+    (within one point, and the volume when the caller knows it) so a manual
+    trade is not mistaken for ours.
+    Every ticket is claimed once, so two orders never resolve on the same
+    deal; claims are dropped once no pending snapshot predates them.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.pending = []
+        self.claimed = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.confirmed = 0
+        self.timed_out = 0
+        self.latency = LatencyHistogram()
+
+    def _history(self):
+        now = datetime.now()
+        return mt5.history_deals_get(now - HISTORY_WINDOW, now + HISTORY_WINDOW) or ()
+
+    def snapshot(self):
+        """Deal and position tickets that exist before an order is sent"""
+        deals = {d.ticket for d in self._history()}
+        positions = {p.ticket for p in (mt5.positions_get() or ())}
+        return deals, positions
+
+    def expect(self, snapshot, symbol=None, is_buy=True, magic=None, order=None, deal=None,
+               on_result=None, timeout=VERIFY_TIMEOUT, volume=None, sl=None, tp=None, point=None):
+        """Register an expectation; on_result(ok, detail) is called from the verifier thread
+
+        volume/sl/tp are only checked for ticketless (GUI) matches; None skips
+        the check, point is the tolerance for SL/TP.
+        """
+        expectation = Expectation(snapshot, symbol, is_buy, magic, order or None, deal or None,
+                                  on_result, timeout, volume, sl, tp, point)
+        with self.lock:
+            self.pending.append(expectation)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.wake.set()
+        return expectation
+
+    def wait(self, snapshot, timeout=VERIFY_TIMEOUT, **match):
+        """Blocking variant of expect(); returns (ok, detail)"""
+        done = threading.Event()
+        outcome = []
+
+        def on_result(ok, detail):
+            outcome.append((ok, detail))
+            done.set()
+
+        self.expect(snapshot, on_result=on_result, timeout=timeout, **match)
+        done.wait(timeout + 1)
+        return outcome[0] if outcome else (False, "验证超时")
+
+    def run(self):
+        interval = VERIFY_POLL_MIN
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+            try:
+                self._poll()
+            except Exception as e:
+                self.log(f"交易验证错误: {str(e)}")
+            # New expectations restart the backoff at the minimum interval
+            if self.wake.wait(interval):
+                self.wake.clear()
+                interval = VERIFY_POLL_MIN
+            else:
+                interval = min(interval * VERIFY_BACKOFF, VERIFY_POLL_MAX)
+
+    def _poll(self):
+        deals = self._history()
+        positions = mt5.positions_get() or ()
+        now = time.time()
+        resolved = []
+        with self.lock:
+            for expectation in self.pending:
+                detail = self._match(expectation, deals, positions)
+                if detail:
+                    resolved.append((expectation, True, detail))
+                elif now >= expectation.deadline:
+                    resolved.append((expectation, False, f"{now - expectation.created:.1f}秒内未检测到匹配成交"))
+            for expectation, _, _ in resolved:
+                self.pending.remove(expectation)
+            self._prune_claims()
+        for expectation, ok, detail in resolved:
+            if ok:
+                self.confirmed += 1
+                self.latency.observe((now - expectation.created) * 1000)
+            else:
+                self.timed_out += 1
+            if expectation.on_result:
+                expectation.on_result(ok, detail)
+
+    def _claim(self, deal_ticket=None, position_ticket=None):
+        if deal_ticket:
+            self.claimed.add(('deal', deal_ticket))
+        if position_ticket:
+            self.claimed.add(('position', position_ticket))
+
+    def _prune_claims(self):
+        """Forget claims every pending expectation already sees as pre-existing
+
+        A claimed ticket only matters to expectations whose snapshot was taken
+        before it appeared; later snapshots list it as known. Caller holds lock.
+        """
+        if not self.pending:
+            self.claimed.clear()
+            return
+        self.claimed = {
+            (kind, ticket) for kind, ticket in self.claimed
+            if any(ticket not in (e.known_deals if kind == 'deal' else e.known_positions)
+                   for e in self.pending)
+        }
+
+    @staticmethod
+    def _fills(expectation, volume, sl, tp):
+        """Whether a ticketless fill carries the submitted volume and SL/TP"""
+        if expectation.volume is not None and abs(volume - expectation.volume) > 1e-8:
+            return False
+        tolerance = expectation.point + 1e-9
+        if expectation.sl is not None and abs((sl or 0.0) - expectation.sl) > tolerance:
+            return False
+        if expectation.tp is not None and abs((tp or 0.0) - expectation.tp) > tolerance:
+            return False
+        return True
+
+    def _match(self, expectation, deals, positions):
+        deal_type = mt5.DEAL_TYPE_BUY if expectation.is_buy else mt5.DEAL_TYPE_SELL
+        checks_stops = expectation.sl is not None or expectation.tp is not None
+        for d in deals:
+            if (d.ticket in expectation.known_deals or ('deal', d.ticket) in self.claimed
+                    or ('position', d.position_id) in self.claimed):
+                continue
+            if expectation.deal or expectation.order:
+                if d.ticket != expectation.deal and d.order != expectation.order:
+                    continue
+            elif (d.entry != mt5.DEAL_ENTRY_IN or d.type != deal_type
+                  or (expectation.symbol and d.symbol != expectation.symbol)
+                  or (expectation.magic is not None and d.magic != expectation.magic)):
+                continue
+            else:
+                # Deals carry no SL/TP; read them from the position the deal opened
+                # and wait for it to show up if it is not visible yet
+                position = next((p for p in positions if p.ticket == d.position_id), None)
+                if checks_stops and position is None:
+                    continue
+                if not self._fills(expectation, d.volume,
+                                   position.sl if position else None,
+                                   position.tp if position else None):
+                    continue
+            self._claim(d.ticket, d.position_id)
+            return f"成交#{d.ticket} 持仓#{d.position_id} {d.symbol} {d.volume}手 @ {d.price}"
+
+        # The position can show up before the deal reaches the history cache
+        position_type = mt5.POSITION_TYPE_BUY if expectation.is_buy else mt5.POSITION_TYPE_SELL
+        for p in positions:
+            if p.ticket in expectation.known_positions or ('position', p.ticket) in self.claimed:
+                continue
+            if expectation.order:
+                if p.ticket != expectation.order:
+                    continue
+            elif expectation.deal:
+                continue
+            elif (p.type != position_type
+                  or (expectation.symbol and p.symbol != expectation.symbol)
+                  or (expectation.magic is not None and p.magic != expectation.magic)
+                  or not self._fills(expectation, p.volume, p.sl, p.tp)):
+                continue
+            self._claim(position_ticket=p.ticket)
+            return f"持仓#{p.ticket} {p.symbol} {p.volume}手 @ {p.price_open}"
+        return None
+
+    def stats(self):
+        with self.lock:
+            pending = len(self.pending)
+        return {
+            'pending': pending,
+            'confirmed': self.confirmed,
+            'timed_out': self.timed_out,
+            'latency': self.latency.as_dict(),
+        }
@@ -8,10 +8,15 @@ import json
 import os
 from datetime import datetime
 
+import indicators
+from candle_store import CandleStore
+from ollama_client import OLLAMA_MODEL, get_client
+
 app = Flask(__name__)
 
 SESSION_LOG_FILE = "E:\\TradingSystem\\session_log.txt"
 chat_history = []
+candle_store = CandleStore(read_only=True)  # The trading agent owns the files
 
 HTML = '''<!DOCTYPE html>
 <html>
@@ -489,8 +494,15 @@ def favicon():
 def save_config():
     data = request.json
     try:
+        # Merge so keys the page does not edit (e.g. stream_decisions) survive
+        try:
+            with open('E:\\TradingSystem\\config.json', 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except:
+            config = {}
+        config.update(data)
         with open('E:\\TradingSystem\\config.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+            json.dump(config, f, indent=2, ensure_ascii=False)
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'error': str(e)})
@@ -538,145 +550,70 @@ def test_data():
                     result['bid_volume'] = sum(e.volume for e in book if e.type == 0)
                     result['ask_volume'] = sum(e.volume for e in book if e.type == 1)
             
-            # Get historical candles
-            rates = mt5.copy_rates_from_pos(symbol, 1, 0, 200)
+            # Get historical candles from the local store (written by the agent)
+            series = candle_store.series(symbol, 1)
+            rates = series.window(200) if series.sync(mt5, symbol, 1, 200) else None
             if rates is not None and len(rates) > 0:
                 result['candle_count'] = len(rates)
-                opens = [r[1] for r in rates]
-                highs = [r[2] for r in rates]
-                lows = [r[3] for r in rates]
-                closes = [r[4] for r in rates]
-                current_price = closes[-1] if closes else None
+                # Work directly on the record array columns
+                opens, highs, lows, closes = indicators.ohlc(rates)
+                current_price = float(closes[-1])
                 result['current_price'] = current_price
                 
-                # Helper functions
-                def calc_sma(data, period):
-                    if len(data) >= period:
-                        return sum(data[-period:]) / period
-                    return None
-                
-                def calc_ema(data, period):
-                    if len(data) < period:
-                        return None
-                    ema = data[0]
-                    multiplier = 2 / (period + 1)
-                    for price in data[1:]:
-                        ema = (price - ema) * multiplier + ema
-                    return ema
-                
-                def calc_rsi(data, period=14):
-                    if len(data) < period + 1:
-                        return None
-                    deltas = [data[i] - data[i-1] for i in range(1, len(data))]
-                    gains = [d if d > 0 else 0 for d in deltas]
-                    losses = [-d if d < 0 else 0 for d in deltas]
-                    avg_gain = sum(gains[-period:]) / period
-                    avg_loss = sum(losses[-period:]) / period
-                    if avg_loss == 0:
-                        return 100
-                    rs = avg_gain / avg_loss
-                    rsi = 100 - (100 / (1 + rs))
-                    return rsi
-                
-                def calc_macd(data, fast=12, slow=26, signal=9):
-                    ema_fast = calc_ema(data, fast)
-                    ema_slow = calc_ema(data, slow)
-                    if ema_fast is None or ema_slow is None:
-                        return None, None, None
-                    macd_line = ema_fast - ema_slow
-                    return macd_line, ema_fast, ema_slow
-                
-                def calc_bollinger(data, period=20, std_dev=2):
-                    sma = calc_sma(data, period)
-                    if sma is None:
-                        return None, None, None
-                    std = (sum((p - sma) ** 2 for p in data[-period:]) / period) ** 0.5
-                    upper = sma + std_dev * std
-                    lower = sma - std_dev * std
-                    return upper, sma, lower
-                
-                def calc_atr(highs, lows, closes, period=14):
-                    if len(highs) < period + 1:
-                        return None
-                    trs = []
-                    for i in range(1, len(highs)):
-                        tr = max(
-                            highs[i] - lows[i],
-                            abs(highs[i] - closes[i-1]),
-                            abs(lows[i] - closes[i-1])
-                        )
-                        trs.append(tr)
-                    return sum(trs[-period:]) / period
-                
                 # Calculate selected indicators
                 indicators_calc = {}
                 
+                def put(name, series, digits=5):
+                    value = indicators.last_value(series)
+                    if value is not None:
+                        indicators_calc[name] = round(value, digits)
+                
                 # Moving Averages
-                if indicators_config.get('ma5', True):
-                    ma5 = calc_sma(closes, 5)
-                    if ma5 is not None: indicators_calc['MA5'] = round(ma5, 5)
-                if indicators_config.get('ma10', True):
-                    ma10 = calc_sma(closes, 10)
-                    if ma10 is not None: indicators_calc['MA10'] = round(ma10, 5)
-                if indicators_config.get('ma20', True):
-                    ma20 = calc_sma(closes, 20)
-                    if ma20 is not None: indicators_calc['MA20'] = round(ma20, 5)
-                if indicators_config.get('ma50', False):
-                    ma50 = calc_sma(closes, 50)
-                    if ma50 is not None: indicators_calc['MA50'] = round(ma50, 5)
-                if indicators_config.get('ma200', False):
-                    ma200 = calc_sma(closes, 200)
-                    if ma200 is not None: indicators_calc['MA200'] = round(ma200, 5)
+                for period, default in ((5, True), (10, True), (20, True), (50, False), (200, False)):
+                    if indicators_config.get(f'ma{period}', default):
+                        put(f'MA{period}', indicators.sma(closes, period))
                 
                 # Exponential Moving Averages
-                if indicators_config.get('ema9', False):
-                    ema9 = calc_ema(closes, 9)
-                    if ema9 is not None: indicators_calc['EMA9'] = round(ema9, 5)
-                if indicators_config.get('ema12', False):
-                    ema12 = calc_ema(closes, 12)
-                    if ema12 is not None: indicators_calc['EMA12'] = round(ema12, 5)
-                if indicators_config.get('ema21', False):
-                    ema21 = calc_ema(closes, 21)
-                    if ema21 is not None: indicators_calc['EMA21'] = round(ema21, 5)
-                if indicators_config.get('ema26', False):
-                    ema26 = calc_ema(closes, 26)
-                    if ema26 is not None: indicators_calc['EMA26'] = round(ema26, 5)
+                for period in (9, 12, 21, 26):
+                    if indicators_config.get(f'ema{period}', False):
+                        put(f'EMA{period}', indicators.ema(closes, period))
                 
                 # RSI
                 if indicators_config.get('rsi', True):
-                    rsi = calc_rsi(closes, 14)
-                    if rsi is not None: indicators_calc['RSI'] = round(rsi, 2)
+                    put('RSI', indicators.rsi(closes, 14), 2)
                 
                 # MACD
                 if indicators_config.get('macd', True):
-                    macd_line, macd_fast, macd_slow = calc_macd(closes)
-                    if macd_line is not None: indicators_calc['MACD'] = round(macd_line, 5)
-                    if macd_fast is not None: indicators_calc['MACD_FAST'] = round(macd_fast, 5)
-                    if macd_slow is not None: indicators_calc['MACD_SLOW'] = round(macd_slow, 5)
+                    macd_line, macd_signal, macd_hist = indicators.macd(closes)
+                    put('MACD', macd_line)
+                    put('MACD_SIGNAL', macd_signal)
+                    put('MACD_HIST', macd_hist)
+                    put('MACD_FAST', indicators.ema(closes, 12))
+                    put('MACD_SLOW', indicators.ema(closes, 26))
                 
                 # Bollinger Bands
                 if indicators_config.get('bollinger', True):
-                    bb_upper, bb_middle, bb_lower = calc_bollinger(closes)
-                    if bb_upper is not None: indicators_calc['BB_UPPER'] = round(bb_upper, 5)
-                    if bb_middle is not None: indicators_calc['BB_MIDDLE'] = round(bb_middle, 5)
-                    if bb_lower is not None: indicators_calc['BB_LOWER'] = round(bb_lower, 5)
+                    bb_upper, bb_middle, bb_lower = indicators.bollinger(closes)
+                    put('BB_UPPER', bb_upper)
+                    put('BB_MIDDLE', bb_middle)
+                    put('BB_LOWER', bb_lower)
                 
                 # ATR
                 if indicators_config.get('atr', False):
-                    atr = calc_atr(highs, lows, closes, 14)
-                    if atr is not None: indicators_calc['ATR'] = round(atr, 5)
+                    put('ATR', indicators.atr(highs, lows, closes, 14))
                 
                 result['indicators_calculated'] = indicators_calc
                 
                 # Simple signal detection (based on current values)
                 signals = []
-                current_price = closes[-1] if closes else None
                 
-                # MA cross signals (simplified)
-                ma10 = calc_sma(closes, 10)
-                ma50 = calc_sma(closes, 50)
-                ma10_prev = calc_sma(closes[:-1], 10) if len(closes) > 10 else None
-                ma50_prev = calc_sma(closes[:-1], 50) if len(closes) > 50 else None
+                # MA cross signals - previous values come from the same series
+                ma10_series = indicators.sma(closes, 10)
+                ma50_series = indicators.sma(closes, 50)
+                ma10 = indicators.last_value(ma10_series)
+                ma50 = indicators.last_value(ma50_series)
+                ma10_prev = indicators.last_value(ma10_series, -2)
+                ma50_prev = indicators.last_value(ma50_series, -2)
                 if ma10 is not None and ma50 is not None and ma10_prev is not None and ma50_prev is not None:
                     if ma10_prev <= ma50_prev and ma10 > ma50:
                         signals.append("MA金叉(MA10上穿MA50) - 做多")
@@ -694,10 +631,10 @@ def test_data():
                 # Breakout detection (simplified)
                 if len(closes) >= 21:
                     recent_20_closes = closes[-21:-1]
-                    recent_20_high = max(recent_20_closes)
-                    recent_20_low = min(recent_20_closes)
-                    current_close = closes[-1]
-                    current_open = opens[-1]
+                    recent_20_high = float(recent_20_closes.max())
+                    recent_20_low = float(recent_20_closes.min())
+                    current_close = float(closes[-1])
+                    current_open = float(opens[-1])
                     if current_close > recent_20_high and current_close > current_open:
                         signals.append(f"向上突破: {current_close:.5f} > {recent_20_high:.5f}")
                     if current_close < recent_20_low and current_close < current_open:
@@ -720,7 +657,6 @@ def send_message():
     
     # Call Ollama for AI response
     try:
-        import requests
         # Build conversation history for context
         recent_msgs = chat_history[-10:]  # Last 10 messages
         context = ""
@@ -735,10 +671,10 @@ Conversation history:
 
 Please provide a helpful response about forex trading. Keep it concise."""
 
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "qwen2.5:3b-instruct-q4_K_M", "prompt": prompt, "stream": False},
-            timeout=60
+        response = get_client().post(
+            '/api/generate',
+            {"model": OLLAMA_MODEL, "prompt": prompt, "stream": False},
+            read_timeout=60
         )
         if response.status_code == 200:
             bot_response = response.json().get('response', '').strip()
@@ -750,6 +686,11 @@ Please provide a helpful response about forex trading. Keep it concise."""
     chat_history.append({'type': 'chat', 'sender': 'Bot', 'message': bot_response})
     return jsonify({'response': bot_response})
 
+@app.route('/ollama_stats')
+def ollama_stats():
+    """Latency histograms of this process's Ollama client"""
+    return jsonify(get_client().stats())
+
 @app.route('/start_monitor', methods=['POST'])
 def start_monitor():
     try:
@@ -827,7 +768,10 @@ def get_logs():
 def save_log():
     global chat_history
     data = request.json
-    chat_history.append({'type': data.get('type', 'log'), 'message': data.get('message', ''), 'timestamp': datetime.now().isoformat()})
+    timestamp = datetime.now().isoformat()
+    # Agents ship {'batch': [...]} once per flush; the page still posts single records
+    for record in data.get('batch', [data]):
+        chat_history.append({'type': record.get('type', 'log'), 'message': record.get('message', ''), 'timestamp': timestamp})
     # Note: Chat logs are now only stored in memory (chat_history) for the web interface
     # The actual log file (autogpt.log) is rotated to logs folder on exit
     # This prevents duplicate chat content in the logs folder
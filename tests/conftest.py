@@ -0,0 +1,74 @@
+"""
+Shared fixtures - the modules live in source/ and import each other by name
+"""
+
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'source'))
+
+# The modules import MetaTrader5 at import time; the simulated terminal
+# stands in for it so the MT5 paths run without a Windows terminal
+import mock_mt5  # noqa: E402
+mock_mt5.install()
+
+from candle_store import RATE_DTYPE  # noqa: E402
+
+BAR_SECONDS = 60
+START_TIME = 1_700_000_040  # a minute boundary
+
+
+def random_walk_rates(count, seed=1, start=START_TIME, price=1.1, step=0.0004):
+    """count M1 bars of a seeded random walk in RATE_DTYPE layout"""
+    rng = np.random.default_rng(seed)
+    closes = price + np.cumsum(rng.normal(0, step, count))
+    opens = np.concatenate(([price], closes[:-1]))
+    wicks = np.abs(rng.normal(0, step / 2, (2, count)))
+    rates = np.zeros(count, dtype=RATE_DTYPE)
+    rates['time'] = start + np.arange(count) * BAR_SECONDS
+    rates['open'] = opens
+    rates['close'] = closes
+    rates['high'] = np.maximum(opens, closes) + wicks[0]
+    rates['low'] = np.minimum(opens, closes) - wicks[1]
+    rates['tick_volume'] = rng.integers(1, 100, count)
+    rates['spread'] = 10
+    return rates
+
+
+@pytest.fixture
+def rates():
+    return random_walk_rates(300)
+
+
+@pytest.fixture
+def agent(tmp_path):
+    """AutoGPTTrading on the simulated terminal, with every file in tmp_path"""
+    from autogpt_trading import AutoGPTTrading
+    from candle_store import CandleStore
+    agent = AutoGPTTrading(log_file=str(tmp_path / 'autogpt.log'), web_url=None,
+                           commands_file=str(tmp_path / 'commands.txt'),
+                           candle_store=CandleStore(str(tmp_path / 'candles')), watch_flags=False)
+    yield agent
+    agent.running = False
+
+
+def wait_for(check, timeout=2.0):
+    """Poll check() until it is true; False on timeout"""
+    deadline = time.time() + timeout
+    while not check():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def free_port():
+    """A localhost port nothing is listening on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,85 @@
+"""
+AsyncMonitorPipeline: the consumer always decides on the freshest snapshot
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+from async_pipeline import AsyncMonitorPipeline
+
+
+class Agent:
+    """Just the AutoGPTTrading surface the pipeline calls"""
+
+    def __init__(self, decisions_before_stop=3, decide_seconds=0.08):
+        self.running = True
+        self.mode = "monitor"
+        self.trading_pair = "EURUSD"
+        self.monitoring_interval = 0.01
+        self.indicators_config = {'enabled': True, 'level2_enabled': False}
+        self.decisions_before_stop = decisions_before_stop
+        self.decide_seconds = decide_seconds
+        self.fetches = 0
+        self.analyzed = []
+        self.dispatched = []
+        self.messages = []
+        self._scan = SimpleNamespace()
+
+    def log(self, message):
+        self.messages.append(message)
+
+    def search_market_data(self, symbol):
+        self.fetches += 1
+        return {'symbol': symbol, 'price': 1.1, 'fetch': self.fetches}
+
+    def get_mt5_candles_and_indicators(self, symbol, timeframe_minutes, count):
+        return {'timeframe': timeframe_minutes, 'count': count}
+
+    def get_mt5_level2_data(self, symbol):
+        raise AssertionError("level 2 is disabled")
+
+    def analyze_market(self, market_data, prefetched=None):
+        self.analyzed.append((market_data['fetch'], self.fetches, prefetched))
+        time.sleep(self.decide_seconds)
+        if len(self.analyzed) >= self.decisions_before_stop:
+            self.running = False
+        return "待机"
+
+    def parse_command(self, response):
+        return response
+
+    def dispatch_command(self, command):
+        self.dispatched.append(command)
+
+
+def run(pipeline, timeout=5):
+    thread = threading.Thread(target=pipeline.run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive()
+
+
+def test_slow_decisions_drop_stale_snapshots():
+    agent = Agent()
+    pipeline = AsyncMonitorPipeline(agent)
+    run(pipeline)
+    stats = pipeline.stats()
+    assert stats['decisions'] == 3 and len(agent.analyzed) == 3
+    # Fetching kept going while the LLM was busy; the snapshots in between were replaced
+    assert stats['dropped_snapshots'] > 0
+    assert stats['snapshots'] > stats['decisions']
+    for fetched, _, prefetched in agent.analyzed:
+        assert prefetched == ({'timeframe': 1, 'count': 200}, None)
+    # Each decision took one of the last snapshots fetched before it started, not a queued one
+    assert all(latest - fetched <= 2 for fetched, latest, _ in agent.analyzed)
+    # The last decision finished after monitoring stopped and was not dispatched
+    assert agent.dispatched == ["待机", "待机"]
+
+
+def test_snapshot_without_price_is_not_analyzed():
+    agent = Agent()
+    pipeline = AsyncMonitorPipeline(agent)
+    pipeline._decide({'time': time.time(), 'market_data': {'symbol': "EURUSD", 'price': None},
+                      'prefetched': (None, None)})
+    assert agent.analyzed == [] and agent.messages == ["⚠️ 市场数据获取失败或价格无效"]
@@ -0,0 +1,29 @@
+"""
+AutoGPTTrading scan paths against the simulated terminal
+"""
+
+import os
+import time
+
+
+def test_candles_are_fetched_under_the_resolved_name(agent):
+    # The simulated terminal lists US30USD as US30
+    indicators = agent.get_mt5_candles_and_indicators('US30USD', timeframe_minutes=1, count=200)
+    assert indicators is not None and indicators['ma20'] is not None
+    series = agent.candle_store.series('US30USD', 1)
+    assert series.count == 199
+
+    # Later scans only fetch the new bars
+    assert agent.get_mt5_candles_and_indicators('US30USD', timeframe_minutes=1, count=200) is not None
+    assert series.backfills == 1 and series.syncs == 2
+
+
+def test_log_rotation_moves_the_agents_own_log(agent, tmp_path):
+    with open(agent.log_file, 'w', encoding='utf-8') as f:
+        f.write("昨天的日志\n")
+    yesterday = time.time() - 86400
+    os.utime(agent.log_file, (yesterday, yesterday))
+    agent._check_log_rotation()
+    rotated = list((tmp_path / 'logs').iterdir())
+    assert len(rotated) == 1 and rotated[0].name.startswith("autogpt_")
+    assert rotated[0].read_text(encoding='utf-8') == "昨天的日志\n"
@@ -0,0 +1,81 @@
+"""
+Backtest SL/TP fills on bid bars with the ask at bid + spread
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backtest import Backtest, Position
+from candle_store import RATE_DTYPE
+
+SPREAD = 0.0002
+
+
+@pytest.fixture
+def backtest():
+    agent = SimpleNamespace(trading_pair='EURUSD', timeframe=1, lot_size=1.0)
+    bt = Backtest(agent, np.zeros(0, dtype=RATE_DTYPE), decider=None, digits=5, contract_size=100000)
+    bt.balance = 10000.0
+    bt.spread_price = SPREAD
+    return bt
+
+
+def fill(bt, position, o, h, l):
+    """Run one bar's exit check for a single position; returns the trade or None"""
+    bt.positions = [position]
+    bt._check_exits(0, o, h, l)
+    return bt.trades[-1] if bt.trades else None
+
+
+def long(sl=1.0950, tp=1.1050):
+    return Position("做多", 0, 1.1000, sl, tp, 1.0)
+
+
+def short(sl=1.1050, tp=1.0950):
+    return Position("做空", 0, 1.1000, sl, tp, 1.0)
+
+
+def test_long_stop_fills_at_the_stop(backtest):
+    trade = fill(backtest, long(), o=1.0990, h=1.0995, l=1.0940)
+    assert trade['reason'] == 'sl' and trade['exit_price'] == 1.0950
+    assert trade['profit'] == pytest.approx(-500.0)
+    assert backtest.balance == pytest.approx(9500.0)
+    assert backtest.positions == []
+
+
+def test_long_stop_gapped_through_fills_at_the_open(backtest):
+    trade = fill(backtest, long(), o=1.0930, h=1.0935, l=1.0920)
+    assert trade['reason'] == 'sl' and trade['exit_price'] == 1.0930
+
+
+def test_long_take_profit_fills_at_the_target_or_better(backtest):
+    assert fill(backtest, long(), o=1.1040, h=1.1060, l=1.1035)['exit_price'] == 1.1050
+    assert fill(backtest, long(), o=1.1070, h=1.1080, l=1.1065)['exit_price'] == 1.1070
+
+
+def test_stop_wins_when_both_levels_are_inside_one_bar(backtest):
+    assert fill(backtest, long(), o=1.1000, h=1.1060, l=1.0940)['reason'] == 'sl'
+    assert fill(backtest, short(), o=1.1000, h=1.1060, l=1.0940)['reason'] == 'sl'
+
+
+def test_short_exits_trade_at_the_ask(backtest):
+    # The ask reaches the stop before the bid does
+    trade = fill(backtest, short(), o=1.1000, h=1.1049, l=1.0990)
+    assert trade['reason'] == 'sl' and trade['exit_price'] == 1.1050
+    assert trade['profit'] == pytest.approx(-500.0)
+
+    trade = fill(backtest, short(), o=1.0960, h=1.0965, l=1.0947)
+    assert trade['reason'] == 'tp' and trade['exit_price'] == 1.0950
+    assert trade['profit'] == pytest.approx(500.0)
+
+
+def test_untouched_position_stays_open(backtest):
+    assert fill(backtest, long(), o=1.1000, h=1.1040, l=1.0960) is None
+    assert fill(backtest, short(), o=1.1000, h=1.1040, l=1.0960) is None
+    assert len(backtest.positions) == 1
+
+
+def test_positions_without_levels_never_exit(backtest):
+    assert fill(backtest, long(sl=None, tp=None), o=1.0, h=2.0, l=0.5) is None
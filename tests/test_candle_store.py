@@ -0,0 +1,100 @@
+"""
+CandleStore incremental sync, persistence and torn-tail recovery
+"""
+
+import os
+
+import numpy as np
+
+from candle_store import CandleSeries, CandleStore, RATE_DTYPE
+
+from conftest import random_walk_rates
+
+
+class Terminal:
+    """copy_rates_* over a fixed history whose last visible bar is forming"""
+
+    def __init__(self, history, visible):
+        self.history = history
+        self.visible = visible
+        self.calls = []
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        self.calls.append('from_pos')
+        end = self.visible - start_pos
+        return self.history[max(end - count, 0):end].copy()
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        self.calls.append('range')
+        bars = self.history[:self.visible]
+        return bars[bars['time'] >= int(date_from.timestamp())].copy()
+
+
+def test_first_sync_backfills_then_fetches_only_new_bars(tmp_path):
+    history = random_walk_rates(300)
+    terminal = Terminal(history, visible=200)
+    series = CandleStore(str(tmp_path)).series('EURUSD', 1)
+
+    assert series.sync(terminal, 'EURUSD', 1, backfill=150)
+    assert terminal.calls == ['from_pos']
+    assert series.count == 149
+    assert np.array_equal(series.window(150), history[50:200])
+
+    terminal.visible = 205
+    assert series.sync(terminal, 'EURUSD', 1, backfill=150)
+    assert terminal.calls == ['from_pos', 'range']
+    assert series.count == 154
+    assert series.forming['time'][0] == history['time'][204]
+    assert np.array_equal(series.closed(10), history[194:204])
+    assert np.array_equal(series.since(history['time'][198]), history[198:205])
+
+
+def test_closed_bars_are_persisted_and_reloaded(tmp_path):
+    history = random_walk_rates(120)
+    store = CandleStore(str(tmp_path))
+    store.series('XAUUSD', 5).sync(Terminal(history, visible=100), 'XAUUSD', 5, backfill=100)
+
+    path = store.path('XAUUSD', 5)
+    assert os.path.getsize(path) == 99 * RATE_DTYPE.itemsize
+
+    reloaded = CandleStore(str(tmp_path)).series('XAUUSD', 5)
+    assert reloaded.count == 99
+    assert np.array_equal(reloaded.closed(), history[:99])
+
+
+def test_torn_tail_is_truncated_on_load(tmp_path):
+    history = random_walk_rates(50)
+    path = str(tmp_path / 'EURUSD_1.bin')
+    with open(path, 'wb') as f:
+        f.write(history[:40].tobytes())
+        f.write(history[40:41].tobytes()[:17])  # crash in the middle of a record
+
+    series = CandleSeries(path)
+    assert series.count == 40
+    assert os.path.getsize(path) == 40 * RATE_DTYPE.itemsize
+
+    # Appends continue from the last whole record
+    series.sync(Terminal(history, visible=46), 'EURUSD', 1, backfill=50)
+    assert series.count == 45
+    assert np.array_equal(np.fromfile(path, dtype=RATE_DTYPE), history[:45])
+
+
+def test_read_only_series_leaves_a_torn_file_alone(tmp_path):
+    history = random_walk_rates(10)
+    path = str(tmp_path / 'EURUSD_1.bin')
+    with open(path, 'wb') as f:
+        f.write(history.tobytes()[:-5])
+
+    series = CandleSeries(path, read_only=True)
+    assert series.count == 9
+    assert os.path.getsize(path) == len(history) * RATE_DTYPE.itemsize - 5
+
+
+def test_out_of_order_bars_are_dropped(tmp_path):
+    history = random_walk_rates(20)
+    records = np.concatenate((history[:10], history[5:8], history[10:15]))
+    path = str(tmp_path / 'EURUSD_1.bin')
+    records.tofile(path)
+
+    series = CandleSeries(path)
+    assert np.array_equal(series.closed(), history[:10])
@@ -0,0 +1,125 @@
+"""
+CommandSender/CommandReceiver: sequence dedup, acks and the file fallback
+"""
+
+import json
+import socket
+
+import pytest
+
+from command_channel import CommandReceiver, CommandSender, COMMAND_HOST, write_atomic
+
+from conftest import free_port, wait_for
+
+
+@pytest.fixture
+def commands_file(tmp_path):
+    return str(tmp_path / 'commands.txt')
+
+
+@pytest.fixture
+def receiver(commands_file):
+    receiver = CommandReceiver(commands_file, lambda message: None, port=free_port())
+    receiver.start()
+    assert wait_for(lambda: receiver.server is not None)
+    yield receiver
+    receiver.stop()
+
+
+def raw_send(port, message):
+    """One JSON line over a fresh connection; returns the receiver's reply"""
+    with socket.create_connection((COMMAND_HOST, port), timeout=1) as sock:
+        sock.sendall((json.dumps(message) + "\n").encode('utf-8'))
+        return json.loads(sock.makefile('r', encoding='utf-8').readline())
+
+
+def test_socket_delivery_is_acked_and_completed(receiver, commands_file):
+    done = []
+    sender = CommandSender(commands_file, port=receiver.port, on_done=done.append)
+    seq, channel = sender.send("做多 止损1.1 止盈1.2", "当前价格:1.15")
+    assert channel == 'socket'
+
+    message = receiver.get(timeout=1)
+    assert message['seq'] == seq
+    assert message['command'] == "做多 止损1.1 止盈1.2"
+    assert receiver.complete(message, True) is not None
+    assert wait_for(lambda: done)
+    assert done[0]['seq'] == seq and done[0]['status'] == 'done' and done[0]['ok']
+
+
+def test_old_or_repeated_sequence_numbers_are_duplicates(receiver):
+    assert raw_send(receiver.port, {'seq': 10, 'command': "待机", 'price_info': ""})['status'] == 'received'
+    assert raw_send(receiver.port, {'seq': 10, 'command': "待机", 'price_info': ""})['status'] == 'duplicate'
+    assert raw_send(receiver.port, {'seq': 9, 'command': "做空", 'price_info': ""})['status'] == 'duplicate'
+    assert raw_send(receiver.port, {'seq': 11, 'command': "待机", 'price_info': ""})['status'] == 'received'
+    assert [receiver.get(timeout=1)['seq'] for _ in range(2)] == [10, 11]
+    assert receiver.get(timeout=0.05) is None
+
+
+def test_sender_falls_back_to_the_file(commands_file):
+    sender = CommandSender(commands_file, port=free_port())
+    seq, channel = sender.send("做空 止损1.2 止盈1.1", "当前价格:1.15")
+    assert channel == 'file'
+    with open(commands_file, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines[0] == "NEW:做空 止损1.2 止盈1.1"
+    assert f"@seq={seq}" in lines[1]
+
+
+def test_file_command_is_read_once_and_marked_done(commands_file):
+    sender = CommandSender(commands_file, port=free_port())
+    seq, _ = sender.send("做多 止损1.1 止盈1.2", "当前价格:1.15")
+
+    receiver = CommandReceiver(commands_file, lambda message: None, port=free_port())
+    receiver._read_file()
+    receiver._read_file()
+    message = receiver.get(timeout=0.1)
+    assert message['channel'] == 'file' and message['seq'] == seq
+    assert receiver.get(timeout=0.05) is None
+
+    receiver.complete(message, True)
+    with open(commands_file, encoding='utf-8') as f:
+        assert f.readline().strip() == "DONE:做多 止损1.1 止盈1.2"
+    receiver._read_file()
+    assert receiver.get(timeout=0.05) is None
+
+
+def test_same_seq_over_socket_and_file_runs_once(receiver, commands_file):
+    assert raw_send(receiver.port, {'seq': 42, 'command': "做多", 'price_info': ""})['status'] == 'received'
+    with open(commands_file, 'w', encoding='utf-8') as f:
+        f.write("NEW:做多\n当前价格:1.15@seq=42\n")
+    receiver._read_file()
+    assert receiver.get(timeout=1)['channel'] == 'socket'
+    assert receiver.get(timeout=0.05) is None
+
+
+def test_stop_releases_the_port(commands_file):
+    port = free_port()
+    for _ in range(2):
+        receiver = CommandReceiver(commands_file, lambda message: None, port=port)
+        receiver.start()
+        assert wait_for(lambda: receiver.server is not None)
+        receiver.stop()
+
+
+def test_done_does_not_overwrite_a_newer_file_command(commands_file):
+    sender = CommandSender(commands_file, port=free_port())
+    sender.send("做多 止损1.1 止盈1.2", "当前价格:1.15")
+    receiver = CommandReceiver(commands_file, lambda message: None, port=free_port())
+    receiver._read_file()
+    first = receiver.get(timeout=0.1)
+
+    newer, _ = sender.send("做空 止损1.2 止盈1.1", "当前价格:1.16")
+    receiver.complete(first, True)
+    with open(commands_file, encoding='utf-8') as f:
+        assert f.readline().strip() == "NEW:做空 止损1.2 止盈1.1"
+    receiver._read_file()
+    assert receiver.get(timeout=0.1)['seq'] == newer
+
+
+def test_write_atomic_leaves_no_temp_files(tmp_path):
+    path = str(tmp_path / 'commands.txt')
+    write_atomic(path, "NEW:做多\n")
+    write_atomic(path, "DONE:做多\n")
+    assert [p.name for p in tmp_path.iterdir()] == ['commands.txt']
+    assert (tmp_path / 'commands.txt').read_text(encoding='utf-8') == "DONE:做多\n"
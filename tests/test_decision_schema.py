@@ -0,0 +1,63 @@
+"""
+decision_schema.parse_decision validation
+"""
+
+import json
+
+import pytest
+
+from decision_schema import DecisionError, parse_decision, price_matches
+
+
+def answer(**fields):
+    data = {'direction': "做多", 'sl': 1.0945, 'tp': 1.1055, 'confidence': 0.8, 'reasons': ["金叉"]}
+    data.update(fields)
+    return json.dumps(data, ensure_ascii=False)
+
+
+def test_valid_decision():
+    decision = parse_decision(answer())
+    assert decision == {'direction': "做多", 'sl': 1.0945, 'tp': 1.1055, 'confidence': 0.8,
+                        'reasons': ["金叉"]}
+
+
+def test_standby_without_prices():
+    decision = parse_decision(answer(direction="待机", sl=None, tp=None, confidence=1, reasons=[]))
+    assert decision['direction'] == "待机" and decision['sl'] is None and decision['tp'] is None
+    assert decision['confidence'] == 1.0
+
+
+def test_reasons_are_capped_and_stringified():
+    assert parse_decision(answer(reasons=[1, "b", "c", "d"]))['reasons'] == ["1", "b", "c"]
+    assert parse_decision(answer(reasons="突破"))['reasons'] == ["突破"]
+
+
+@pytest.mark.parametrize('text', ["", "做多 止损1.09", "{\"direction\": ", None])
+def test_invalid_json(text):
+    with pytest.raises(DecisionError) as error:
+        parse_decision(text)
+    assert error.value.kind == 'invalid_json'
+
+
+@pytest.mark.parametrize('text', [
+    "[]",
+    answer(direction="平仓"),
+    answer(direction=None),
+    answer(sl="1.09"),
+    answer(tp=True),
+    answer(confidence=1.5),
+    answer(confidence=-0.1),
+    answer(confidence=True),
+    answer(confidence=None),
+])
+def test_schema_violations(text):
+    with pytest.raises(DecisionError) as error:
+        parse_decision(text)
+    assert error.value.kind == 'schema'
+
+
+def test_price_matches():
+    assert price_matches(1.0945, 1.0945)
+    assert price_matches(None, None)
+    assert not price_matches(None, 1.0945)
+    assert not price_matches(1.0946, 1.0945)
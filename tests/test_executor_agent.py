@@ -0,0 +1,75 @@
+"""
+ExecutorAgent order paths against the simulated terminal
+"""
+
+import pytest
+
+import mt5_trade
+from executor_agent import API_UNAVAILABLE, ExecutorAgent
+
+
+@pytest.fixture
+def executor(tmp_path):
+    executor = ExecutorAgent(log_file=str(tmp_path / 'executor.log'), web_url=None,
+                             commands_file=str(tmp_path / 'commands.txt'),
+                             templates_dir=str(tmp_path / 'templates'))
+    executor.messages = []
+    executor.log = executor.messages.append
+    executor.load_trading_config = lambda: None
+    executor.execution_mode = "api"
+    return executor
+
+
+def test_api_order_fills_under_the_terminal_name(executor, monkeypatch):
+    executor.trading_pair = "US30USD"  # the terminal lists it as US30
+    executor.order_symbol = "US30USD"
+    sent = []
+    send_market = mt5_trade.send_market
+
+    def recording_send(symbol, *args, **kwargs):
+        sent.append(symbol)
+        return send_market(symbol, *args, **kwargs)
+
+    monkeypatch.setattr(mt5_trade, 'send_market', recording_send)
+    assert executor.execute_api("buy", 0.5, 1.0, stop_loss_is_percent=True,
+                                take_profit_is_percent=True) is True
+    assert sent == ["US30"]
+    assert executor.order_symbol == "US30USD"
+
+
+def test_api_unavailable_falls_back_to_gui_for_an_aliased_chart_symbol(executor, monkeypatch):
+    executor.trading_pair = "US30USD"
+    monkeypatch.setattr(mt5_trade, 'send_market', lambda *args, **kwargs: (False, None, "AutoTrading disabled"))
+    monkeypatch.setattr('executor_agent.PYAUTOGUI_AVAILABLE', False)
+    assert executor.execute_command("做多 US30USD 0.01手 止损1% 止盈2%", 39000.0, 1) is False
+    assert executor.order_symbol == "US30USD"
+    assert "⚠️ API下单不可用，回退到GUI点击下单" in executor.messages
+    assert not any("GUI下单只能交易当前图表品种" in m for m in executor.messages)
+    assert "❌ PyAutoGUI未安装，无法GUI下单" in executor.messages
+
+
+def test_api_without_symbol_is_unavailable(executor):
+    executor.order_symbol = ""
+    assert executor.execute_api("sell") == API_UNAVAILABLE
+
+
+def test_gui_fill_is_matched_under_the_terminal_name_without_volume(executor, monkeypatch):
+    executor.trading_pair = "US30USD"
+    executor.execution_mode = "gui"
+    executor.mt5_connected = True
+    monkeypatch.setattr('executor_agent.PYAUTOGUI_AVAILABLE', True)
+
+    def click_buy(*args, **kwargs):
+        executor.submitted_stops = (38610.0, 39780.0)
+        return True
+
+    monkeypatch.setattr(executor, 'execute_buy', click_buy)
+    expected = []
+    monkeypatch.setattr(executor.trade_verifier, 'expect',
+                        lambda snapshot, **match: expected.append(match))
+    assert executor.execute_command("做多 US30USD 0.01手 止损1% 止盈2%", 39000.0, 1,
+                                    on_verified=lambda ok: None) is None
+    match, = expected
+    assert match['symbol'] == "US30" and match['magic'] == 0 and match['is_buy'] is True
+    assert (match['sl'], match['tp']) == (38610.0, 39780.0)
+    assert 'volume' not in match
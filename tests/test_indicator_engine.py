@@ -0,0 +1,95 @@
+"""
+IndicatorEngine seed/update/peek against the vectorized indicator kernels
+"""
+
+import pytest
+
+import indicators
+from indicator_engine import IndicatorEngine, SMA_PERIODS, EMA_PERIODS
+
+from conftest import random_walk_rates
+
+
+def expected(rates):
+    """Kernel values at the forming bar and at the last closed bar"""
+    _, highs, lows, closes = indicators.ohlc(rates)
+    series = {f"ma{p}": indicators.sma(closes, p) for p in SMA_PERIODS}
+    series.update({f"ema{p}": indicators.ema(closes, p) for p in EMA_PERIODS})
+    series["rsi"] = indicators.rsi(closes)
+    series["bb_upper"], series["bb_middle"], series["bb_lower"] = indicators.bollinger(closes)
+    series["atr"] = indicators.atr(highs, lows, closes)
+    values = {name: indicators.last_value(s) for name, s in series.items()}
+    prev = {name: indicators.last_value(s, -2) for name, s in series.items()}
+    return values, prev
+
+
+def assert_matches(engine, rates):
+    values, prev = engine.snapshot()
+    want_values, want_prev = expected(rates)
+    for name, want in want_values.items():
+        assert values[name] == pytest.approx(want, rel=1e-9, abs=1e-9), name
+    for name, got in prev.items():
+        assert got == pytest.approx(want_prev[name], rel=1e-9, abs=1e-9), name
+
+
+def test_seed_matches_kernels(rates):
+    engine = IndicatorEngine()
+    engine.seed(rates)
+    assert_matches(engine, rates)
+    assert engine.bar_count == 200
+
+
+def test_update_matches_full_recompute():
+    rates = random_walk_rates(320, seed=7)
+    engine = IndicatorEngine()
+    engine.seed(rates[:250])
+    # Short windows that start at or before the last committed bar, as the
+    # monitor loop fetches them
+    previous = 250
+    for end in (252, 260, 261, 270, 280, 281):
+        assert engine.update(rates[previous - 2:end])
+        assert_matches(engine, rates[:end])
+        previous = end
+
+
+def test_update_within_the_same_bar_only_moves_the_forming_bar(rates):
+    engine = IndicatorEngine()
+    engine.seed(rates[:250])
+    committed = engine.total_bars
+    window = rates[:250].copy()
+    window['close'][-1] += 0.001
+    window['high'][-1] = max(window['high'][-1], window['close'][-1])
+    assert engine.update(window[-2:])
+    assert engine.total_bars == committed
+    assert_matches(engine, window)
+
+
+def test_update_without_overlap_asks_for_a_reseed(rates):
+    engine = IndicatorEngine()
+    assert not engine.update(rates[-5:])
+    engine.seed(rates[:200])
+    assert not engine.update(rates[250:260])
+
+
+def test_short_seed_replays_every_bar():
+    rates = random_walk_rates(12, seed=3)
+    engine = IndicatorEngine()
+    engine.seed(rates)
+    values, prev = engine.snapshot()
+    want_values, _ = expected(rates)
+    assert values["ma5"] == pytest.approx(want_values["ma5"])
+    assert values["ma10"] == pytest.approx(want_values["ma10"])
+    assert values["ma20"] is None and prev["ma20"] is None
+    assert values["rsi"] is None
+
+
+def test_peek_does_not_commit(rates):
+    engine = IndicatorEngine()
+    engine.seed(rates)
+    before = engine.snapshot()
+    engine.smas[20].peek(99.0)
+    engine.emas[12].peek(99.0)
+    engine.rsi.peek(99.0)
+    engine.bollinger.peek(99.0)
+    engine.atr.peek(99.5, 98.5)
+    assert engine.snapshot() == before
@@ -0,0 +1,108 @@
+"""
+Vectorized indicator kernels against straightforward loop implementations
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+import indicators
+
+from conftest import random_walk_rates
+
+
+def loop_ema(values, period):
+    alpha = 2 / (period + 1)
+    out, ema = [], None
+    for value in values:
+        ema = value if ema is None else (value - ema) * alpha + ema
+        out.append(ema)
+    return out
+
+
+def loop_rsi(closes, period=14):
+    gains = [max(b - a, 0.0) for a, b in zip(closes, closes[1:])]
+    losses = [max(a - b, 0.0) for a, b in zip(closes, closes[1:])]
+    avg_gain = sum(gains[:period]) / period
+    avg_loss = sum(losses[:period]) / period
+    for gain, loss in zip(gains[period:], losses[period:]):
+        avg_gain = (avg_gain * (period - 1) + gain) / period
+        avg_loss = (avg_loss * (period - 1) + loss) / period
+    return 100.0 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+@pytest.fixture
+def closes():
+    return indicators.ohlc(random_walk_rates(400, seed=5))[3]
+
+
+def test_sma(closes):
+    out = indicators.sma(closes, 20)
+    assert np.isnan(out[:19]).all()
+    for i in (19, 200, 399):
+        assert out[i] == pytest.approx(closes[i - 19:i + 1].mean(), rel=1e-12)
+
+
+def test_ema_with_and_without_warmup(closes):
+    expected = loop_ema(closes.tolist(), 26)
+    assert indicators.ema(closes, 26, warmup=False) == pytest.approx(expected, rel=1e-10)
+    warm = indicators.ema(closes, 26)
+    assert np.isnan(warm[:25]).all()
+    assert warm[25:] == pytest.approx(expected[25:], rel=1e-10)
+
+
+def test_ema_without_scipy_matches(monkeypatch, closes):
+    monkeypatch.setattr(indicators, 'SCIPY_AVAILABLE', False)
+    long_series = np.tile(closes, 10)
+    expected = loop_ema(long_series.tolist(), 12)
+    assert indicators.ema(long_series, 12, warmup=False) == pytest.approx(expected, rel=1e-10)
+
+
+def test_rsi(closes):
+    out = indicators.rsi(closes)
+    assert np.isnan(out[:14]).all()
+    for end in (15, 100, 400):
+        assert out[end - 1] == pytest.approx(loop_rsi(closes[:end].tolist()), rel=1e-9)
+
+
+def test_rsi_without_losses_is_100():
+    assert indicators.rsi(np.arange(30, dtype=float))[-1] == 100.0
+
+
+def test_bollinger(closes):
+    upper, middle, lower = indicators.bollinger(closes, 20, 2)
+    window = closes[-20:]
+    std = math.sqrt(((window - window.mean()) ** 2).mean())
+    assert middle[-1] == pytest.approx(window.mean(), rel=1e-12)
+    assert upper[-1] == pytest.approx(window.mean() + 2 * std, rel=1e-10)
+    assert lower[-1] == pytest.approx(window.mean() - 2 * std, rel=1e-10)
+
+
+def test_atr():
+    rates = random_walk_rates(60, seed=2)
+    _, highs, lows, closes = indicators.ohlc(rates)
+    ranges = [max(h - l, abs(h - c), abs(l - c))
+              for h, l, c in zip(highs[1:], lows[1:], closes[:-1])]
+    out = indicators.atr(highs, lows, closes, 14)
+    assert np.isnan(out[:14]).all()
+    assert out[-1] == pytest.approx(sum(ranges[-14:]) / 14, rel=1e-10)
+
+
+def test_macd_signal_starts_after_the_slow_warmup(closes):
+    line, signal, hist = indicators.macd(closes)
+    assert np.isnan(line[:25]).all() and not np.isnan(line[25])
+    assert np.isnan(signal[:33]).all() and not np.isnan(signal[33])
+    assert hist[-1] == pytest.approx(line[-1] - signal[-1])
+
+
+def test_resample_to_five_minutes():
+    rates = random_walk_rates(23, start=1_700_000_100)  # starts inside a 5-minute bucket
+    bars = indicators.resample(rates, 300)
+    assert (bars['time'] % 300 == 0).all()
+    first = rates[rates['time'] < bars['time'][1]]
+    assert bars['open'][0] == first['open'][0]
+    assert bars['close'][0] == first['close'][-1]
+    assert bars['high'][0] == first['high'].max()
+    assert bars['low'][0] == first['low'].min()
+    assert bars['tick_volume'].sum() == rates['tick_volume'].sum()
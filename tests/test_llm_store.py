@@ -0,0 +1,80 @@
+"""
+LLMStore: record/replay by content address, replay_only misses, LRU eviction
+"""
+
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+import llm_store
+from llm_store import LLMStore
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Strictly increasing clock so last_used orders every write and lookup
+    ticks = itertools.count(1_700_000_000)
+    monkeypatch.setattr(llm_store, 'time', SimpleNamespace(time=lambda: float(next(ticks))))
+    store = LLMStore(str(tmp_path / 'store' / 'llm.sqlite'), mode='record')
+    yield store
+    store.close()
+
+
+def test_recorded_answer_is_replayed(store):
+    store.record("qwen", "系统", "EURUSD 1.1", "做多 止损1.09 止盈1.12", 850.0,
+                 body={'prompt_eval_count': 120, 'eval_count': 12})
+    assert store.lookup("qwen", "系统", "EURUSD 1.1") == (False, None)  # record mode never serves
+
+    store.configure('replay')
+    assert store.lookup("qwen", "系统", "EURUSD 1.1") == (True, "做多 止损1.09 止盈1.12")
+    # Model, system prompt, prompt and options are all part of the address
+    assert store.lookup("llama", "系统", "EURUSD 1.1") == (False, None)
+    assert store.lookup("qwen", "系统", "EURUSD 1.2") == (False, None)
+    assert store.lookup("qwen", "系统", "EURUSD 1.1", options={'format': 'json'}) == (False, None)
+    stats = store.stats()
+    assert stats['entries'] == 1 and stats['hits'] == 1 and stats['misses'] == 3
+
+
+def test_replay_only_miss_is_served_empty(store):
+    store.configure('replay_only')
+    assert store.lookup("qwen", "系统", "未记录") == (True, None)
+
+
+def test_store_survives_a_reopen(store):
+    store.record("qwen", "系统", "p", "待机", 100.0)
+    store.close()
+    reopened = LLMStore(store.path, mode='replay')
+    try:
+        assert reopened.lookup("qwen", "系统", "p") == (True, "待机")
+        assert reopened.total_bytes == len("待机".encode('utf-8'))
+    finally:
+        reopened.close()
+
+
+def test_least_recently_used_answers_are_evicted(store):
+    store.configure('replay', max_mb=350 / MB)
+    for name in ("a", "b", "c"):
+        store.record("qwen", "系统", name, name * 100, 100.0)
+    # Replaying "a" makes "b" the least recently used
+    assert store.lookup("qwen", "系统", "a") == (True, "a" * 100)
+    store.record("qwen", "系统", "d", "d" * 100, 100.0)
+
+    assert store.evictions == 1 and store.total_bytes == 300
+    assert store.lookup("qwen", "系统", "b") == (False, None)
+    for name in ("a", "c", "d"):
+        assert store.lookup("qwen", "系统", name)[0]
+
+
+def test_rerecording_a_key_replaces_its_size(store):
+    store.record("qwen", "系统", "p", "x" * 10, 100.0)
+    store.record("qwen", "系统", "p", "y" * 30, 100.0)
+    assert store.total_bytes == 30 and store.stats()['entries'] == 1
+
+
+def test_off_mode_stores_nothing(store):
+    store.configure('off')
+    store.record("qwen", "系统", "p", "做多", 100.0)
+    assert store.db is None and store.lookup("qwen", "系统", "p") == (False, None)
@@ -0,0 +1,70 @@
+"""
+LogPipeline: coalescing, bounded buffer, batched file writes and web shipping
+"""
+
+import pytest
+
+from log_pipeline import LogPipeline, WEB_BATCH_SIZE
+
+
+class Session:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.posts = []
+
+    def post(self, url, json, timeout):
+        if self.fail:
+            raise ConnectionError("web UI down")
+        self.posts.append(json['batch'])
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    # A long interval keeps the worker out of the way; the tests flush by hand
+    pipeline = LogPipeline(str(tmp_path / 'agent.log'), web_url="http://localhost:5000/save_log",
+                           capacity=3, flush_interval=60)
+    pipeline.session = Session()
+    return pipeline
+
+
+def test_repeats_are_coalesced_into_one_line(pipeline):
+    for _ in range(3):
+        pipeline.emit("[10:00:00] 待机", "待机")
+    pipeline.emit("[10:00:01] 做多", "做多")
+    pipeline.flush()
+    with open(pipeline.log_file, encoding='utf-8') as f:
+        assert f.read() == "[10:00:00] 待机 (重复3次)\n[10:00:01] 做多\n"
+    assert pipeline.session.posts == [[{'type': 'log', 'message': "待机 (重复3次)"},
+                                       {'type': 'log', 'message': "做多"}]]
+    assert pipeline.stats()['coalesced'] == 2 and pipeline.stats()['written'] == 2
+
+
+def test_full_buffer_drops_the_oldest_record(pipeline):
+    for i in range(5):
+        pipeline.emit(f"line {i}", f"message {i}")
+    stats = pipeline.stats()
+    assert stats['pending'] == 3 and stats['dropped'] == 2
+    pipeline.flush()
+    with open(pipeline.log_file, encoding='utf-8') as f:
+        assert f.read().splitlines() == ["line 2", "line 3", "line 4"]
+
+
+def test_web_batches_are_split_and_back_off_after_a_failure(pipeline):
+    pipeline.capacity = WEB_BATCH_SIZE * 2
+    for i in range(WEB_BATCH_SIZE + 1):
+        pipeline.emit(f"line {i}", f"message {i}")
+    pipeline.flush()
+    assert [len(batch) for batch in pipeline.session.posts] == [WEB_BATCH_SIZE, 1]
+
+    pipeline.session = Session(fail=True)
+    pipeline.emit("line", "web down")
+    pipeline.flush()
+    pipeline.session.fail = False
+    pipeline.emit("line", "still backing off")
+    pipeline.flush()
+    assert pipeline.session.posts == [] and pipeline.stats()['web_skipped'] == 2
+
+    pipeline.web_retry_at = 0  # the retry interval has passed
+    pipeline.emit("line", "back")
+    pipeline.flush()
+    assert pipeline.session.posts == [[{'type': 'log', 'message': "back"}]]
@@ -0,0 +1,80 @@
+"""
+OllamaClient against the mock Ollama server: retries, streaming, cancellation
+"""
+
+import json
+
+import pytest
+import requests
+
+import mock_ollama
+from ollama_client import OllamaClient, OLLAMA_MODEL
+
+from conftest import free_port
+
+ANSWER = "做多 止损1.09 止盈1.12\n理由: 测试"
+
+
+@pytest.fixture
+def server(tmp_path):
+    script = tmp_path / 'script.json'
+    script.write_text(json.dumps({'default': ANSWER}, ensure_ascii=False), encoding='utf-8')
+    servers = []
+
+    def start(**options):
+        options.setdefault('ttft_ms', 0)
+        options.setdefault('tokens_per_sec', 0)
+        port = free_port()
+        server, mock = mock_ollama.start_server(port=port, responder=mock_ollama.Responder(str(script)),
+                                                **options)
+        servers.append(server)
+        return OllamaClient(host=f"http://127.0.0.1:{port}", backoff_base=0), mock
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_generate_records_latency_and_prompt_eval(server):
+    client, _ = server()
+    for _ in range(2):
+        body = client.post('/api/generate', {'model': OLLAMA_MODEL, 'prompt': "EURUSD", 'stream': False}).json()
+        assert body['response'] == ANSWER
+        client.observe_eval(body)
+    stats = client.stats()
+    assert stats['latency']['/api/generate']['count'] == 2
+    assert stats['prompt_eval']['calls'] == 2 and stats['retries'] == 0
+
+
+def test_stream_lines_yields_complete_lines(server):
+    client, _ = server()
+    lines = list(client.stream_lines('/api/generate', {'model': OLLAMA_MODEL, 'prompt': "EURUSD"}))
+    assert lines == ANSWER.split("\n")
+    latency = client.stats()['latency']
+    assert latency['/api/generate first_line']['count'] == 1
+    assert latency['/api/generate stream']['count'] == 1
+    assert client.stats()['prompt_eval']['calls'] == 1
+
+
+def test_closing_the_stream_early_is_counted_as_cancelled(server):
+    client, _ = server(tokens_per_sec=200)
+    lines = client.stream_lines('/api/generate', {'model': OLLAMA_MODEL, 'prompt': "EURUSD"})
+    assert next(lines) == "做多 止损1.09 止盈1.12"
+    lines.close()
+    assert client.stats()['cancelled_streams'] == 1
+
+
+def test_busy_server_is_retried_then_returned(server):
+    client, mock = server(max_queue=0)
+    response = client.post('/api/generate', {'model': OLLAMA_MODEL, 'prompt': "EURUSD", 'stream': False})
+    assert response.status_code == 503
+    assert client.stats()['retries'] == client.max_retries
+    assert mock.stats()['rejected'] == client.max_retries + 1
+
+
+def test_unreachable_server_raises_after_retries():
+    client = OllamaClient(host=f"http://127.0.0.1:{free_port()}", backoff_base=0, connect_timeout=0.5)
+    with pytest.raises(requests.ConnectionError):
+        client.get('/api/tags')
+    assert client.stats()['errors'] == 1 and client.stats()['retries'] == client.max_retries
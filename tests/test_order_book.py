@@ -0,0 +1,68 @@
+"""
+OrderBook snapshots: side ordering, depth features, touch order-flow imbalance
+"""
+
+import pytest
+
+import mock_mt5
+from order_book import BOOK_TYPE_BUY, BOOK_TYPE_SELL, OrderBook
+
+
+def snapshot(bids, asks):
+    """BookInfo rows as the terminal returns them: asks high to low, then bids high to low"""
+    rows = [mock_mt5.BookInfo(BOOK_TYPE_SELL, price, volume, float(volume)) for price, volume in reversed(asks)]
+    rows += [mock_mt5.BookInfo(BOOK_TYPE_BUY, price, volume, float(volume)) for price, volume in bids]
+    return tuple(rows)
+
+
+@pytest.fixture
+def book(monkeypatch):
+    book = OrderBook('EURUSD', depth=3, history=4)
+    book.books = []
+    monkeypatch.setattr(mock_mt5, 'market_book_get', lambda symbol: book.books.pop(0))
+    return book
+
+
+def test_snapshot_levels_and_features(book):
+    book.books.append(snapshot(bids=[(1.1000, 30), (1.0999, 10), (1.0998, 5), (1.0997, 99)],
+                               asks=[(1.1001, 10), (1.1002, 20)]))
+    assert book.update()
+    # Depth 3: the fourth bid level is dropped, the missing ask level is zero-padded
+    assert book.levels('bid') == [(1.1, 30.0), (1.0999, 10.0), (1.0998, 5.0)]
+    assert book.levels('ask') == [(1.1001, 10.0), (1.1002, 20.0)]
+
+    features = book.features()
+    assert features['best_bid'] == 1.1 and features['best_ask'] == 1.1001
+    assert features['imbalance'][1] == pytest.approx((30 - 10) / 40)
+    # Heavier bid at the touch pulls the microprice towards the ask
+    assert features['microprice'] == pytest.approx((1.1 * 10 + 1.1001 * 30) / 40)
+    assert features['level_count'] == 5
+
+
+def test_touch_flow_and_pressure_over_the_ring(book):
+    book.books += [
+        snapshot(bids=[(1.1000, 10)], asks=[(1.1002, 10)]),
+        snapshot(bids=[(1.1000, 25)], asks=[(1.1002, 10)]),  # bid queue grows: +15
+        snapshot(bids=[(1.1001, 5)], asks=[(1.1002, 4)]),    # bid steps up: +5, ask queue shrinks: +6
+    ]
+    for _ in range(3):
+        assert book.update()
+    assert list(book.ofi[:3]) == [0.0, 15.0, 11.0]
+    pressure = book.pressure()
+    assert pressure['snapshots'] == 3 and pressure['ofi'] == 26.0
+    assert pressure['depth_delta'] == (5 - 4) - (10 - 10)
+
+
+def test_ring_wraps_and_keeps_the_latest_snapshot(book):
+    for i in range(6):
+        book.books.append(snapshot(bids=[(1.1 + i / 10000, 1)], asks=[(1.1002 + i / 10000, 1)]))
+        book.update()
+    assert book.count == 6 and book.last == 1
+    assert book.features()['best_bid'] == pytest.approx(1.1005)
+    assert book.pressure()['snapshots'] == 4
+
+
+def test_empty_book_writes_no_snapshot(book):
+    book.books.append(())
+    assert book.update() is False
+    assert book.count == 0 and book.features() is None
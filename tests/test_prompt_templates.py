@@ -0,0 +1,96 @@
+"""
+PromptCompiler: byte-identical static heads per config version, compact budget trimming
+"""
+
+from prompt_templates import PromptCompiler, estimate_tokens
+
+SETTINGS = {
+    'long_strategy': "MA10上穿MA50", 'short_strategy': "MA10下穿MA50",
+    'long_sl': 0.5, 'long_tp': 1.0, 'short_sl': 0.5, 'short_tp': 1.0,
+    'rules': "无", 'level2_enabled': True, 'token_budget': None,
+}
+
+PRICES = (1.0945, 1.1055, 1.1055, 1.0945)
+
+
+def market(price):
+    return {'price': price, 'ask': price, 'bid': round(price - 0.0001, 5), 'spread': 10}
+
+
+def indicators(price):
+    return {
+        'timeframe': "1分钟", 'candle_count': 200, 'close_price': price,
+        'ma5': price - 0.0001, 'ma10': price - 0.0002, 'ma20': price - 0.0003, 'ma50': price - 0.0004,
+        'ema12': price - 0.0001, 'ema26': price - 0.0002, 'rsi': 55.5, 'macd': 0.00012,
+        'bb_upper': price + 0.001, 'bb_middle': price, 'bb_lower': price - 0.001, 'atr': 0.0004,
+        'higher_timeframes': [{'timeframe': "5分钟", 'trend': "上涨", 'close_price': price, 'rsi': 60.0}],
+        'signal_summary': "MA10上穿MA50(金叉)",
+    }
+
+
+LEVEL2 = {
+    'available': True, 'bid_ratio': 0.62, 'imbalance': {1: 0.2, 5: 0.1},
+    'pressure': {'snapshots': 3, 'ofi': 12, 'imbalance_delta': 0.05}, 'microprice': 1.10005,
+    'bid_levels': [(1.1, 5)], 'ask_levels': [(1.1001, 3)],
+}
+
+
+def render(compiled, price, history=""):
+    return compiled.render('EURUSD', market(price), price, 5, indicators(price), LEVEL2, PRICES, history)
+
+
+def test_verbose_head_is_byte_identical_between_scans():
+    compiler = PromptCompiler()
+    first = compiler.compile(dict(SETTINGS))
+    second = compiler.compile(dict(SETTINGS))
+    assert first is second
+    assert compiler.stats() == {'versions': 1, 'compiles': 1, 'hits': 1}
+
+    a, b = render(first, 1.1), render(second, 1.1023)
+    assert a != b
+    assert a.startswith(first.head) and b.startswith(first.head)
+    assert "MA10上穿MA50" in first.head and "MA10上穿MA50" in first.system
+
+
+def test_config_change_compiles_a_new_version():
+    compiler = PromptCompiler()
+    first = compiler.compile(dict(SETTINGS))
+    changed = compiler.compile(dict(SETTINGS, rules="只在伦敦时段交易"))
+    assert changed is not first and changed.version != first.version
+    assert "只在伦敦时段交易" in changed.system
+
+
+def test_compiler_cache_is_bounded():
+    compiler = PromptCompiler(max_entries=2)
+    for sl in (0.1, 0.2, 0.3):
+        compiler.compile(dict(SETTINGS, long_sl=sl))
+    assert compiler.stats()['versions'] == 2
+
+
+def test_compact_mode_fits_the_budget_by_dropping_low_priority_lines():
+    compiler = PromptCompiler()
+    roomy = compiler.compile(dict(SETTINGS, token_budget=5000), 'compact')
+    full = render(roomy, 1.1, history="上次: 待机")
+    assert "l2:" in full and "history:" in full and "atr=" in full
+
+    used = estimate_tokens(roomy.system) + sum(estimate_tokens(line) + 1 for line in full.split("\n"))
+    tight = compiler.compile(dict(SETTINGS, token_budget=used - 1), 'compact')
+    trimmed = render(tight, 1.1, history="上次: 待机")
+    assert "history:" not in trimmed
+    assert "l2:" in trimmed
+
+    minimal = compiler.compile(dict(SETTINGS, token_budget=1), 'compact')
+    lines = render(minimal, 1.1, history="上次: 待机").split("\n")
+    # Priority-0 lines (quote, signal, price choices) are never dropped
+    assert len(lines) == 3
+    assert lines[0].startswith("EURUSD px=1.1")
+    assert lines[1].startswith("sig=")
+    assert lines[2].startswith("做多 止损1.0945 止盈1.1055")
+
+
+def test_compact_system_prompt_is_shared_between_scans():
+    compiler = PromptCompiler()
+    compiled = compiler.compile(dict(SETTINGS, token_budget=700), 'compact')
+    assert compiled.head == ""
+    assert render(compiled, 1.1) != render(compiled, 1.1023)
+    assert compiler.compile(dict(SETTINGS, token_budget=700), 'compact').system is compiled.system
@@ -0,0 +1,137 @@
+"""
+RiskEngine position management: trailing stop throttling, partial close retries, halt closes
+"""
+
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import mock_mt5
+import mt5_trade
+import risk_engine
+from risk_engine import CLOSE_RETRY_INTERVAL, PARTIAL_RETRY_INTERVAL, TRAILING_MODIFY_INTERVAL, RiskEngine
+
+INFO = SimpleNamespace(name='EURUSD', digits=5, point=0.00001, volume_min=0.01, volume_step=0.01,
+                       filling_mode=1)
+
+
+def position(ticket=1, sl=0.0, volume=1.0, is_buy=True, price_open=1.1000):
+    return mock_mt5.TradePosition(
+        ticket=ticket, time=0, time_msc=0,
+        type=mock_mt5.POSITION_TYPE_BUY if is_buy else mock_mt5.POSITION_TYPE_SELL, magic=0,
+        identifier=ticket, volume=volume, price_open=price_open, sl=sl, tp=0.0, price_current=price_open,
+        swap=0.0, profit=0.0, symbol='EURUSD', comment="")
+
+
+def tick(bid, spread=0.0001):
+    return SimpleNamespace(bid=bid, ask=round(bid + spread, 5), time_msc=0)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(risk_engine, 'time', SimpleNamespace(time=clock.time,
+                                                             perf_counter_ns=time.perf_counter_ns))
+    return clock
+
+
+@pytest.fixture
+def engine(clock):
+    agent = SimpleNamespace(messages=[], trailing_stop_activation=None, trailing_stop_distance=None,
+                            partial_close_activation=None, partial_close_percent=None)
+    agent.log = agent.messages.append
+    return RiskEngine(agent)
+
+
+def test_trailing_stop_moves_only_by_a_minimum_step(engine, clock):
+    engine.agent.trailing_stop_activation = 0.5
+    engine.agent.trailing_stop_distance = 0.2
+    assert engine._check_trailing(position(), tick(1.1040), INFO) is None  # below activation
+
+    request, _ = engine._check_trailing(position(), tick(1.1100), INFO)
+    assert request['action'] == mock_mt5.TRADE_ACTION_SLTP
+    assert request['sl'] == round(1.1100 * 0.998, 5)
+
+    # One point better is not worth a modification, even once the interval has passed
+    clock.now += TRAILING_MODIFY_INTERVAL
+    moved = position(sl=request['sl'])
+    assert engine._check_trailing(moved, tick(1.11001), INFO) is None
+    assert engine._check_trailing(moved, tick(1.1110), INFO) is not None
+
+
+def test_trailing_stop_modifies_a_ticket_at_most_once_per_interval(engine, clock):
+    engine.agent.trailing_stop_activation = 0.5
+    engine.agent.trailing_stop_distance = 0.2
+    assert engine._check_trailing(position(), tick(1.1100), INFO) is not None
+    assert engine._check_trailing(position(), tick(1.1200), INFO) is None
+    clock.now += TRAILING_MODIFY_INTERVAL
+    assert engine._check_trailing(position(), tick(1.1200), INFO) is not None
+
+
+def test_short_trailing_stop_follows_the_ask(engine):
+    engine.agent.trailing_stop_activation = 0.5
+    engine.agent.trailing_stop_distance = 0.2
+    request, _ = engine._check_trailing(position(is_buy=False), tick(1.0900), INFO)
+    assert request['sl'] == round(1.0901 * 1.002, 5)
+
+
+def test_partial_close_volume_and_minimum(engine):
+    engine.agent.partial_close_activation = 0.5
+    engine.agent.partial_close_percent = 50
+    request, _ = engine._check_partial(position(volume=0.3), tick(1.1100), INFO)
+    assert request['volume'] == 0.15 and request['type'] == mock_mt5.ORDER_TYPE_SELL
+    # Half of the minimum lot cannot be closed; the ticket is not written off for it
+    assert engine._check_partial(position(ticket=2, volume=0.01), tick(1.1100), INFO) is None
+    assert engine.partial_closed == set() and 2 not in engine.partial_attempts
+
+
+def run(engine, positions, tick_, monkeypatch, ok):
+    """One evaluate() with the given open positions and send() outcome"""
+    account = SimpleNamespace(balance=10000.0, equity=10000.0)
+    engine.day = datetime.now().date()
+    monkeypatch.setattr(engine, '_account_state', lambda: (account, positions))
+    sent = []
+    monkeypatch.setattr(mt5_trade, 'send', lambda request: sent.append(request) or (ok, None, "retcode"))
+    engine.evaluate('EURUSD', tick_, INFO)
+    return sent
+
+
+def test_failed_partial_close_is_retried_after_the_interval(engine, clock, monkeypatch):
+    engine.agent.partial_close_activation = 0.5
+    engine.agent.partial_close_percent = 50
+    open_positions = [position()]
+    assert len(run(engine, open_positions, tick(1.1100), monkeypatch, ok=False)) == 1
+    assert engine.partial_closed == set()
+    assert run(engine, open_positions, tick(1.1100), monkeypatch, ok=False) == []
+
+    clock.now += PARTIAL_RETRY_INTERVAL
+    assert len(run(engine, open_positions, tick(1.1100), monkeypatch, ok=True)) == 1
+    assert engine.partial_closed == {1}
+    clock.now += PARTIAL_RETRY_INTERVAL
+    assert run(engine, open_positions, tick(1.1100), monkeypatch, ok=True) == []
+
+    # Closed positions are forgotten
+    run(engine, [], tick(1.1100), monkeypatch, ok=True)
+    assert engine.partial_closed == set() and engine.partial_attempts == {}
+
+
+def test_halt_closes_every_position_with_a_retry_interval(engine, clock, monkeypatch):
+    engine.halt_reason = "回撤达到最大回撤"
+    open_positions = [position(1), position(2, is_buy=False)]
+    actions = engine._close_all(open_positions, tick(1.1000), INFO, engine.halt_reason)
+    assert [request['position'] for request, _ in actions] == [1, 2]
+    assert [request['volume'] for request, _ in actions] == [1.0, 1.0]
+    assert engine._close_all(open_positions, tick(1.1000), INFO, engine.halt_reason) == []
+
+    clock.now += CLOSE_RETRY_INTERVAL
+    assert len(run(engine, open_positions, tick(1.1000), monkeypatch, ok=False)) == 2
@@ -0,0 +1,87 @@
+"""
+ScanScheduler: overruns while a scan is busy, busy reset on every exit path
+"""
+
+import threading
+from types import SimpleNamespace
+
+from scheduler import ScanScheduler, SymbolState, parse_symbols
+
+from conftest import wait_for
+
+
+class Agent:
+    """Just the AutoGPTTrading surface the scheduler calls"""
+
+    def __init__(self, market_data=None):
+        self.running = True
+        self.mode = "monitor"
+        self.messages = []
+        self.dispatched = []
+        self.release = threading.Event()
+        self.market_data = market_data
+        self._scan = SimpleNamespace()
+
+    def log(self, message):
+        self.messages.append(message)
+
+    def get_mt5_market_data(self, symbol):
+        self.release.wait(2)
+        return self.market_data
+
+    def prepare_analysis(self, market_data, timeframe):
+        return {'symbol': market_data['symbol'], 'timeframe': timeframe}
+
+    def complete_analysis(self, analysis):
+        return "做多 止损1.09 止盈1.12"
+
+    def parse_command(self, response):
+        return response
+
+    def dispatch_command(self, command, symbol):
+        self.dispatched.append((symbol, command))
+
+
+def start(agent, *states):
+    scheduler = ScanScheduler(agent, list(states), data_workers=2, llm_workers=1)
+    scheduler.start()
+    return scheduler
+
+
+def test_parse_symbols_applies_defaults():
+    states = parse_symbols(["EURUSD", {'symbol': "XAUUSD", 'interval': 5, 'timeframe': 15}, {'symbol': " "}],
+                           default_interval=1, default_timeframe=1)
+    assert [(s.symbol, s.interval, s.timeframe) for s in states] == [("EURUSD", 1.0, 1), ("XAUUSD", 5.0, 15)]
+
+
+def test_due_scan_of_a_busy_symbol_counts_an_overrun():
+    agent = Agent({'symbol': "EURUSD"})
+    state = SymbolState("EURUSD", 0.01, 1)
+    scheduler = start(agent, state)
+    try:
+        # The first scan blocks in get_mt5_market_data; every later due time is an overrun
+        assert wait_for(lambda: scheduler.stats()['symbols']["EURUSD"]['overruns'] >= 3)
+        assert state.busy and state.scans == 0
+        agent.release.set()
+        assert wait_for(lambda: agent.dispatched)
+        assert agent.dispatched[0] == ("EURUSD", "做多 止损1.09 止盈1.12")
+        assert wait_for(lambda: state.scans >= 1)
+    finally:
+        agent.running = False
+        agent.release.set()
+        scheduler.thread.join(1)
+    assert not scheduler.thread.is_alive()
+
+
+def test_failed_market_data_counts_an_error_and_frees_the_symbol():
+    agent = Agent(market_data=None)
+    agent.release.set()
+    state = SymbolState("EURUSD", 10, 1)
+    scheduler = start(agent, state)
+    try:
+        assert wait_for(lambda: state.scans == 1)
+        assert state.errors == 1 and not state.busy and state.last_command is None
+        assert agent.dispatched == []
+    finally:
+        agent.running = False
+        scheduler.thread.join(1)
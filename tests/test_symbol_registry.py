@@ -0,0 +1,49 @@
+"""
+SymbolRegistry resolution and caching
+"""
+
+import mock_mt5
+from symbol_registry import SymbolRegistry, candidates
+
+
+def test_candidates_strip_the_usd_suffix():
+    assert candidates('US30USD') == ['US30USD', 'US30']
+    assert candidates('EURUSD') == ['EURUSD', 'EUR']
+    assert candidates('US30') == ['US30']
+
+
+def test_alias_resolves_once_and_is_served_from_cache():
+    registry = SymbolRegistry()
+    assert registry.resolve('US30USD') == 'US30'
+    assert registry.get('US30USD').digits == 1
+    stats = registry.stats()
+    assert stats['lookups'] == 1 and stats['hits'] == 1
+    assert stats['aliases'] == {'US30USD': 'US30'}
+
+
+def test_missing_symbols_are_cached_too():
+    messages = []
+    registry = SymbolRegistry(log=messages.append)
+    assert registry.get('NOPE') is None
+    assert registry.get('NOPE') is None
+    assert registry.stats()['lookups'] == 1 and registry.stats()['missing'] == ['NOPE']
+    assert messages == ["MT5未找到品种: NOPE"]
+
+
+def test_expired_entries_are_refetched_under_the_known_name(monkeypatch):
+    registry = SymbolRegistry(ttl=0)
+    registry.get('US30USD')
+    asked = []
+    symbol_info = mock_mt5.symbol_info
+    monkeypatch.setattr(mock_mt5, 'symbol_info', lambda name: asked.append(name) or symbol_info(name))
+    registry.get('US30USD')
+    assert asked == ['US30']
+
+
+def test_invalidate_forgets_everything():
+    registry = SymbolRegistry()
+    registry.get('EURUSD')
+    registry.invalidate()
+    assert registry.stats()['symbols'] == 0
+    registry.get('EURUSD')
+    assert registry.stats()['lookups'] == 2 and registry.stats()['invalidations'] == 1
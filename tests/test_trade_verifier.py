@@ -0,0 +1,104 @@
+"""
+TradeVerifier._match: ticket matches for API orders, strict matches for GUI orders
+"""
+
+import mock_mt5
+from trade_verifier import Expectation, TradeVerifier
+
+POINT = 0.00001
+
+
+def deal(ticket, position_id, volume=0.01, symbol='EURUSD', is_buy=True, magic=0, order=None,
+         entry=mock_mt5.DEAL_ENTRY_IN):
+    return mock_mt5.TradeDeal(
+        ticket=ticket, order=order or ticket + 1000, time=0, time_msc=0,
+        type=mock_mt5.DEAL_TYPE_BUY if is_buy else mock_mt5.DEAL_TYPE_SELL, entry=entry, magic=magic,
+        position_id=position_id, reason=0, volume=volume, price=1.1, commission=0.0, swap=0.0,
+        profit=0.0, fee=0.0, symbol=symbol, comment="")
+
+
+def position(ticket, volume=0.01, sl=0.0, tp=0.0, symbol='EURUSD', is_buy=True, magic=0):
+    return mock_mt5.TradePosition(
+        ticket=ticket, time=0, time_msc=0,
+        type=mock_mt5.POSITION_TYPE_BUY if is_buy else mock_mt5.POSITION_TYPE_SELL, magic=magic,
+        identifier=ticket, volume=volume, price_open=1.1, sl=sl, tp=tp, price_current=1.1, swap=0.0,
+        profit=0.0, symbol=symbol, comment="")
+
+
+def gui(snapshot=(set(), set()), **match):
+    """Expectation as the executor registers it after a GUI click"""
+    settings = dict(symbol='EURUSD', is_buy=True, magic=0, volume=None, sl=None, tp=None, point=POINT)
+    settings.update(match)
+    return Expectation(snapshot, settings.pop('symbol'), settings.pop('is_buy'), settings.pop('magic'),
+                       None, None, None, 30, **settings)
+
+
+def test_api_order_matches_by_ticket_only():
+    verifier = TradeVerifier(print)
+    expectation = Expectation((set(), set()), 'EURUSD', True, None, order=5002, deal=None,
+                              on_result=None, timeout=30)
+    deals = [deal(1, 1, order=5001), deal(2, 2, order=5002)]
+    assert verifier._match(expectation, deals, ()).startswith("成交#2 ")
+    assert ('deal', 2) in verifier.claimed and ('position', 2) in verifier.claimed
+
+
+def test_known_and_claimed_tickets_are_skipped():
+    verifier = TradeVerifier(print)
+    deals = [deal(1, 1), deal(2, 2)]
+    assert verifier._match(gui(({1}, {1})), deals, ()).startswith("成交#2 ")
+    assert verifier._match(gui(({1}, {1})), deals, ()) is None
+
+
+def test_known_volume_ignores_trades_of_another_size():
+    verifier = TradeVerifier(print)
+    deals = [deal(1, 1, volume=0.5), deal(2, 2, volume=0.01)]
+    assert verifier._match(gui(volume=0.01), deals, ()).startswith("成交#2 ")
+
+
+def test_gui_order_rejects_other_symbol_direction_or_magic():
+    verifier = TradeVerifier(print)
+    deals = [deal(1, 1, symbol='XAUUSD'), deal(2, 2, is_buy=False), deal(3, 3, magic=7),
+             deal(4, 4, entry=mock_mt5.DEAL_ENTRY_OUT)]
+    assert verifier._match(gui(), deals, ()) is None
+
+
+def test_gui_order_checks_sl_tp_on_the_opened_position():
+    verifier = TradeVerifier(print)
+    expectation = gui(sl=1.09, tp=1.12)
+    deals = [deal(1, 1), deal(2, 2)]
+    # The deal's position is not visible yet: wait rather than guess
+    assert verifier._match(expectation, deals, ()) is None
+    positions = [position(1, sl=1.08, tp=1.12), position(2, sl=1.09 + POINT / 2, tp=1.12)]
+    assert verifier._match(expectation, deals, positions).startswith("成交#2 ")
+
+
+def test_gui_order_matches_position_before_its_deal():
+    verifier = TradeVerifier(print)
+    expectation = gui(sl=1.09, tp=None)
+    positions = [position(7, sl=1.0895), position(8, sl=1.09)]
+    assert verifier._match(expectation, (), positions).startswith("持仓#8 ")
+
+
+def test_claims_are_pruned_once_no_snapshot_predates_them():
+    verifier = TradeVerifier(print)
+    older = gui()
+    newer = gui(({1}, {1}))
+    verifier.claimed = {('deal', 1), ('position', 1), ('deal', 2), ('position', 2)}
+    verifier.pending = [older, newer]
+    verifier._prune_claims()
+    assert verifier.claimed == {('deal', 1), ('position', 1), ('deal', 2), ('position', 2)}
+
+    verifier.pending = [newer]
+    verifier._prune_claims()
+    assert verifier.claimed == {('deal', 2), ('position', 2)}
+
+    verifier.pending = []
+    verifier._prune_claims()
+    assert verifier.claimed == set()
+
+
+def test_gui_order_without_volume_accepts_the_dialogs_lot():
+    verifier = TradeVerifier(print)
+    expectation = gui(sl=1.09, tp=None)
+    deals = [deal(1, 1, volume=0.3)]
+    assert verifier._match(expectation, deals, [position(1, volume=0.3, sl=1.09)]).startswith("成交#1 ")